@@ -0,0 +1,201 @@
+"""Archivo de facturas: segmentos comprimidos de solo-anexar más un índice por venta.
+
+En lugar de un `factura_NNNNN.txt` por venta, cada factura se comprime con zlib y se
+agrega al segmento activo (`segmento_00001.dat`, ...). `indice.tsv` guarda
+venta_id -> (segmento, offset, longitud), así reimprimir es leer un solo registro
+sin consultar la base de datos. Cada registro lleva cabecera con venta_id y CRC, por
+lo que el índice se puede reconstruir a partir de los segmentos.
+
+Importar facturas .txt existentes:
+    python -m Modulos.ArchivoFacturas importar Facturas
+"""
+from __future__ import annotations
+
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+_MAGIA = b"FAC1"
+_CABECERA = struct.Struct(">4sQII")  # magia, venta_id, crc32, longitud comprimida
+SEGMENTO_MAX_BYTES = 64 * 1024 * 1024
+_PATRON_TXT = re.compile(r"^factura_(\d+)\.txt$")
+
+
+class ArchivoFacturas:
+    """Lectura y escritura del archivo de facturas (seguro entre hilos del mismo proceso)."""
+
+    def __init__(self, carpeta: str = os.path.join("Facturas", "archivo")):
+        self.carpeta = carpeta
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._indice: Dict[int, Tuple[int, int, int]] = {}
+        self._ruta_indice = os.path.join(self.carpeta, "indice.tsv")
+        self._cargar()
+
+    # --- API ---
+    def guardar(self, venta_id: int, texto: str):
+        """Agrega la factura; si la venta ya estaba archivada, la nueva versión la reemplaza."""
+        datos = zlib.compress(texto.encode("utf-8"), 6)
+        cabecera = _CABECERA.pack(_MAGIA, int(venta_id), zlib.crc32(datos), len(datos))
+        with self._lock:
+            segmento = self._segmento_activo(len(cabecera) + len(datos))
+            ruta = self._ruta_segmento(segmento)
+            with open(ruta, "ab") as f:
+                offset = f.tell()
+                f.write(cabecera + datos)
+                f.flush()
+                os.fsync(f.fileno())
+            entrada = (segmento, offset + _CABECERA.size, len(datos))
+            self._indice[int(venta_id)] = entrada
+            self._anotar_indice(int(venta_id), entrada)
+
+    def leer(self, venta_id: int) -> Optional[str]:
+        """Texto de la factura archivada, o None si esa venta no está en el archivo."""
+        with self._lock:
+            entrada = self._indice.get(int(venta_id))
+        if entrada is None:
+            return None
+        segmento, offset, longitud = entrada
+        with open(self._ruta_segmento(segmento), "rb") as f:
+            f.seek(offset)
+            datos = f.read(longitud)
+        return zlib.decompress(datos).decode("utf-8")
+
+    def __contains__(self, venta_id) -> bool:
+        with self._lock:
+            return int(venta_id) in self._indice
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._indice)
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._indice)
+
+    def importar_txt(self, carpeta_txt: str, borrar: bool = False) -> int:
+        """Archiva los `factura_N.txt` de una carpeta que aún no estén en el archivo.
+        Retorna cuántas se importaron. Con borrar=True elimina cada .txt ya archivado."""
+        importadas = 0
+        for nombre in sorted(os.listdir(carpeta_txt)):
+            m = _PATRON_TXT.match(nombre)
+            if not m:
+                continue
+            ruta = os.path.join(carpeta_txt, nombre)
+            venta_id = int(m.group(1))
+            if venta_id not in self:
+                with open(ruta, encoding="utf-8") as f:
+                    self.guardar(venta_id, f.read())
+                importadas += 1
+            if borrar:
+                os.remove(ruta)
+        return importadas
+
+    # --- Segmentos ---
+    def _ruta_segmento(self, numero: int) -> str:
+        return os.path.join(self.carpeta, f"segmento_{numero:05d}.dat")
+
+    def _segmentos(self) -> List[int]:
+        numeros = []
+        for nombre in os.listdir(self.carpeta):
+            if nombre.startswith("segmento_") and nombre.endswith(".dat"):
+                try:
+                    numeros.append(int(nombre[len("segmento_"):-len(".dat")]))
+                except ValueError:
+                    pass
+        return sorted(numeros)
+
+    def _segmento_activo(self, bytes_nuevos: int) -> int:
+        segmentos = self._segmentos()
+        if not segmentos:
+            return 1
+        ultimo = segmentos[-1]
+        tamano = os.path.getsize(self._ruta_segmento(ultimo))
+        if tamano and tamano + bytes_nuevos > SEGMENTO_MAX_BYTES:
+            return ultimo + 1
+        return ultimo
+
+    def _recorrer(self, segmento: int, desde: int = 0):
+        """Registros válidos del segmento a partir de `desde`: (venta_id, offset_datos, longitud).
+        Se detiene en el primer registro incompleto o dañado; retorna además dónde terminó."""
+        registros = []
+        ruta = self._ruta_segmento(segmento)
+        fin_valido = desde
+        with open(ruta, "rb") as f:
+            f.seek(desde)
+            while True:
+                cabecera = f.read(_CABECERA.size)
+                if len(cabecera) < _CABECERA.size:
+                    break
+                magia, venta_id, crc, longitud = _CABECERA.unpack(cabecera)
+                if magia != _MAGIA:
+                    break
+                datos = f.read(longitud)
+                if len(datos) < longitud or zlib.crc32(datos) != crc:
+                    break
+                registros.append((venta_id, fin_valido + _CABECERA.size, longitud))
+                fin_valido += _CABECERA.size + longitud
+        return registros, fin_valido
+
+    # --- Índice ---
+    def _anotar_indice(self, venta_id: int, entrada: Tuple[int, int, int]):
+        with open(self._ruta_indice, "a", encoding="utf-8") as f:
+            f.write(f"{venta_id}\t{entrada[0]}\t{entrada[1]}\t{entrada[2]}\n")
+
+    def _cargar(self):
+        segmentos = self._segmentos()
+        if not os.path.exists(self._ruta_indice):
+            if segmentos:
+                self._reconstruir_indice(segmentos)
+            return
+        with open(self._ruta_indice, encoding="utf-8") as f:
+            for linea in f:
+                partes = linea.rstrip("\n").split("\t")
+                if len(partes) != 4:
+                    continue  # línea a medias tras un cierre inesperado
+                try:
+                    venta_id, segmento, offset, longitud = (int(p) for p in partes)
+                except ValueError:
+                    continue
+                self._indice[venta_id] = (segmento, offset, longitud)
+        if segmentos:
+            self._recuperar_cola(segmentos[-1])
+
+    def _reconstruir_indice(self, segmentos: List[int]):
+        print("Advertencia: índice de facturas ausente, reconstruyendo desde los segmentos.")
+        for segmento in segmentos:
+            registros, _ = self._recorrer(segmento)
+            for venta_id, offset, longitud in registros:
+                self._indice[venta_id] = (segmento, offset, longitud)
+        with open(self._ruta_indice, "w", encoding="utf-8") as f:
+            for venta_id, (segmento, offset, longitud) in sorted(self._indice.items()):
+                f.write(f"{venta_id}\t{segmento}\t{offset}\t{longitud}\n")
+
+    def _recuperar_cola(self, segmento: int):
+        """Indexa registros escritos tras la última línea del índice y corta restos de una escritura interrumpida."""
+        fin_indexado = max(
+            (offset + longitud for seg, offset, longitud in self._indice.values() if seg == segmento),
+            default=0,
+        )
+        registros, fin_valido = self._recorrer(segmento, fin_indexado)
+        for venta_id, offset, longitud in registros:
+            self._indice[venta_id] = (segmento, offset, longitud)
+            self._anotar_indice(venta_id, (segmento, offset, longitud))
+        ruta = self._ruta_segmento(segmento)
+        if os.path.getsize(ruta) > fin_valido:
+            print(f"Advertencia: se descartó un registro incompleto al final de {os.path.basename(ruta)}.")
+            with open(ruta, "r+b") as f:
+                f.truncate(fin_valido)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "importar":
+        archivo = ArchivoFacturas()
+        cantidad = archivo.importar_txt(sys.argv[2], borrar="--borrar" in sys.argv[3:])
+        print(f"{cantidad} factura(s) importada(s); {len(archivo)} en el archivo.")
+    else:
+        print("Uso: python -m Modulos.ArchivoFacturas importar <carpeta_txt> [--borrar]")
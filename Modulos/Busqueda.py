@@ -0,0 +1,119 @@
+"""Índice de búsqueda en memoria para listas de productos.
+
+Se construye una vez por carga del catálogo. El texto se normaliza sin acentos ni
+mayúsculas ("azucar" encuentra "Azúcar"). Los términos de 3 o más caracteres se
+resuelven con un índice de trigramas y los más cortos con prefijos de palabra;
+una consulta que extiende la anterior solo filtra los resultados previos.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_SEPARADORES = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto: Any) -> str:
+    """Minúsculas sin acentos: 'Azúcar Crema' -> 'azucar crema'."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    return "".join(c for c in texto if not unicodedata.combining(c)).casefold()
+
+
+def terminos(texto: Any) -> List[str]:
+    return [t for t in _SEPARADORES.split(normalizar(texto)) if t]
+
+
+class IndiceBusqueda:
+    """Busca elementos cuyo texto contiene todos los términos de la consulta.
+
+    - campos(elemento) -> textos a indexar (nombre, categoría, proveedor, id...).
+    - buscar() devuelve los elementos en su orden original.
+    """
+
+    def __init__(self, elementos: Sequence[Any], campos: Callable[[Any], Iterable[Any]]):
+        self.elementos = list(elementos)
+        self._textos: List[str] = []
+        self._trigramas: Dict[str, List[int]] = {}
+        palabras: List[Tuple[str, int]] = []
+        for idx, elemento in enumerate(self.elementos):
+            tokens = []
+            for campo in campos(elemento):
+                tokens.extend(terminos(campo))
+            texto = " ".join(tokens)
+            self._textos.append(texto)
+            for tri in {texto[i:i + 3] for i in range(len(texto) - 2)}:
+                self._trigramas.setdefault(tri, []).append(idx)
+            palabras.extend((t, idx) for t in set(tokens))
+        palabras.sort()
+        self._palabras = [p for p, _ in palabras]
+        self._palabras_idx = [i for _, i in palabras]
+        self._ultima: Optional[Tuple[str, List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.elementos)
+
+    def _candidatos_termino(self, termino: str) -> set:
+        if len(termino) >= 3:
+            listas = []
+            for i in range(len(termino) - 2):
+                postings = self._trigramas.get(termino[i:i + 3])
+                if not postings:
+                    return set()
+                listas.append(postings)
+            listas.sort(key=len)
+            candidatos = set(listas[0])
+            for postings in listas[1:]:
+                candidatos.intersection_update(postings)
+                if not candidatos:
+                    break
+            return candidatos
+        # Términos cortos: palabras que empiezan por el término
+        inicio = bisect.bisect_left(self._palabras, termino)
+        fin = bisect.bisect_left(self._palabras, termino + "\uffff", inicio)
+        return set(self._palabras_idx[inicio:fin])
+
+    def buscar_indices(self, consulta: str) -> List[int]:
+        clave = " ".join(terminos(consulta))
+        if not clave:
+            self._ultima = None
+            return list(range(len(self.elementos)))
+        lista_terminos = clave.split(" ")
+
+        if self._ultima and self._extiende(self._ultima[0], lista_terminos):
+            # La consulta extiende la anterior: basta con filtrar lo ya encontrado
+            previos = self._ultima[1]
+            resultado = [i for i in previos if self._coincide(i, lista_terminos)]
+        else:
+            candidatos = None
+            for termino in sorted(lista_terminos, key=len, reverse=True):
+                encontrados = self._candidatos_termino(termino)
+                candidatos = encontrados if candidatos is None else candidatos & encontrados
+                if not candidatos:
+                    break
+            resultado = sorted(i for i in (candidatos or ()) if self._coincide(i, lista_terminos))
+        self._ultima = (clave, resultado)
+        return resultado
+
+    @staticmethod
+    def _extiende(anterior: str, lista_terminos: List[str]) -> bool:
+        """True si todo resultado de la consulta nueva también lo era de la anterior."""
+        if not " ".join(lista_terminos).startswith(anterior):
+            return False
+        previos = anterior.split(" ")
+        # Un término corto (prefijo de palabra) que crece a 3+ letras pasa a buscar subcadenas
+        return not (len(previos[-1]) < 3 <= len(lista_terminos[len(previos) - 1]))
+
+    def _coincide(self, idx: int, lista_terminos: List[str]) -> bool:
+        texto = self._textos[idx]
+        for termino in lista_terminos:
+            if len(termino) >= 3:
+                if termino not in texto:
+                    return False
+            elif not any(p.startswith(termino) for p in texto.split(" ")):
+                return False
+        return True
+
+    def buscar(self, consulta: str) -> List[Any]:
+        return [self.elementos[i] for i in self.buscar_indices(consulta)]
@@ -0,0 +1,132 @@
+"""Carrito de la venta en curso.
+
+Las líneas se indexan por id de producto y los totales se mantienen acumulados, así
+agregar, modificar o quitar un producto cuesta lo mismo con 3 o con 300 líneas. Cada
+cambio se notifica a los oyentes con la línea afectada para que la interfaz
+actualice solo esa fila.
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Eventos enviados a los oyentes: oyente(evento, linea)
+LINEA_AGREGADA = "agregada"
+LINEA_MODIFICADA = "modificada"
+LINEA_ELIMINADA = "eliminada"
+CARRITO_VACIADO = "vaciado"
+
+
+class CarritoVenta:
+    """Líneas de venta por producto con subtotal e ITBIS acumulados.
+
+    Cada línea es un dict con el formato que espera `procesar_nueva_venta_gui`:
+    id, nombre, cantidad, precio_unitario (final), subtotal, itbis_item_total.
+    `clave_idempotencia` identifica el contenido actual del carrito: se envía con la venta para
+    que un doble clic o un reintento no la registre dos veces, y cambia con cada modificación
+    (sirve también para saber si el carrito sigue siendo el de la venta enviada).
+    """
+
+    def __init__(self):
+        self._lineas: Dict[int, Dict] = {}
+        self._itbis_unitario: Dict[int, float] = {}
+        self._oyentes: List[Callable[[str, Optional[Dict]], None]] = []
+        self.subtotal = 0.0  # con ITBIS, antes de descuento
+        self.itbis = 0.0
+        self.clave_idempotencia = uuid.uuid4().hex
+
+    # --- Oyentes ---
+    def suscribir(self, oyente: Callable[[str, Optional[Dict]], None]):
+        self._oyentes.append(oyente)
+
+    def _notificar(self, evento: str, linea: Optional[Dict]):
+        for oyente in list(self._oyentes):
+            try:
+                oyente(evento, linea)
+            except Exception as exc:
+                print(f"Advertencia: oyente del carrito falló: {exc}")
+
+    # --- Consultas ---
+    def __len__(self) -> int:
+        return len(self._lineas)
+
+    def __bool__(self) -> bool:
+        return bool(self._lineas)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._lineas.values())
+
+    def __contains__(self, producto_id) -> bool:
+        return producto_id in self._lineas
+
+    def linea(self, producto_id) -> Optional[Dict]:
+        return self._lineas.get(producto_id)
+
+    def cantidad(self, producto_id) -> float:
+        linea = self._lineas.get(producto_id)
+        return float(linea['cantidad']) if linea else 0.0
+
+    def lineas(self) -> List[Dict]:
+        """Copia de las líneas en orden de llegada (para enviar a la DB)."""
+        return [dict(l) for l in self._lineas.values()]
+
+    @property
+    def subtotal_sin_itbis(self) -> float:
+        return self.subtotal - self.itbis
+
+    # --- Cambios ---
+    def agregar(self, producto: Dict, cantidad: float) -> Dict:
+        """Suma `cantidad` del producto; crea la línea si no existe. Retorna la línea."""
+        pid = producto.get('id')
+        linea = self._lineas.get(pid)
+        if linea is None:
+            precio_final = float(producto.get('precio_final_venta', producto.get('precio', 0.0)))
+            precio_sin_itbis = float(producto.get('precio_venta_sin_itbis', precio_final))
+            self._itbis_unitario[pid] = precio_final - precio_sin_itbis if producto.get('aplica_itbis') else 0.0
+            linea = {
+                'id': pid,
+                'nombre': producto.get('nombre'),
+                'cantidad': 0.0,
+                'precio_unitario': precio_final,
+                'subtotal': 0.0,
+                'itbis_item_total': 0.0,
+            }
+            self._lineas[pid] = linea
+            evento = LINEA_AGREGADA
+        else:
+            evento = LINEA_MODIFICADA
+        self._fijar_cantidad(linea, linea['cantidad'] + float(cantidad))
+        self.clave_idempotencia = uuid.uuid4().hex
+        self._notificar(evento, linea)
+        return linea
+
+    def _fijar_cantidad(self, linea: Dict, cantidad: float):
+        self.subtotal -= linea['subtotal']
+        self.itbis -= linea['itbis_item_total']
+        linea['cantidad'] = cantidad
+        linea['subtotal'] = cantidad * linea['precio_unitario']
+        linea['itbis_item_total'] = cantidad * self._itbis_unitario[linea['id']]
+        self.subtotal += linea['subtotal']
+        self.itbis += linea['itbis_item_total']
+
+    def eliminar(self, producto_id) -> Optional[Dict]:
+        linea = self._lineas.pop(producto_id, None)
+        if linea is None:
+            return None
+        self._itbis_unitario.pop(producto_id, None)
+        if self._lineas:
+            self.subtotal -= linea['subtotal']
+            self.itbis -= linea['itbis_item_total']
+        else:
+            # Sin líneas: volver a cero exacto en lugar de arrastrar residuos de punto flotante
+            self.subtotal = self.itbis = 0.0
+        self.clave_idempotencia = uuid.uuid4().hex
+        self._notificar(LINEA_ELIMINADA, linea)
+        return linea
+
+    def vaciar(self):
+        self._lineas.clear()
+        self._itbis_unitario.clear()
+        self.subtotal = self.itbis = 0.0
+        self.clave_idempotencia = uuid.uuid4().hex
+        self._notificar(CARRITO_VACIADO, None)
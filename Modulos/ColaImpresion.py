@@ -0,0 +1,220 @@
+"""Cola en segundo plano para guardar, archivar e imprimir facturas.
+
+Un único hilo procesa los trabajos en orden de llegada. Cada trabajo se escribe en
+disco (`Facturas/pendientes/`) antes de encolarse y se borra al completarse, así un
+cierre inesperado no pierde facturas: al iniciar se recuperan los pendientes. Un
+trabajo que falla (impresora apagada, spool lento, disco lleno) se reintenta con
+espera creciente sin bloquear a los demás.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+TRABAJO_GUARDAR = "guardar"
+TRABAJO_IMPRIMIR = "imprimir"
+TRABAJO_ARCHIVAR = "archivar"
+
+ESPERA_REINTENTO_BASE = 2.0
+ESPERA_REINTENTO_MAX = 60.0
+TIMEOUT_IMPRESION = 60  # segundos que se espera a lpr/lp
+
+
+def _escribir_atomico(ruta: str, texto: str):
+    """Escribe en un temporal y lo renombra: nunca queda un archivo a medias."""
+    carpeta = os.path.dirname(ruta)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(tmp, ruta)
+
+
+def imprimir_archivo(ruta: str):
+    """Envía un archivo de texto a la impresora del sistema.
+    - En Linux/Mac usa lpr/lp si están disponibles.
+    - En Windows intenta os.startfile(..., 'print').
+    """
+    if platform.system().lower() == 'windows':
+        try:
+            os.startfile(ruta, 'print')  # type: ignore[attr-defined]
+        except Exception as e:
+            raise RuntimeError(f"No se pudo enviar a impresión en Windows: {e}")
+        return
+    if shutil.which('lpr'):
+        cmd = ['lpr', ruta]
+    elif shutil.which('lp'):
+        cmd = ['lp', ruta]
+    else:
+        raise RuntimeError("No se encontró comando de impresión (lpr/lp)")
+    subprocess.run(cmd, check=True, timeout=TIMEOUT_IMPRESION)
+
+
+class ColaImpresion:
+    """Cola persistente de trabajos 'guardar' (texto -> archivo), 'archivar'
+    (texto -> `ArchivoFacturas`) e 'imprimir'.
+
+    Los métodos públicos son seguros entre hilos; `estado()` se puede consultar
+    desde el hilo de Tk para mostrar el progreso.
+    """
+
+    def __init__(self, carpeta_pendientes: str = os.path.join("Facturas", "pendientes"), archivo=None):
+        self.carpeta = carpeta_pendientes
+        self.archivo = archivo
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._cond = threading.Condition()
+        self._trabajos: List[Dict] = []
+        self._secuencia = itertools.count(int(time.time() * 1000))
+        self._ultimo_error: Optional[str] = None
+        self._completados = 0
+        self._detenido = False
+        self._recuperar_pendientes()
+        self._hilo = threading.Thread(target=self._procesar, name="cola-impresion", daemon=True)
+        self._hilo.start()
+
+    # --- Encolar ---
+    def guardar(self, texto: str, destino: str) -> str:
+        """Encola escribir `texto` en `destino`. Retorna el id del trabajo."""
+        return self._encolar({"tipo": TRABAJO_GUARDAR, "texto": texto, "destino": destino})
+
+    def archivar(self, venta_id: int, texto: str) -> str:
+        """Encola agregar la factura de la venta al archivo comprimido."""
+        return self._encolar({"tipo": TRABAJO_ARCHIVAR, "texto": texto, "venta_id": int(venta_id)})
+
+    def imprimir(self, texto: str) -> str:
+        return self._encolar({"tipo": TRABAJO_IMPRIMIR, "texto": texto})
+
+    def _encolar(self, trabajo: Dict) -> str:
+        trabajo.update({
+            "id": f"{next(self._secuencia)}_{uuid.uuid4().hex[:8]}",
+            "intentos": 0,
+            "proximo_intento": 0.0,
+        })
+        # Primero al disco: si la app se cierra ahora, el trabajo se recupera al iniciar
+        _escribir_atomico(self._ruta_trabajo(trabajo), json.dumps(trabajo, ensure_ascii=False))
+        with self._cond:
+            self._trabajos.append(trabajo)
+            self._cond.notify()
+        return trabajo["id"]
+
+    # --- Estado ---
+    def estado(self) -> Dict:
+        """{'pendientes': n, 'reintentando': n, 'completados': n, 'ultimo_error': str | None}"""
+        with self._cond:
+            return {
+                "pendientes": len(self._trabajos),
+                "reintentando": sum(1 for t in self._trabajos if t["intentos"]),
+                "completados": self._completados,
+                "ultimo_error": self._ultimo_error,
+            }
+
+    def detener(self):
+        """Detiene el hilo; los trabajos sin terminar quedan en disco para la próxima vez."""
+        with self._cond:
+            self._detenido = True
+            self._cond.notify()
+
+    # --- Persistencia ---
+    def _ruta_trabajo(self, trabajo: Dict) -> str:
+        return os.path.join(self.carpeta, f"{trabajo['id']}.json")
+
+    def _recuperar_pendientes(self):
+        for nombre in sorted(os.listdir(self.carpeta)):
+            ruta = os.path.join(self.carpeta, nombre)
+            if nombre.endswith((".tmp", ".txt")):
+                # Escritura interrumpida o copia ya impresa: no son trabajos
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+                continue
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                with open(ruta, encoding="utf-8") as f:
+                    trabajo = json.load(f)
+                trabajo["proximo_intento"] = 0.0
+                self._trabajos.append(trabajo)
+            except (OSError, ValueError) as e:
+                print(f"Advertencia: trabajo de impresión ilegible {nombre}: {e}")
+        if self._trabajos:
+            print(f"Cola de impresión: {len(self._trabajos)} trabajo(s) pendiente(s) recuperado(s).")
+
+    # --- Hilo de trabajo ---
+    def _siguiente(self) -> Optional[Dict]:
+        """Primer trabajo listo para intentarse; espera si no hay ninguno (con el lock tomado)."""
+        while not self._detenido:
+            ahora = time.monotonic()
+            listos = [t for t in self._trabajos if t["proximo_intento"] <= ahora]
+            if listos:
+                return listos[0]
+            espera = min((t["proximo_intento"] for t in self._trabajos), default=None)
+            self._cond.wait(None if espera is None else max(0.05, espera - ahora))
+        return None
+
+    def _procesar(self):
+        while True:
+            with self._cond:
+                trabajo = self._siguiente()
+            if trabajo is None:
+                return
+            try:
+                self._ejecutar(trabajo)
+            except Exception as e:
+                self._reprogramar(trabajo, e)
+                continue
+            try:
+                os.remove(self._ruta_trabajo(trabajo))
+            except OSError:
+                pass
+            with self._cond:
+                self._trabajos.remove(trabajo)
+                self._completados += 1
+                if not any(t["intentos"] for t in self._trabajos):
+                    self._ultimo_error = None
+
+    def _ejecutar(self, trabajo: Dict):
+        if trabajo["tipo"] == TRABAJO_GUARDAR:
+            _escribir_atomico(trabajo["destino"], trabajo["texto"])
+        elif trabajo["tipo"] == TRABAJO_ARCHIVAR:
+            if self.archivo is None:
+                raise RuntimeError("No hay archivo de facturas configurado")
+            self.archivo.guardar(trabajo["venta_id"], trabajo["texto"])
+        elif trabajo["tipo"] == TRABAJO_IMPRIMIR:
+            # Se imprime una copia .txt junto al trabajo (sin carpeta temporal por impresión)
+            ruta = os.path.join(self.carpeta, f"{trabajo['id']}.txt")
+            _escribir_atomico(ruta, trabajo["texto"])
+            try:
+                imprimir_archivo(ruta)
+            finally:
+                if platform.system().lower() != 'windows':
+                    # En Windows startfile lee el archivo después de retornar
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        pass
+        else:
+            raise ValueError(f"Tipo de trabajo desconocido: {trabajo['tipo']}")
+
+    def _reprogramar(self, trabajo: Dict, error: Exception):
+        with self._cond:
+            trabajo["intentos"] += 1
+            espera = min(ESPERA_REINTENTO_MAX, ESPERA_REINTENTO_BASE * (2 ** (trabajo["intentos"] - 1)))
+            trabajo["proximo_intento"] = time.monotonic() + espera
+            self._ultimo_error = f"{trabajo['tipo']}: {error}"
+        print(f"Advertencia: trabajo de {trabajo['tipo']} falló (intento {trabajo['intentos']}), reintento en {espera:.0f}s: {error}")
+        try:
+            # Guardar el conteo de intentos para que sobreviva a un reinicio
+            datos = {k: v for k, v in trabajo.items() if k != "proximo_intento"}
+            _escribir_atomico(self._ruta_trabajo(trabajo), json.dumps(datos, ensure_ascii=False))
+        except OSError:
+            pass
@@ -0,0 +1,325 @@
+"""Motor SQLite embebido para `Modulos.DBUtil` (DB_BACKEND=sqlite).
+
+Pensado para una sola caja sin servidor y para correr la capa `Repo` completa en
+memoria (`DB_SQLITE_PATH=:memory:`). El esquema se toma de `db/sistemaPy.sql`: el
+volcado de MariaDB se traduce a DDL de SQLite (tipos, AUTO_INCREMENT, índices y
+`ON UPDATE current_timestamp` como triggers), así hay una sola definición de tablas.
+
+Las consultas de `Repo` se escriben para MariaDB; aquí se adaptan al ejecutarlas:
+`%s` -> `?`, `%%` -> `%`, `CURDATE()` -> fecha local y se quita `FOR UPDATE` (todas
+las operaciones pasan por una única conexión compartida, protegida con un lock, así
+que las transacciones ya son serializables). Las filas se devuelven como dicts y las
+columnas DATETIME/TIMESTAMP/DATE como `datetime`/`date`, igual que con PyMySQL.
+"""
+from __future__ import annotations
+
+import datetime
+import decimal
+import functools
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+_RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+ESQUEMA_PREDETERMINADO = os.path.join(_RAIZ, "db", "sistemaPy.sql")
+RUTA_PREDETERMINADA = os.path.join("db", "sistemaPy.sqlite3")
+
+_AHORA = "(datetime('now','localtime'))"
+_AHORA_FRACCION = "(strftime('%Y-%m-%d %H:%M:%f','now','localtime'))"
+
+
+# --------------------- Tipos ---------------------
+
+def _fecha_hora_desde_sqlite(valor: bytes):
+    texto = valor.decode()
+    try:
+        return datetime.datetime.fromisoformat(texto)
+    except ValueError:
+        return texto
+
+
+def _fecha_desde_sqlite(valor: bytes):
+    texto = valor.decode()
+    try:
+        return datetime.date.fromisoformat(texto[:10])
+    except ValueError:
+        return texto
+
+
+sqlite3.register_adapter(datetime.datetime, lambda v: v.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda v: v.isoformat())
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter("DATETIME", _fecha_hora_desde_sqlite)
+sqlite3.register_converter("TIMESTAMP", _fecha_hora_desde_sqlite)
+sqlite3.register_converter("DATE", _fecha_desde_sqlite)
+
+
+# --------------------- Esquema ---------------------
+
+_RE_COLUMNA = re.compile(r"^`(\w+)`\s+(\w+)(?:\(([^)]*)\))?(?:\s+unsigned)?\s*(.*)$", re.IGNORECASE)
+_RE_INDICE = re.compile(r"^(UNIQUE\s+)?KEY\s+`(\w+)`\s+\((.*)\)$", re.IGNORECASE)
+_RE_ON_UPDATE = re.compile(r"\s*ON UPDATE current_timestamp(?:\(\d*\))?", re.IGNORECASE)
+_RE_AHORA = re.compile(r"current_timestamp(?:\((\d*)\))?", re.IGNORECASE)
+
+_TIPOS = {
+    "tinyint": "INTEGER", "smallint": "INTEGER", "mediumint": "INTEGER", "int": "INTEGER", "bigint": "INTEGER",
+    "decimal": "NUMERIC", "numeric": "NUMERIC", "float": "REAL", "double": "REAL",
+    "datetime": "DATETIME", "timestamp": "TIMESTAMP", "date": "DATE",
+}
+
+
+def _sentencias(volcado: str) -> List[str]:
+    """Sentencias del volcado sin comentarios `--` ni directivas `/*!...*/`."""
+    lineas = []
+    for linea in volcado.splitlines():
+        limpia = linea.strip()
+        if not limpia or limpia.startswith("--") or limpia.startswith("/*!"):
+            continue
+        lineas.append(limpia)
+    return [s.strip() for s in "\n".join(lineas).split(";") if s.strip()]
+
+
+def _traducir_columna(tabla: str, m: re.Match, disparadores: List[str]) -> tuple:
+    nombre, tipo, args, resto = m.group(1), m.group(2).lower(), m.group(3), m.group(4)
+    if "AUTO_INCREMENT" in resto.upper():
+        return f'"{nombre}" INTEGER PRIMARY KEY AUTOINCREMENT', nombre
+    if _RE_ON_UPDATE.search(resto):
+        resto = _RE_ON_UPDATE.sub("", resto)
+        disparadores.append(
+            f'CREATE TRIGGER IF NOT EXISTS "trg_{tabla}_{nombre}" AFTER UPDATE ON "{tabla}" '
+            f'FOR EACH ROW WHEN NEW."{nombre}" IS OLD."{nombre}" BEGIN '
+            f'UPDATE "{tabla}" SET "{nombre}" = {_AHORA_FRACCION} WHERE rowid = NEW.rowid; END'
+        )
+    resto = _RE_AHORA.sub(lambda a: _AHORA_FRACCION if a.group(1) not in (None, "", "0") else _AHORA, resto)
+    definicion = f'"{nombre}" {_TIPOS.get(tipo, "TEXT")} {resto}'.rstrip()
+    if tipo == "enum":
+        definicion += f' CHECK ("{nombre}" IN ({args}))'
+    return definicion, None
+
+
+def _traducir_tabla(sentencia: str) -> List[str]:
+    lineas = sentencia.splitlines()
+    tabla = re.search(r"`(\w+)`", lineas[0]).group(1)
+    columnas, restricciones, extra, disparadores = [], [], [], []
+    autoincremental = None
+    for linea in lineas[1:]:
+        linea = linea.rstrip(",")
+        if linea.startswith(")"):
+            break
+        m = _RE_COLUMNA.match(linea)
+        if m:
+            definicion, auto = _traducir_columna(tabla, m, disparadores)
+            columnas.append(definicion)
+            autoincremental = autoincremental or auto
+            continue
+        m = _RE_INDICE.match(linea)
+        if m:
+            unico = "UNIQUE " if m.group(1) else ""
+            extra.append(f'CREATE {unico}INDEX IF NOT EXISTS "{m.group(2)}" ON "{tabla}" ({m.group(3).replace("`", chr(34))})')
+            continue
+        if linea.upper().startswith("PRIMARY KEY") and autoincremental and f"`{autoincremental}`" in linea:
+            continue  # ya declarada en la columna INTEGER PRIMARY KEY
+        restricciones.append(linea.replace("`", '"'))
+    cuerpo = ",\n  ".join(columnas + restricciones)
+    return [f'CREATE TABLE IF NOT EXISTS "{tabla}" (\n  {cuerpo}\n)'] + extra + disparadores
+
+
+def traducir_esquema(volcado: str) -> str:
+    """Convierte el volcado de MariaDB (`db/sistemaPy.sql`) en un script para SQLite."""
+    salida = []
+    for sentencia in _sentencias(volcado):
+        if sentencia.upper().startswith("CREATE TABLE"):
+            salida.extend(_traducir_tabla(sentencia))
+    return ";\n".join(salida) + ";\n"
+
+
+@functools.lru_cache(maxsize=4)
+def _script_esquema(ruta: str, modificado: float) -> str:
+    with open(ruta, encoding="utf-8") as f:
+        return traducir_esquema(f.read())
+
+
+# --------------------- Consultas ---------------------
+
+_RE_MARCADOR = re.compile(r"%[s%]")
+_RE_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE)
+_RE_CURDATE = re.compile(r"\bCURDATE\(\)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def traducir_sql(sql: str) -> str:
+    """Adapta una consulta escrita para PyMySQL (paramstyle `format`) a SQLite (`qmark`)."""
+    sql = _RE_FOR_UPDATE.sub("", sql)
+    sql = _RE_CURDATE.sub("date('now','localtime')", sql)
+    return _RE_MARCADOR.sub(lambda m: "?" if m.group(0) == "%s" else "%", sql)
+
+
+def _fila_dict(cur: sqlite3.Cursor, fila: tuple) -> Dict:
+    return {d[0]: v for d, v in zip(cur.description, fila)}
+
+
+class _CursorSQLite:
+    """Cursor con la interfaz que usa `Repo` de un DictCursor de PyMySQL."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._cur = conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _iniciar(self):
+        # Modo autocommit de sqlite3: la transacción se abre explícitamente, así los
+        # SAVEPOINT quedan anidados en ella y solo commit()/rollback() la cierran.
+        if not self._conn.in_transaction:
+            self._cur.execute("BEGIN")
+
+    def execute(self, sql: str, params=None) -> int:
+        self._iniciar()
+        self._cur.execute(traducir_sql(sql), tuple(params or ()))
+        return self._cur.rowcount
+
+    def executemany(self, sql: str, filas) -> int:
+        self._iniciar()
+        self._cur.executemany(traducir_sql(sql), [tuple(f) for f in filas])
+        return self._cur.rowcount
+
+    def fetchone(self) -> Optional[Dict]:
+        return self._cur.fetchone()
+
+    def fetchall(self) -> List[Dict]:
+        return self._cur.fetchall()
+
+    def fetchmany(self, tamano: int = 1) -> List[Dict]:
+        return self._cur.fetchmany(tamano)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+
+class ConexionSQLite:
+    """Conexión SQLite con la interfaz de una conexión PyMySQL (cursor, commit, rollback, ping)."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self) -> _CursorSQLite:
+        return _CursorSQLite(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect: bool = False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+
+# --------------------- Pool ---------------------
+
+class _PoolSQLite:
+    """Una sola conexión compartida, prestada a un hilo a la vez.
+
+    SQLite permite un único escritor; serializar en el proceso evita `database is
+    locked` y hace innecesario `FOR UPDATE`. Un préstamo anidado en el mismo hilo
+    recibe la misma conexión (y comparte su transacción); solo el préstamo externo
+    hace rollback de lo no confirmado al devolverla.
+    """
+
+    def __init__(self, conectar, timeout: float):
+        self._conectar = conectar
+        self.timeout = float(timeout)
+        self._conn: Optional[ConexionSQLite] = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def acquire(self) -> ConexionSQLite:
+        if not self._lock.acquire(timeout=self.timeout):
+            raise RuntimeError("Tiempo de espera agotado obteniendo la conexión SQLite (DB_POOL_TIMEOUT).")
+        try:
+            if self._conn is None:
+                self._conn = self._conectar()
+        except Exception:
+            self._lock.release()
+            raise
+        self._local.nivel = getattr(self._local, "nivel", 0) + 1
+        return self._conn
+
+    def release(self, conn, broken: bool = False):
+        self._local.nivel -= 1
+        try:
+            if self._local.nivel == 0:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+        finally:
+            self._lock.release()
+
+    def close_all(self):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+
+
+# --------------------- Backend ---------------------
+
+class BackendSQLite:
+    """Motor SQLite: archivo local (o `:memory:`) con el esquema de `db/sistemaPy.sql`."""
+
+    nombre = "sqlite"
+
+    def __init__(self, ruta: Optional[str] = None, esquema: Optional[str] = None):
+        self.ruta = ruta or os.environ.get("DB_SQLITE_PATH") or RUTA_PREDETERMINADA
+        self.esquema = esquema or ESQUEMA_PREDETERMINADO
+
+    def conectar(self) -> ConexionSQLite:
+        if self.ruta != ":memory:":
+            carpeta = os.path.dirname(os.path.abspath(self.ruta))
+            os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(
+            self.ruta, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+            check_same_thread=False, timeout=float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        )
+        conn.row_factory = _fila_dict
+        conn.execute("PRAGMA foreign_keys=ON")
+        if self.ruta != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(_script_esquema(self.esquema, os.path.getmtime(self.esquema)))
+        return ConexionSQLite(conn)
+
+    def crear_pool(self, max_size: int, max_idle: float, timeout: float) -> _PoolSQLite:
+        return _PoolSQLite(self.conectar, timeout)
+
+    def clausula_upsert(self, clave: Sequence[str], reemplazar: Sequence[str], sumar: Sequence[str]) -> str:
+        asignaciones = [f"{c}=excluded.{c}" for c in reemplazar] + [f"{c} = {c} + excluded.{c}" for c in sumar]
+        return f"ON CONFLICT ({', '.join(clave)}) DO UPDATE SET " + ", ".join(asignaciones)
+
+    def descripcion(self) -> str:
+        return f"SQLite {sqlite3.sqlite_version} ({self.ruta})"
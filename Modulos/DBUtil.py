@@ -1,4 +1,10 @@
+import atexit
+import functools
 import os
+import random
+import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 
 try:
@@ -59,6 +65,7 @@ def _get_db_params():
     - DB_USER (default: junior)
     - DB_PASS (default: "Junior0719")
     - DB_NAME (default: sistemaPy)
+    - DB_CONNECT_TIMEOUT (default: 5): segundos para detectar que el servidor no responde
     """
     return {
         'host': os.environ.get('DB_HOST', 'localhost'),
@@ -69,6 +76,7 @@ def _get_db_params():
         'charset': 'utf8mb4',
         'cursorclass': DictCursor,
         'autocommit': False,
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
     }
 
 
@@ -79,7 +87,11 @@ def _check_driver():
         )
 
 
-def get_connection():
+class DBConnectionError(RuntimeError):
+    """No se pudo conectar con el servidor de base de datos (caído, red, credenciales)."""
+
+
+def _conectar_mariadb():
     """Crea y retorna una conexión nueva a MariaDB/MySQL."""
     _check_driver()
     params = _get_db_params()
@@ -87,42 +99,380 @@ def get_connection():
         return pymysql.connect(**params)
     except Exception as e:
         # Re-lanzar con contexto para facilitar diagnóstico (usuario/host/db)
-        raise RuntimeError(
+        raise DBConnectionError(
             f"Error conectando a DB: {e} | user={params.get('user')} host={params.get('host')} "
             f"db={params.get('database')} (configure con DB_HOST/DB_PORT/DB_USER/DB_PASS/DB_NAME o .env)"
         ) from e
 
 
-@contextmanager
-def transaction():
-    """Contexto de transacción: hace commit si todo va bien, rollback si no."""
-    conn = get_connection()
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
+class _BackendMariaDB:
+    """Motor por defecto: servidor MariaDB/MySQL vía PyMySQL con pool de conexiones."""
+
+    nombre = "mariadb"
+
+    def conectar(self):
+        return _conectar_mariadb()
+
+    def crear_pool(self, max_size: int, max_idle: float, timeout: float):
+        return _ConnectionPool(max_size, max_idle, timeout)
+
+    def clausula_upsert(self, clave, reemplazar, sumar) -> str:
+        asignaciones = [f"{c}=VALUES({c})" for c in reemplazar] + [f"{c} = {c} + VALUES({c})" for c in sumar]
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(asignaciones)
+
+    def descripcion(self) -> str:
+        params = _get_db_params()
+        return f"MariaDB {params['user']}@{params['host']}:{params['port']}/{params['database']}"
+
+
+_BACKENDS = ('mariadb', 'mysql', 'sqlite')
+_backend = None
+
+
+def _crear_backend(nombre: str, **opciones):
+    nombre = (nombre or 'mariadb').strip().lower()
+    if nombre in ('mariadb', 'mysql'):
+        return _BackendMariaDB()
+    if nombre == 'sqlite':
+        from Modulos.DBSqlite import BackendSQLite
+        return BackendSQLite(**opciones)
+    raise ValueError(f"DB_BACKEND no soportado: {nombre!r} (use {', '.join(_BACKENDS)})")
+
+
+def get_backend():
+    """Motor de base de datos activo, elegido con DB_BACKEND (mariadb | sqlite; default mariadb).
+
+    Con `sqlite`, DB_SQLITE_PATH indica el archivo (default db/sistemaPy.sqlite3; `:memory:`
+    para una base en memoria) y el esquema se carga de db/sistemaPy.sql.
+    """
+    global _backend
+    if _backend is None:
+        with _pool_lock:
+            if _backend is None:
+                _backend = _crear_backend(os.environ.get('DB_BACKEND', 'mariadb'))
+    return _backend
+
+
+def configurar_backend(nombre: str, **opciones):
+    """Cambia el motor activo y cierra el pool anterior (p. ej. SQLite en memoria para
+    pruebas: ``configurar_backend('sqlite', ruta=':memory:')``)."""
+    global _backend, _pool
+    nuevo = _crear_backend(nombre, **opciones)
+    with _pool_lock:
+        anterior, _pool, _backend = _pool, None, nuevo
+    if anterior is not None:
+        anterior.close_all()
+    return nuevo
+
+
+def get_connection():
+    """Crea y retorna una conexión nueva con el motor activo (fuera del pool)."""
+    return get_backend().conectar()
+
+
+def sql_upsert(tabla: str, columnas, clave, reemplazar=(), sumar=(), select: str = None) -> str:
+    """INSERT que actualiza la fila existente si `clave` ya está, en el dialecto del motor activo.
+
+    - `reemplazar`: columnas que toman el valor nuevo.
+    - `sumar`: columnas a las que se suma el valor nuevo (acumuladores).
+    - `select`: usa ``INSERT ... SELECT`` en lugar de ``VALUES (%s, ...)``.
+    """
+    sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) "
+    if select is None:
+        sql += f"VALUES ({','.join(['%s'] * len(columnas))}) "
+    else:
+        # SQLite exige WHERE en un INSERT ... SELECT con cláusula de conflicto
+        sql += select + ("" if " WHERE " in select.upper() else " WHERE 1=1") + " "
+    return sql + get_backend().clausula_upsert(tuple(clave), tuple(reemplazar), tuple(sumar))
+
+
+class _ConnectionPool:
+    """Pool acotado y thread-safe de conexiones PyMySQL.
+
+    - Reutiliza conexiones ociosas (LIFO) para evitar el handshake TCP + auth por consulta.
+    - Hace ping al entregar una conexión; si falla, la descarta y abre otra.
+    - Cierra conexiones que superan el tiempo máximo ocioso.
+    - Nunca hay más de ``max_size`` conexiones abiertas a la vez.
+    """
+
+    def __init__(self, max_size: int, max_idle: float, timeout: float):
+        self.max_size = max(1, int(max_size))
+        self.max_idle = float(max_idle)
+        self.timeout = float(timeout)
+        self._idle = []  # lista de (conexion, instante_ultimo_uso)
+        self._abiertas = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def _descartar(self, conn):
         try:
-            conn.rollback()
+            conn.close()
         except Exception:
             pass
+
+    def _esta_viva(self, conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        limite = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, ultimo_uso = self._idle.pop()
+                        break
+                    if self._abiertas < self.max_size:
+                        self._abiertas += 1
+                        conn, ultimo_uso = None, None
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise RuntimeError(
+                            f"Tiempo de espera agotado obteniendo conexión del pool (DB_POOL_SIZE={self.max_size})."
+                        )
+                    self._cond.wait(restante)
+            if conn is None:
+                try:
+                    return _conectar_mariadb()
+                except Exception:
+                    self._liberar_cupo()
+                    raise
+            # Fuera del lock: expiración por inactividad y health check
+            if time.monotonic() - ultimo_uso > self.max_idle or not self._esta_viva(conn):
+                self._descartar(conn)
+                try:
+                    return _conectar_mariadb()
+                except Exception:
+                    self._liberar_cupo()
+                    raise
+            return conn
+
+    def release(self, conn, broken: bool = False):
+        if not broken:
+            # Cerrar cualquier transacción/snapshot abierto para que el próximo uso vea datos frescos
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._descartar(conn)
+            self._liberar_cupo()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _liberar_cupo(self):
+        with self._cond:
+            self._abiertas = max(0, self._abiertas - 1)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            ociosas, self._idle = self._idle, []
+            self._abiertas = max(0, self._abiertas - len(ociosas))
+            self._cond.notify_all()
+        for conn, _ in ociosas:
+            self._descartar(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool_params():
+    """Parámetros del pool desde variables de entorno.
+
+    - DB_POOL_SIZE (default: 5): máximo de conexiones abiertas.
+    - DB_POOL_MAX_IDLE (default: 300): segundos que una conexión puede estar ociosa antes de cerrarse.
+    - DB_POOL_TIMEOUT (default: 10): segundos a esperar por una conexión libre.
+    """
+    return {
+        'max_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    }
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        backend = get_backend()
+        with _pool_lock:
+            if _pool is None:
+                _pool = backend.crear_pool(**_get_pool_params())
+    return _pool
+
+
+def close_pool():
+    """Cierra todas las conexiones ociosas del pool (p. ej. al salir de la app)."""
+    if _pool is not None:
+        _pool.close_all()
+
+
+atexit.register(close_pool)
+
+
+@contextmanager
+def pooled_connection():
+    """Presta una conexión del pool y la devuelve al terminar (sin cerrarla)."""
+    pool = get_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = pymysql is not None and isinstance(e, pymysql.err.OperationalError)
         raise
     finally:
+        pool.release(conn, broken=broken)
+
+
+@contextmanager
+def transaction():
+    """Contexto de transacción: hace commit si todo va bien, rollback si no."""
+    with pooled_connection() as conn:
         try:
-            conn.close()
+            yield conn
+            conn.commit()
         except Exception:
-            pass
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+
+
+# Códigos InnoDB que justifican repetir la transacción completa:
+# 1213 = deadlock detectado, 1205 = lock wait timeout.
+_CODIGOS_REINTENTABLES = (1213, 1205)
+_retry_stats = {'reintentos': 0, 'agotados': 0, 'exitos_tras_reintento': 0, 'por_codigo': {}}
+_retry_stats_lock = threading.Lock()
+
+
+def _get_retry_params():
+    """Parámetros de reintento desde variables de entorno.
+
+    - DB_TX_RETRIES (default: 3): reintentos máximos tras el primer intento.
+    - DB_TX_BACKOFF (default: 0.05): espera base en segundos (crece x2 por intento, con jitter).
+    - DB_TX_BACKOFF_MAX (default: 1.0): tope de espera por intento en segundos.
+    """
+    return {
+        'max_reintentos': int(os.environ.get('DB_TX_RETRIES', '3')),
+        'espera_base': float(os.environ.get('DB_TX_BACKOFF', '0.05')),
+        'espera_max': float(os.environ.get('DB_TX_BACKOFF_MAX', '1.0')),
+    }
+
+
+def _codigo_error_reintentable(exc):
+    """Retorna el código MySQL si la excepción es un deadlock/lock timeout (o
+    'SQLITE_BUSY' si otro proceso tiene bloqueado el archivo SQLite), si no None."""
+    if isinstance(exc, sqlite3.OperationalError):
+        mensaje = str(exc).lower()
+        return 'SQLITE_BUSY' if 'locked' in mensaje or 'busy' in mensaje else None
+    if pymysql is None or not isinstance(exc, pymysql.err.MySQLError):
+        return None
+    args = getattr(exc, 'args', ())
+    codigo = args[0] if args else None
+    return codigo if codigo in _CODIGOS_REINTENTABLES else None
+
+
+def es_error_reintentable(exc) -> bool:
+    """True si la excepción es un deadlock o lock wait timeout (la transacción se puede repetir)."""
+    return _codigo_error_reintentable(exc) is not None
+
+
+def es_error_duplicado(exc) -> bool:
+    """True si la excepción es una violación de clave única (1062 o UNIQUE en SQLite)."""
+    if isinstance(exc, sqlite3.IntegrityError):
+        return 'unique constraint' in str(exc).lower()
+    if pymysql is None or not isinstance(exc, pymysql.err.MySQLError):
+        return False
+    args = getattr(exc, 'args', ())
+    return bool(args) and args[0] == 1062
+
+
+# 2003 = no se puede conectar, 2006 = servidor desconectado, 2013 = conexión perdida
+# durante la consulta, 2055 = conexión perdida (error de lectura/escritura)
+_CODIGOS_CONEXION = (2003, 2006, 2013, 2055)
+
+
+def es_error_conexion(exc) -> bool:
+    """True si la excepción indica que el servidor de DB no está accesible."""
+    if isinstance(exc, DBConnectionError):
+        return True
+    if pymysql is None or not isinstance(exc, pymysql.err.OperationalError):
+        return False
+    args = getattr(exc, 'args', ())
+    return bool(args) and args[0] in _CODIGOS_CONEXION
+
+
+def _contar_retry(clave: str, codigo=None):
+    with _retry_stats_lock:
+        _retry_stats[clave] += 1
+        if codigo is not None:
+            _retry_stats['por_codigo'][codigo] = _retry_stats['por_codigo'].get(codigo, 0) + 1
+
+
+def get_retry_stats() -> dict:
+    """Copia de los contadores de reintentos por deadlock/lock timeout."""
+    with _retry_stats_lock:
+        stats = dict(_retry_stats)
+        stats['por_codigo'] = dict(_retry_stats['por_codigo'])
+        return stats
+
+
+def retry_on_deadlock(func=None, *, max_reintentos=None):
+    """Decorador: repite la unidad transaccional completa ante deadlock (1213) o lock
+    wait timeout (1205), con backoff exponencial y jitter.
+
+    La función decorada debe abrir su propia `transaction()` para que cada intento
+    empiece desde cero (el intento fallido ya hizo rollback).
+    """
+    def decorador(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            params = _get_retry_params()
+            limite = params['max_reintentos'] if max_reintentos is None else max_reintentos
+            intento = 0
+            while True:
+                try:
+                    resultado = f(*args, **kwargs)
+                    if intento:
+                        _contar_retry('exitos_tras_reintento')
+                    return resultado
+                except Exception as e:
+                    codigo = _codigo_error_reintentable(e)
+                    if codigo is None:
+                        raise
+                    if intento >= limite:
+                        _contar_retry('agotados', codigo)
+                        raise
+                    _contar_retry('reintentos', codigo)
+                    espera = min(params['espera_max'], params['espera_base'] * (2 ** intento))
+                    intento += 1
+                    print(f"Advertencia: conflicto de bloqueo en DB (código {codigo}), reintento {intento}/{limite} de {f.__name__}.")
+                    time.sleep(random.uniform(0, espera))
+        return wrapper
+
+    if func is not None:
+        return decorador(func)
+    return decorador
 
 
 def fetch_all(sql: str, params=None):
     """Ejecuta SELECT y retorna lista de dicts."""
-    with get_connection() as conn:
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
             return cur.fetchall()
 
 
 def fetch_one(sql: str, params=None):
-    with get_connection() as conn:
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
             return cur.fetchone()
@@ -0,0 +1,313 @@
+"""Exportación de ventas a XLSX y PDF en streaming.
+
+Las filas llegan de un generador (p. ej. `Repo.iterar_ventas_periodo`) y se escriben
+al archivo a medida que llegan: el XLSX se arma con `zipfile` escribiendo la hoja
+fila por fila y el PDF emite una página cada LINEAS_POR_PAGINA filas. La memoria no
+crece con la cantidad de ventas. Se escribe a un temporal que se renombra al final,
+así una exportación cancelada o fallida no deja un archivo a medias.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import zipfile
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+# (título, clave en la fila, es monto)
+COLUMNAS_VENTAS: List[Tuple[str, str, bool]] = [
+    ("ID Venta", "id_venta", False),
+    ("Fecha", "fecha", False),
+    ("Cliente", "nombre_cliente", False),
+    ("Subtotal s/ITBIS", "subtotal_bruto_sin_itbis", True),
+    ("ITBIS", "itbis_total_venta", True),
+    ("Descuento", "descuento_aplicado", True),
+    ("Total", "total_final", True),
+]
+
+FORMATO_XLSX = "xlsx"
+FORMATO_PDF = "pdf"
+AVISO_PROGRESO_CADA = 250  # filas entre actualizaciones de progreso
+
+_CARACTERES_INVALIDOS_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class ExportacionCancelada(Exception):
+    pass
+
+
+class ProgresoExportacion:
+    """Estado compartido entre el hilo que exporta y la interfaz (que lo consulta con `after`)."""
+
+    def __init__(self):
+        self.total: Optional[int] = None
+        self.hechas = 0
+        self._cancelar = threading.Event()
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelar.is_set()
+
+
+# --------------------- XLSX ---------------------
+
+def _columna_excel(indice: int) -> str:
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 = normal, 1 = encabezado en negrita, 2 = monto con 2 decimales
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+
+
+class EscritorXLSX:
+    """Libro de una sola hoja escrito fila por fila (celdas de texto inline, sin sharedStrings)."""
+
+    def __init__(self, ruta: str, hoja: str = "Ventas"):
+        self._zip = zipfile.ZipFile(ruta, "w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        self._zip.writestr("_rels/.rels", _XLSX_RELS)
+        self._zip.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        self._zip.writestr("xl/styles.xml", _XLSX_STYLES)
+        self._zip.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        )
+        # force_zip64: la hoja puede superar 2 GB sin que zipfile conozca su tamaño de antemano
+        self._hoja = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._escribir(
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        self._fila = 0
+        self._letras: List[str] = []
+        self._pendiente: List[str] = []  # filas ya serializadas que aún no pasan al zip
+
+    def _escribir(self, texto: str):
+        self._hoja.write(texto.encode("utf-8"))
+
+    def _volcar(self):
+        if self._pendiente:
+            self._escribir("".join(self._pendiente))
+            self._pendiente = []
+
+    def agregar_fila(self, valores: Sequence, estilos: Optional[Sequence[int]] = None):
+        self._fila += 1
+        while len(self._letras) < len(valores):
+            self._letras.append(_columna_excel(len(self._letras)))
+        celdas = []
+        for i, valor in enumerate(valores):
+            ref = f"{self._letras[i]}{self._fila}"
+            estilo = estilos[i] if estilos else 0
+            s = f' s="{estilo}"' if estilo else ""
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                celdas.append(f'<c r="{ref}"{s}><v>{valor}</v></c>')
+            else:
+                texto = escape(_CARACTERES_INVALIDOS_XML.sub("", str(valor if valor is not None else "")))
+                celdas.append(f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>')
+        self._pendiente.append(f'<row r="{self._fila}">{"".join(celdas)}</row>')
+        if len(self._pendiente) >= 500:
+            self._volcar()
+
+    def cerrar(self):
+        self._volcar()
+        self._escribir("</sheetData></worksheet>")
+        self._hoja.close()
+        self._zip.close()
+
+    def abortar(self):
+        try:
+            self._hoja.close()
+        finally:
+            self._zip.close()
+
+
+# --------------------- PDF ---------------------
+
+def _pdf_texto(texto: str) -> bytes:
+    texto = texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return texto.encode("cp1252", "replace")
+
+
+class EscritorPDF:
+    """PDF A4 con Courier (columnas alineadas) que emite cada página al completarse.
+
+    Solo se guardan en memoria las líneas de la página actual y los offsets de los
+    objetos ya escritos (para la tabla xref).
+    """
+
+    LINEAS_POR_PAGINA = 56
+    _TAMANO_FUENTE = 8
+    _INTERLINEADO = 12
+    _Y_INICIAL = 800
+
+    # Objetos fijos: 1 catálogo, 2 árbol de páginas, 3 fuente; las páginas empiezan en 4
+    def __init__(self, ruta: str, titulo: str, encabezado: str):
+        self._f = open(ruta, "wb")
+        self._titulo = titulo
+        self._encabezado = encabezado
+        self._offsets: Dict[int, int] = {}
+        self._paginas: List[int] = []
+        self._siguiente_obj = 4
+        self._lineas: List[str] = []
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._objeto(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+
+    def _objeto(self, numero: int, contenido: bytes):
+        self._offsets[numero] = self._f.tell()
+        self._f.write(f"{numero} 0 obj\n".encode("ascii") + contenido + b"\nendobj\n")
+
+    def agregar_linea(self, linea: str):
+        self._lineas.append(linea)
+        if len(self._lineas) >= self.LINEAS_POR_PAGINA:
+            self._emitir_pagina()
+
+    def _emitir_pagina(self):
+        numero_pagina = len(self._paginas) + 1
+        lineas = [self._titulo, "", self._encabezado, "-" * len(self._encabezado)] + self._lineas
+        partes = [
+            b"BT",
+            f"/F1 {self._TAMANO_FUENTE} Tf".encode("ascii"),
+            f"1 0 0 1 40 {self._Y_INICIAL} Tm".encode("ascii"),
+            f"{self._INTERLINEADO} TL".encode("ascii"),
+        ]
+        for linea in lineas:
+            partes.append(b"(" + _pdf_texto(linea) + b") Tj T*")
+        partes.append(b"ET")
+        partes.append(b"BT /F1 8 Tf 1 0 0 1 500 30 Tm (" + _pdf_texto(f"Página {numero_pagina}") + b") Tj ET")
+        contenido = b"\n".join(partes)
+
+        obj_contenido, obj_pagina = self._siguiente_obj, self._siguiente_obj + 1
+        self._siguiente_obj += 2
+        self._objeto(obj_contenido, f"<< /Length {len(contenido)} >>\nstream\n".encode("ascii") + contenido + b"\nendstream")
+        self._objeto(obj_pagina, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {obj_contenido} 0 R >>"
+        ).encode("ascii"))
+        self._paginas.append(obj_pagina)
+        self._lineas = []
+
+    def cerrar(self):
+        if self._lineas or not self._paginas:
+            self._emitir_pagina()
+        kids = " ".join(f"{n} 0 R" for n in self._paginas)
+        self._objeto(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._paginas)} >>".encode("ascii"))
+        self._objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._f.tell()
+        total = self._siguiente_obj
+        self._f.write(f"xref\n0 {total}\n0000000000 65535 f \n".encode("ascii"))
+        for n in range(1, total):
+            self._f.write(f"{self._offsets[n]:010} 00000 n \n".encode("ascii"))
+        self._f.write(f"trailer\n<< /Size {total} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+        self._f.close()
+
+    def abortar(self):
+        self._f.close()
+
+
+# --------------------- Exportar ---------------------
+
+def _ancho_columna(titulo: str, es_monto: bool) -> int:
+    if titulo == "Cliente":
+        return 24
+    if titulo == "Fecha":
+        return 19
+    return max(len(titulo), 12 if es_monto else 8)
+
+
+def exportar_filas(filas: Iterable[Dict], ruta: str, formato: str, titulo: str,
+                   columnas: Sequence[Tuple[str, str, bool]] = COLUMNAS_VENTAS,
+                   progreso: Optional[ProgresoExportacion] = None) -> int:
+    """Escribe `filas` (dicts) en `ruta` como XLSX o PDF. Retorna cuántas filas se exportaron.
+
+    Lanza ExportacionCancelada si `progreso.cancelar()` se llamó a mitad de camino.
+    """
+    tmp = f"{ruta}.parcial"
+    if formato == FORMATO_XLSX:
+        escritor = EscritorXLSX(tmp)
+        escritor.agregar_fila([titulo])
+        escritor.agregar_fila([c[0] for c in columnas], [1] * len(columnas))
+        estilos = [2 if c[2] else 0 for c in columnas]
+        agregar: Callable[[Dict], None] = lambda fila: escritor.agregar_fila([fila.get(c[1]) for c in columnas], estilos)
+    elif formato == FORMATO_PDF:
+        anchos = [_ancho_columna(c[0], c[2]) for c in columnas]
+        encabezado = " ".join(c[0][:w].rjust(w) if c[2] else c[0][:w].ljust(w) for c, w in zip(columnas, anchos))
+        escritor = EscritorPDF(tmp, titulo, encabezado)
+
+        def agregar(fila: Dict):
+            celdas = []
+            for (_, clave, es_monto), w in zip(columnas, anchos):
+                valor = fila.get(clave)
+                celdas.append(f"{float(valor or 0):,.2f}".rjust(w) if es_monto else str(valor if valor is not None else "")[:w].ljust(w))
+            escritor.agregar_linea(" ".join(celdas))
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+    cantidad = 0
+    try:
+        for fila in filas:
+            agregar(fila)
+            cantidad += 1
+            if progreso is not None and cantidad % AVISO_PROGRESO_CADA == 0:
+                progreso.hechas = cantidad
+                if progreso.cancelado:
+                    raise ExportacionCancelada()
+        escritor.cerrar()
+    except BaseException:
+        escritor.abortar()
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp, ruta)
+    if progreso is not None:
+        progreso.hechas = cantidad
+    return cantidad
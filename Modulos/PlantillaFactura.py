@@ -0,0 +1,94 @@
+"""Plantillas de texto para facturas en papel de 32, 42, 48 u 80 columnas.
+
+El bloque de la empresa (nombre, dirección, teléfono, RNC) se arma una sola vez al
+crear la plantilla y las líneas de productos usan un formato precompilado por ancho,
+así renderizar una factura es unir cadenas ya hechas más una llamada a `format` por
+producto. Con 42 columnas el resultado es idéntico al formato histórico.
+"""
+from __future__ import annotations
+
+import functools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ANCHO_PREDETERMINADO = 42
+
+# ancho de papel -> (ancho nombre, ancho cantidad, ancho total, encabezado de columnas)
+_DISENOS: Dict[int, Tuple[int, int, int, Optional[str]]] = {
+    32: (12, 8, 10, None),
+    42: (20, 8, 10, "Producto                Cant.       Total"),
+    48: (26, 8, 10, None),
+    80: (50, 12, 14, None),
+}
+ANCHOS_SOPORTADOS = tuple(sorted(_DISENOS))
+
+_CAMPOS_EMPRESA = ("nombre", "direccion", "telefono", "rnc")
+
+
+class PlantillaFactura:
+    """Plantilla para un ancho de papel y unos datos de empresa fijos."""
+
+    def __init__(self, datos_empresa: Optional[Dict] = None, ancho: int = ANCHO_PREDETERMINADO):
+        if ancho not in _DISENOS:
+            raise ValueError(f"Ancho de papel no soportado: {ancho} (use {', '.join(map(str, ANCHOS_SOPORTADOS))})")
+        self.ancho = ancho
+        ancho_nombre, ancho_cant, ancho_total, encabezado = _DISENOS[ancho]
+        self._separador = "-" * ancho
+        # Formato de línea compilado una vez: {:<20.20} recorta y rellena el nombre
+        self._formato_linea = f"{{0:<{ancho_nombre}.{ancho_nombre}}}{{1:>{ancho_cant}.2f}}{{2:>{ancho_total}.2f}}".format
+        if encabezado is None:
+            encabezado = f"{'Producto':<{ancho_nombre}}{'Cant.':>{ancho_cant}}{'Total':>{ancho_total}}"
+        self._cabecera = self._armar_cabecera(datos_empresa or {})
+        self._antes_items = f"{self._separador}\n{encabezado}\n{self._separador}"
+        self._pie = f"{self._separador}\n{'¡Gracias por su compra!'.center(ancho)}"
+
+    def _armar_cabecera(self, empresa: Dict) -> str:
+        lineas = [(empresa.get("nombre") or "").center(self.ancho)]
+        if empresa.get("direccion"):
+            lineas.append(empresa["direccion"].center(self.ancho))
+        if empresa.get("telefono"):
+            lineas.append(f"Tel: {empresa['telefono']}")
+        if empresa.get("rnc"):
+            lineas.append(f"RNC: {empresa['rnc']}")
+        lineas.append(self._separador)
+        return "\n".join(lineas)
+
+    def renderizar(self, datos_venta: Dict, nombre_cliente: str = "Consumidor Final") -> str:
+        formato = self._formato_linea
+        items = [
+            formato(item.get('nombre') or '', float(item.get('cantidad', 0)), float(item.get('subtotal', 0.0)))
+            for item in datos_venta.get('productos', [])
+        ]
+        partes = [
+            self._cabecera,
+            f"Factura #: {datos_venta.get('id', 'N/A')}\n"
+            f"Fecha: {datos_venta.get('fecha')}\n"
+            f"Cliente: {nombre_cliente}",
+            self._antes_items,
+        ]
+        if items:
+            partes.append("\n".join(items))
+        partes.append(
+            f"{self._separador}\n"
+            f"Subtotal: RD$ {datos_venta.get('subtotal_bruto_con_itbis', 0.0):.2f}\n"
+            f"Descuento: RD$ {datos_venta.get('descuento_aplicado', 0.0):.2f}\n"
+            f"Total: RD$ {datos_venta.get('total_neto', 0.0):.2f}\n"
+            f"ITBIS: RD$ {datos_venta.get('itbis_total_venta', 0.0):.2f}"
+        )
+        partes.append(self._pie)
+        return "\n".join(partes)
+
+    def renderizar_lote(self, ventas: Iterable[Tuple[Dict, str]]) -> List[str]:
+        """Renderiza muchas facturas (p. ej. reimpresiones): [(datos_venta, nombre_cliente), ...]."""
+        renderizar = self.renderizar
+        return [renderizar(datos_venta, nombre_cliente) for datos_venta, nombre_cliente in ventas]
+
+
+@functools.lru_cache(maxsize=16)
+def _plantilla_cacheada(empresa: Tuple, ancho: int) -> PlantillaFactura:
+    return PlantillaFactura(dict(zip(_CAMPOS_EMPRESA, empresa)), ancho)
+
+
+def plantilla_para(datos_empresa: Optional[Dict] = None, ancho: int = ANCHO_PREDETERMINADO) -> PlantillaFactura:
+    """Plantilla reutilizada mientras no cambien los datos de la empresa ni el ancho."""
+    datos_empresa = datos_empresa or {}
+    return _plantilla_cacheada(tuple(datos_empresa.get(c) or "" for c in _CAMPOS_EMPRESA), ancho)
@@ -3,10 +3,16 @@
 Este archivo delega toda la lógica a :mod:`Modulos.Repo` para evitar cualquier
 dependencia con archivos JSON. Se conservan las funciones públicas originales
 para mantener compatibilidad con scripts o utilidades de consola.
+
+Libro de movimientos de stock:
+    python -m Modulos.Productos inicializar-movimientos   # saldo inicial (instalaciones existentes)
+    python -m Modulos.Productos verificar-stock           # productos con stock distinto al libro
 """
 
 from __future__ import annotations
 
+import sys
+
 from typing import List, Dict
 
 from Modulos.Repo import (
@@ -15,7 +21,13 @@ from Modulos.Repo import (
     obtener_productos_para_venta_gui as _obtener_productos_para_venta_gui,
     obtener_categorias_existentes as _obtener_categorias_existentes,
     obtener_producto_por_id as _obtener_producto_por_id,
+    obtener_producto_por_codigo_barras as _obtener_producto_por_codigo_barras,
     actualizar_producto as _actualizar_producto,
+    registrar_movimiento_stock as _registrar_movimiento_stock,
+    obtener_stock_a_fecha as _obtener_stock_a_fecha,
+    obtener_movimientos_producto as _obtener_movimientos_producto,
+    inicializar_movimientos_stock as _inicializar_movimientos_stock,
+    verificar_stock_movimientos as _verificar_stock_movimientos,
 )
 
 # Reexportar funciones principales para mantener la interfaz pública previa.
@@ -24,7 +36,13 @@ obtener_productos_para_gui = _obtener_productos_para_gui
 obtener_productos_para_venta_gui = _obtener_productos_para_venta_gui
 obtener_categorias_existentes = _obtener_categorias_existentes
 obtener_producto_por_id = _obtener_producto_por_id
+obtener_producto_por_codigo_barras = _obtener_producto_por_codigo_barras
 actualizar_producto = _actualizar_producto
+registrar_movimiento_stock = _registrar_movimiento_stock
+obtener_stock_a_fecha = _obtener_stock_a_fecha
+obtener_movimientos_producto = _obtener_movimientos_producto
+inicializar_movimientos_stock = _inicializar_movimientos_stock
+verificar_stock_movimientos = _verificar_stock_movimientos
 
 
 def agregar_producto():
@@ -93,3 +111,15 @@ def listar_productos(mostrar_encabezado: bool = True) -> bool:
             f"Proveedor: {producto.get('proveedor', 'N/A')}"
         )
     return True
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["inicializar-movimientos"]:
+        print(inicializar_movimientos_stock()["mensaje"])
+    elif sys.argv[1:] == ["verificar-stock"]:
+        diferencias = verificar_stock_movimientos()
+        for d in diferencias:
+            print(f"ID {d['id']} | {d['nombre']} | stock: {d['stock']:.3f} | según movimientos: {d['stock_movimientos']:.3f}")
+        print(f"{len(diferencias)} producto(s) con diferencias.")
+    else:
+        print("Uso: python -m Modulos.Productos inicializar-movimientos | verificar-stock")
@@ -1,23 +1,263 @@
 """
 Fachada de acceso a datos para la app.
 Implementa funciones equivalentes a las de los módulos JSON pero contra MariaDB
-usando PyMySQL. Mantiene los mismos nombres y estructuras esperadas por la GUI.
+usando PyMySQL (o SQLite embebido, ver DB_BACKEND en Modulos.DBUtil). Mantiene los
+mismos nombres y estructuras esperadas por la GUI.
 """
 
+import datetime
 import json
-from typing import List, Dict, Optional
-from Modulos.DBUtil import fetch_all, fetch_one, execute, transaction, get_connection
+import threading
+import time
+from typing import Iterator, List, Dict, Optional
+from Modulos.DBUtil import (
+    fetch_all, fetch_one, execute, transaction, pooled_connection, retry_on_deadlock,
+    es_error_duplicado, es_error_conexion, es_error_reintentable, sql_upsert,
+)
 from Modulos.Security import hash_password, verify_password, is_hashed
+from Modulos.PlantillaFactura import plantilla_para, ANCHO_PREDETERMINADO
 # --------------------- Productos ---------------------
 
+_SQL_PRODUCTOS_GUI = (
+    "SELECT p.id, p.nombre, p.codigo_barras, p.descripcion, p.precio_compra, p.precio_venta_sin_itbis, "
+    "p.aplica_itbis, p.tasa_itbis, p.itbis_monto_producto, p.precio_final_venta, p.stock, p.categoria, "
+    "pr.nombre AS proveedor "
+    "FROM productos p LEFT JOIN proveedores pr ON pr.id = p.proveedor_id"
+)
+
+
+def _producto_gui_desde_fila(r: Dict) -> Dict:
+    return {
+        'id': r['id'],
+        'nombre': r['nombre'],
+        'codigo_barras': r.get('codigo_barras') or '',
+        'precio_compra': float(r['precio_compra']),
+        'precio_venta_sin_itbis': float(r['precio_venta_sin_itbis']),
+        'aplica_itbis': bool(r['aplica_itbis']),
+        'tasa_itbis': float(r['tasa_itbis']),
+        'itbis_monto_producto': float(r['itbis_monto_producto']),
+        'precio_final_venta': float(r['precio_final_venta']),
+        'precio': float(r['precio_final_venta']),  # compat GUI
+        'descripcion': r.get('descripcion') or '',
+        'stock': float(r['stock']),
+        'categoria': r.get('categoria') or 'General',
+        'proveedor': r.get('proveedor') or 'N/A',
+    }
+
+
+class _CatalogoProductos:
+    """Cache en proceso del catálogo de productos, indexado por id con filas ya tipadas.
+
+    Antes de cada lectura se consulta una versión barata (COUNT(*) + MAX(updated_at))
+    y se releen las filas con updated_at dentro de VENTANA_COMMIT_TARDIO segundos antes
+    del último MAX conocido: `ON UPDATE CURRENT_TIMESTAMP` marca la hora de la sentencia,
+    no la del commit, así que una venta que confirma después de un cambio más reciente
+    de otra terminal queda con una marca anterior al MAX ya visto. Las escrituras de esta
+    terminal actualizan sus entradas directamente (write-through). Cada CATALOGO_MAX_EDAD
+    segundos se hace una recarga completa para recoger cambios que no tocan `productos`
+    (p. ej. nombre de proveedor) o transacciones más largas que la ventana.
+
+    El stock vendido sin conexión y aún no registrado en la DB se lleva aparte
+    (`_reservado`) y se descuenta de cada fila que se lee o actualiza desde la DB; así
+    una recarga antes de sincronizar el diario no devuelve ese stock a la venta.
+    """
+
+    CATALOGO_MAX_EDAD = 600.0
+    VENTANA_COMMIT_TARDIO = 60.0  # > duración de una transacción que toca productos
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._por_id: Dict[int, Dict] = {}
+        self._categoria_por_id: Dict[int, Optional[str]] = {}
+        self._reservado: Dict[int, float] = {}
+        self._ordenados: Optional[List[Dict]] = None
+        self._version = None
+        self._cargado_en = 0.0
+        self._valido = False
+
+    def invalidar(self):
+        """Fuerza una recarga completa en la próxima lectura."""
+        with self._lock:
+            self._valido = False
+
+    def _guardar_fila(self, r: Dict):
+        fila = _producto_gui_desde_fila(r)
+        fila['stock'] = self._stock_neto(r['id'], fila['stock'])
+        self._categoria_por_id[r['id']] = r.get('categoria')
+        if self._por_id.get(r['id']) == fila:
+            return  # relectura de la ventana sin cambios: conservar el orden calculado
+        self._por_id[r['id']] = fila
+        self._ordenados = None
+
+    def _stock_neto(self, pid: int, stock_db: float) -> float:
+        reservado = self._reservado.get(pid)
+        return round(stock_db - reservado, 3) if reservado else stock_db
+
+    def _leer_version(self):
+        v = fetch_one("SELECT COUNT(*) AS cantidad, MAX(updated_at) AS max_updated FROM productos") or {}
+        maximo = v.get('max_updated')
+        if isinstance(maximo, str):  # SQLite no tipa el resultado de MAX()
+            maximo = datetime.datetime.fromisoformat(maximo)
+        return (int(v.get('cantidad') or 0), maximo)
+
+    def _asegurar_fresco(self):
+        version = self._leer_version()
+        vencido = time.monotonic() - self._cargado_en > self.CATALOGO_MAX_EDAD
+        if not self._valido or vencido:
+            filas = fetch_all(_SQL_PRODUCTOS_GUI)  # antes de vaciar: si falla, se conserva la copia anterior
+            self._por_id, self._categoria_por_id, self._ordenados = {}, {}, None
+            for r in filas:
+                self._guardar_fila(r)
+            self._cargado_en = time.monotonic()
+            self._valido = True
+        else:
+            desde = self._version[1] if self._version else None
+            if desde is not None:
+                # Siempre, aunque la versión no cambie: un commit tardío no mueve el MAX
+                desde -= datetime.timedelta(seconds=self.VENTANA_COMMIT_TARDIO)
+                filas = fetch_all(_SQL_PRODUCTOS_GUI + " WHERE p.updated_at >= %s", (desde,))
+            elif version != self._version:
+                filas = fetch_all(_SQL_PRODUCTOS_GUI)
+            else:
+                filas = []
+            for r in filas:
+                self._guardar_fila(r)
+            if len(self._por_id) != version[0]:
+                # Hubo borrados: recargar completo en la próxima lectura
+                self._version = None
+                self._valido = False
+                return self._asegurar_fresco()
+        self._version = version
+
+    def _asegurar_fresco_o_en_cache(self):
+        """Como _asegurar_fresco, pero sin conexión con la DB sigue con la última copia cargada."""
+        try:
+            self._asegurar_fresco()
+        except Exception as e:
+            if not (es_error_conexion(e) and self._por_id):
+                raise
+            print(f"Advertencia: sin conexión con la DB, se usa el catálogo en memoria: {e}")
+
+    def productos(self) -> List[Dict]:
+        """Lista de productos ordenada por nombre (copias, se pueden modificar)."""
+        with self._lock:
+            self._asegurar_fresco_o_en_cache()
+            if self._ordenados is None:
+                self._ordenados = sorted(self._por_id.values(), key=lambda p: (p['nombre'].casefold(), p['id']))
+            return [dict(p) for p in self._ordenados]
+
+    def categorias(self) -> List[str]:
+        with self._lock:
+            self._asegurar_fresco_o_en_cache()
+            return sorted({c for c in self._categoria_por_id.values() if c}, key=str.casefold)
+
+    def refrescar_ids(self, ids: List[int]):
+        """Write-through: relee de la DB solo los productos indicados."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        with self._lock:
+            if not self._valido:
+                return
+            placeholders = ",".join(["%s"] * len(ids))
+            for r in fetch_all(_SQL_PRODUCTOS_GUI + f" WHERE p.id IN ({placeholders})", ids):
+                self._guardar_fila(r)
+
+    def descontar_sin_conexion(self, cantidades: Dict[int, float]) -> Dict:
+        """Valida una venta contra el stock en memoria y lo descuenta ahí (sin tocar la DB)."""
+        with self._lock:
+            if not self._por_id:
+                return {'exito': False, 'mensaje': "Sin conexión y sin catálogo en memoria: no se puede validar la venta."}
+            for pid, cantidad in cantidades.items():
+                fila = self._por_id.get(pid)
+                if fila is None:
+                    return {'exito': False, 'mensaje': f"Producto ID {pid} no encontrado."}
+                if cantidad > fila['stock']:
+                    return {'exito': False, 'mensaje': f"Stock insuficiente para '{fila['nombre']}'."}
+            self.reservar(cantidades)
+            return {'exito': True, 'stock_actualizado': {pid: self._por_id[pid]['stock'] for pid in cantidades}}
+
+    def reservar(self, cantidades: Dict[int, float]):
+        """Anota stock vendido sin conexión (pendiente en el diario) y lo descuenta de las filas."""
+        with self._lock:
+            for pid, cantidad in cantidades.items():
+                self._reservado[pid] = round(self._reservado.get(pid, 0.0) + cantidad, 3)
+                fila = self._por_id.get(pid)
+                if fila is not None:
+                    fila['stock'] = round(fila['stock'] - cantidad, 3)
+
+    def liberar(self, cantidades: Dict[int, float]):
+        """Quita de la reserva ventas que ya quedaron registradas en la DB. Las filas se deben
+        actualizar luego con el stock de la DB (aplicar_stock o refrescar_ids)."""
+        with self._lock:
+            for pid, cantidad in cantidades.items():
+                restante = round(self._reservado.get(pid, 0.0) - cantidad, 3)
+                if restante > 0:
+                    self._reservado[pid] = restante
+                else:
+                    self._reservado.pop(pid, None)
+
+    def aplicar_stock(self, stock_por_id: Dict[int, float]) -> Dict[int, float]:
+        """Actualiza el stock en cache con valores ya confirmados en la DB. Retorna el stock
+        disponible por id (descontando lo vendido sin conexión aún no sincronizado)."""
+        with self._lock:
+            neto = {}
+            for pid, stock in stock_por_id.items():
+                neto[pid] = self._stock_neto(pid, float(stock))
+                fila = self._por_id.get(pid)
+                if fila is not None:
+                    fila['stock'] = neto[pid]
+            return neto
+
+
+_catalogo = _CatalogoProductos()
+
+
+def invalidar_cache_catalogo():
+    """Descarta el catálogo en memoria (la próxima lectura lo recarga completo)."""
+    _catalogo.invalidar()
+
+
+def _cantidades_por_producto(items_vendidos: List[Dict]) -> Dict[int, float]:
+    cantidades: Dict[int, float] = {}
+    for it in items_vendidos:
+        pid = int(it.get('id'))
+        cantidades[pid] = cantidades.get(pid, 0.0) + float(it.get('cantidad', 0))
+    return cantidades
+
+
+def descontar_stock_sin_conexion(items_vendidos: List[Dict]) -> Dict:
+    """Para ventas sin conexión: valida contra el último catálogo cargado y descuenta el
+    stock en memoria. Retorna {'exito', 'mensaje' | 'stock_actualizado'}."""
+    return _catalogo.descontar_sin_conexion(_cantidades_por_producto(items_vendidos))
+
+
+def reservar_stock_sin_conexion(items_vendidos: List[Dict]):
+    """Al iniciar con ventas pendientes en el diario: descuenta su stock del catálogo en
+    memoria hasta que se sincronicen (sin validar, la venta ya se hizo)."""
+    _catalogo.reservar(_cantidades_por_producto(items_vendidos))
+
+
+def normalizar_codigo_barras(codigo) -> Optional[str]:
+    """Código de barras sin espacios; vacío -> None (la columna única admite varios NULL)."""
+    codigo = str(codigo or '').strip()
+    return codigo or None
+
+
+def _mensaje_codigo_duplicado(codigo: Optional[str]) -> Dict:
+    return {"exito": False, "mensaje": f"El código de barras '{codigo}' ya está asignado a otro producto."}
+
+
 def guardar_nuevo_producto(datos_producto_nuevo: Dict) -> Dict:
     sql = (
-        "INSERT INTO productos (nombre, descripcion, precio_compra, precio_venta_sin_itbis, "
+        "INSERT INTO productos (nombre, codigo_barras, descripcion, precio_compra, precio_venta_sin_itbis, "
         "aplica_itbis, tasa_itbis, itbis_monto_producto, precio_final_venta, stock, categoria, proveedor_id) "
-        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"
+        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)"
     )
+    codigo_barras = normalizar_codigo_barras(datos_producto_nuevo.get('codigo_barras'))
     params = (
         datos_producto_nuevo.get('nombre').strip(),
+        codigo_barras,
         datos_producto_nuevo.get('descripcion', '').strip(),
         float(datos_producto_nuevo.get('precio_compra', 0.0)),
         float(datos_producto_nuevo.get('precio_venta_sin_itbis', 0.0)),
@@ -29,58 +269,32 @@ def guardar_nuevo_producto(datos_producto_nuevo: Dict) -> Dict:
         (datos_producto_nuevo.get('categoria') or 'General').strip(),
         datos_producto_nuevo.get('proveedor_id'),
     )
-    nuevo_id = execute(sql, params)
+    stock_inicial = float(datos_producto_nuevo.get('stock', 0.0))
+    try:
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            nuevo_id = cur.lastrowid
+            if stock_inicial:
+                cur.execute(_SQL_INSERTAR_MOVIMIENTO, (nuevo_id, MOV_AJUSTE, stock_inicial, stock_inicial, None, "Stock inicial"))
+    except Exception as e:
+        if es_error_duplicado(e):
+            return _mensaje_codigo_duplicado(codigo_barras)
+        raise
+    _catalogo.refrescar_ids([nuevo_id])
     return {"exito": True, "mensaje": f"Producto agregado con ID {nuevo_id}.", "producto_id": nuevo_id}
 
 
 def obtener_productos_para_gui() -> List[Dict]:
-    sql = (
-        "SELECT p.id, p.nombre, p.descripcion, p.precio_compra, p.precio_venta_sin_itbis, "
-        "p.aplica_itbis, p.tasa_itbis, p.itbis_monto_producto, p.precio_final_venta, p.stock, p.categoria, "
-        "pr.nombre AS proveedor "
-        "FROM productos p LEFT JOIN proveedores pr ON pr.id = p.proveedor_id ORDER BY p.nombre"
-    )
-    rows = fetch_all(sql)
-    productos = []
-    for r in rows:
-        productos.append({
-            'id': r['id'],
-            'nombre': r['nombre'],
-            'precio_compra': float(r['precio_compra']),
-            'precio_venta_sin_itbis': float(r['precio_venta_sin_itbis']),
-            'aplica_itbis': bool(r['aplica_itbis']),
-            'tasa_itbis': float(r['tasa_itbis']),
-            'itbis_monto_producto': float(r['itbis_monto_producto']),
-            'precio_final_venta': float(r['precio_final_venta']),
-            'precio': float(r['precio_final_venta']),  # compat GUI
-            'descripcion': r.get('descripcion') or '',
-            'stock': float(r['stock']),
-            'categoria': r.get('categoria') or 'General',
-            'proveedor': r.get('proveedor') or 'N/A',
-        })
-    return productos
+    return _catalogo.productos()
 
 
 def obtener_productos_para_venta_gui() -> List[Dict]:
-    sql = (
-        "SELECT id, nombre, precio_venta_sin_itbis, aplica_itbis, tasa_itbis, precio_final_venta, stock "
-        "FROM productos WHERE stock > 0 ORDER BY nombre"
-    )
-    rows = fetch_all(sql)
-    out = []
-    for r in rows:
-        out.append({
-            'id': r['id'], 'nombre': r['nombre'], 'precio_final_venta': float(r['precio_final_venta']),
-            'stock': float(r['stock']), 'aplica_itbis': bool(r['aplica_itbis']),
-            'precio_venta_sin_itbis': float(r['precio_venta_sin_itbis']), 'tasa_itbis': float(r['tasa_itbis'])
-        })
-    return out
+    return [p for p in _catalogo.productos() if p['stock'] > 0]
 
 
 def obtener_categorias_existentes() -> List[str]:
-    sql = "SELECT DISTINCT categoria FROM productos WHERE categoria IS NOT NULL AND categoria<>'' ORDER BY categoria"
-    rows = fetch_all(sql)
-    return [r['categoria'] for r in rows]
+    return _catalogo.categorias()
 
 
 def obtener_producto_por_id(producto_id: int) -> Optional[Dict]:
@@ -91,32 +305,224 @@ def obtener_producto_por_id(producto_id: int) -> Optional[Dict]:
     return r
 
 
-def actualizar_producto(producto_id: int, datos: Dict) -> Dict:
-    """Actualiza un producto con los campos principales.
-    Espera en datos: nombre, descripcion, precio_compra, precio_venta_sin_itbis, aplica_itbis,
-    tasa_itbis, stock, categoria, proveedor_id, itbis_monto_producto, precio_final_venta
+def obtener_producto_por_codigo_barras(codigo: str) -> Optional[Dict]:
+    """Producto (formato GUI) con ese código de barras, o None. Usa el índice único
+    `ux_productos_codigo_barras`, así que no depende del tamaño del catálogo."""
+    codigo = normalizar_codigo_barras(codigo)
+    if codigo is None:
+        return None
+    r = fetch_one(_SQL_PRODUCTOS_GUI + " WHERE p.codigo_barras = %s", (codigo,))
+    return _producto_gui_desde_fila(r) if r else None
+
+
+def _texto_producto(valor) -> str:
+    return str(valor or '').strip()
+
+
+def _monto_producto(valor) -> float:
+    return round(float(valor or 0.0), 2)
+
+
+# Columnas editables de `productos` (sin stock) y cómo normalizar su valor para compararlo
+_CAMPOS_EDITABLES_PRODUCTO = {
+    'nombre': _texto_producto,
+    'codigo_barras': normalizar_codigo_barras,
+    'descripcion': _texto_producto,
+    'precio_compra': _monto_producto,
+    'precio_venta_sin_itbis': _monto_producto,
+    'aplica_itbis': lambda v: 1 if v else 0,
+    'tasa_itbis': lambda v: round(float(v or 0.0), 4),
+    'itbis_monto_producto': _monto_producto,
+    'precio_final_venta': _monto_producto,
+    'categoria': lambda v: _texto_producto(v) or 'General',
+    'proveedor_id': lambda v: int(v) if v not in (None, '') else None,
+}
+
+_CAS_PRODUCTO_REINTENTOS = 5
+
+
+def _campos_producto(datos: Dict) -> Dict:
+    return {campo: normalizar(datos.get(campo)) for campo, normalizar in _CAMPOS_EDITABLES_PRODUCTO.items()}
+
+
+def actualizar_producto(producto_id: int, datos: Dict, original: Optional[Dict] = None) -> Dict:
+    """Actualiza un producto con control de concurrencia optimista (columna `version`).
+
+    Espera en datos: nombre, codigo_barras, descripcion, precio_compra, precio_venta_sin_itbis, aplica_itbis,
+    tasa_itbis, stock, categoria, proveedor_id, itbis_monto_producto, precio_final_venta.
+    `original` es el producto tal como lo cargó el diálogo (obtener_producto_por_id); sin él
+    se compara contra los valores actuales. Solo se escriben los campos que cambiaron respecto
+    de `original` y el stock se aplica como diferencia (las ventas hechas mientras tanto se
+    conservan y la diferencia queda como movimiento de ajuste). Si otra terminal cambió alguno
+    de esos mismos campos, no se guarda nada y se retorna 'conflicto': True con
+    'campos_en_conflicto' y 'producto_actual'. El UPDATE compara `version` en lugar de bloquear
+    la fila mientras el diálogo está abierto.
     """
-    sql = (
-        "UPDATE productos SET nombre=%s, descripcion=%s, precio_compra=%s, precio_venta_sin_itbis=%s, "
-        "aplica_itbis=%s, tasa_itbis=%s, itbis_monto_producto=%s, precio_final_venta=%s, stock=%s, categoria=%s, proveedor_id=%s "
-        "WHERE id=%s"
-    )
-    params = (
-        datos.get('nombre').strip(),
-        datos.get('descripcion', '').strip(),
-        float(datos.get('precio_compra', 0.0)),
-        float(datos.get('precio_venta_sin_itbis', 0.0)),
-        1 if datos.get('aplica_itbis') else 0,
-        float(datos.get('tasa_itbis', 0.0)),
-        float(datos.get('itbis_monto_producto', 0.0)),
-        float(datos.get('precio_final_venta', 0.0)),
-        float(datos.get('stock', 0.0)),
-        (datos.get('categoria') or 'General').strip(),
-        datos.get('proveedor_id'),
-        producto_id,
+    nuevos = _campos_producto(datos)
+    for _ in range(_CAS_PRODUCTO_REINTENTOS):
+        actual = obtener_producto_por_id(producto_id)
+        if not actual:
+            return {"exito": False, "mensaje": f"Producto ID {producto_id} no encontrado."}
+        base = original or actual
+        base_campos, actual_campos = _campos_producto(base), _campos_producto(actual)
+        editados = [c for c, v in nuevos.items() if v != base_campos[c]]
+        conflictos = [c for c in editados if actual_campos[c] not in (base_campos[c], nuevos[c])]
+        if conflictos:
+            return {
+                "exito": False, "conflicto": True, "campos_en_conflicto": conflictos, "producto_actual": actual,
+                "mensaje": "Otro usuario modificó este producto mientras lo editaba.",
+            }
+        cambios = {c: nuevos[c] for c in editados if actual_campos[c] != nuevos[c]}
+        diferencia_stock = round(float(datos.get('stock', 0.0)) - float(base.get('stock') or 0.0), 3)
+        if not cambios and not diferencia_stock:
+            return {"exito": True, "mensaje": "Sin cambios que guardar."}
+        if float(actual['stock']) + diferencia_stock < 0:
+            return {"exito": False, "mensaje": f"El stock quedaría negativo (stock actual: {float(actual['stock']):.3f})."}
+
+        asignaciones = [f"{c}=%s" for c in cambios] + ["stock = stock + %s", "version = version + 1"]
+        params = list(cambios.values()) + [diferencia_stock, producto_id, actual['version'], diferencia_stock]
+        try:
+            with transaction() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    f"UPDATE productos SET {', '.join(asignaciones)} WHERE id=%s AND version=%s AND stock + %s >= 0",
+                    params
+                )
+                if cur.rowcount == 0:
+                    continue  # otra edición ganó la carrera: volver a comparar con la fila nueva
+                if diferencia_stock:
+                    cur.execute("SELECT stock FROM productos WHERE id=%s", (producto_id,))
+                    stock_resultante = float(cur.fetchone()['stock'])
+                    cur.execute(_SQL_INSERTAR_MOVIMIENTO, (producto_id, MOV_AJUSTE, diferencia_stock, stock_resultante, None, "Edición del producto"))
+        except Exception as e:
+            if es_error_duplicado(e):
+                return _mensaje_codigo_duplicado(nuevos['codigo_barras'])
+            raise
+        _catalogo.refrescar_ids([producto_id])
+        return {"exito": True, "mensaje": "Producto actualizado."}
+    return {"exito": False, "mensaje": "El producto se está modificando desde otra terminal; intente de nuevo."}
+
+
+# --------------------- Movimientos de stock ---------------------
+
+# Tipos de movimiento (columna ENUM de movimientos_stock)
+MOV_VENTA = 'venta'
+MOV_AJUSTE = 'ajuste'
+MOV_COMPRA = 'compra'
+MOV_DEVOLUCION = 'devolucion'
+TIPOS_MOVIMIENTO_STOCK = (MOV_VENTA, MOV_AJUSTE, MOV_COMPRA, MOV_DEVOLUCION)
+
+_SQL_INSERTAR_MOVIMIENTO = (
+    "INSERT INTO movimientos_stock (producto_id, tipo, cantidad, stock_resultante, venta_id, nota) "
+    "VALUES (%s,%s,%s,%s,%s,%s)"
+)
+
+# Último saldo de cada producto antes de una fecha: una búsqueda por producto en
+# ix_mov_producto_fecha (producto_id, fecha, id, stock_resultante), sin leer las filas
+_SQL_STOCK_A_FECHA = (
+    "SELECT p.id, p.nombre, p.stock AS stock_actual, "
+    "(SELECT m.stock_resultante FROM movimientos_stock m WHERE m.producto_id = p.id AND m.fecha < %s "
+    "ORDER BY m.fecha DESC, m.id DESC LIMIT 1) AS stock_movimientos "
+    "FROM productos p"
+)
+
+
+@retry_on_deadlock
+def registrar_movimiento_stock(producto_id: int, tipo: str, cantidad: float, nota: Optional[str] = None, venta_id: Optional[int] = None) -> Dict:
+    """Suma `cantidad` (negativa para salidas) al stock del producto y registra el movimiento
+    en la misma transacción. Para entradas de compra, devoluciones y ajustes por conteo.
+    """
+    if tipo not in TIPOS_MOVIMIENTO_STOCK:
+        return {"exito": False, "mensaje": f"Tipo de movimiento inválido: {tipo}"}
+    cantidad = round(float(cantidad), 3)
+    if not cantidad:
+        return {"exito": False, "mensaje": "La cantidad del movimiento no puede ser cero."}
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT stock, nombre FROM productos WHERE id=%s FOR UPDATE", (producto_id,))
+        row = cur.fetchone()
+        if not row:
+            return {"exito": False, "mensaje": f"Producto ID {producto_id} no encontrado."}
+        stock_resultante = round(float(row['stock']) + cantidad, 3)
+        if stock_resultante < 0:
+            return {"exito": False, "mensaje": f"Stock insuficiente para '{row['nombre']}'."}
+        cur.execute("UPDATE productos SET stock=%s WHERE id=%s", (stock_resultante, producto_id))
+        cur.execute(_SQL_INSERTAR_MOVIMIENTO, (producto_id, tipo, cantidad, stock_resultante, venta_id, (nota or '').strip() or None))
+    _catalogo.aplicar_stock({producto_id: stock_resultante})
+    return {"exito": True, "mensaje": "Movimiento de stock registrado.", "stock_resultante": stock_resultante}
+
+
+def obtener_stock_a_fecha(fecha_str: str, producto_ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """Stock de cada producto al cierre del día `fecha_str` ('YYYY-MM-DD') según el libro de
+    movimientos. Un producto sin movimientos hasta esa fecha cuenta con stock 0.
+    """
+    _, fin = _rango_fechas_sargable(fecha_str, fecha_str)
+    sql, params = _SQL_STOCK_A_FECHA, [fin]
+    if producto_ids:
+        sql += f" WHERE p.id IN ({','.join(['%s'] * len(producto_ids))})"
+        params.extend(int(i) for i in producto_ids)
+    return {r['id']: float(r['stock_movimientos'] or 0.0) for r in fetch_all(sql, params)}
+
+
+def obtener_movimientos_producto(
+    producto_id: int,
+    fecha_inicio_str: Optional[str] = None,
+    fecha_fin_str: Optional[str] = None,
+    limite: int = 200,
+    cursor: Optional[Dict] = None,
+) -> Dict:
+    """Movimientos de un producto, más recientes primero, paginados por clave (fecha, id)
+    sobre ix_mov_producto_fecha. `cursor` funciona igual que en obtener_pagina_ventas_historial.
+    """
+    where, params = ["producto_id = %s"], [int(producto_id)]
+    if fecha_inicio_str and fecha_fin_str:
+        where.append("fecha >= %s AND fecha < %s")
+        params.extend(_rango_fechas_sargable(fecha_inicio_str, fecha_fin_str))
+    if cursor:
+        where.append("(fecha < %s OR (fecha = %s AND id < %s))")
+        params.extend([cursor['fecha'], cursor['fecha'], cursor['id']])
+    filas = fetch_all(
+        "SELECT id, fecha, tipo, cantidad, stock_resultante, venta_id, nota FROM movimientos_stock "
+        "WHERE " + " AND ".join(where) + " ORDER BY fecha DESC, id DESC LIMIT %s",
+        params + [int(limite) + 1]
     )
-    execute(sql, params)
-    return {"exito": True, "mensaje": "Producto actualizado."}
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    siguiente = {'fecha': filas[-1]['fecha'], 'id': filas[-1]['id']} if hay_mas and filas else None
+    movimientos = [{
+        'id': m['id'], 'fecha': m['fecha'].strftime('%Y-%m-%d %H:%M:%S'), 'tipo': m['tipo'],
+        'cantidad': float(m['cantidad']), 'stock_resultante': float(m['stock_resultante']),
+        'venta_id': m.get('venta_id'), 'nota': m.get('nota') or '',
+    } for m in filas]
+    return {'movimientos': movimientos, 'siguiente_cursor': siguiente}
+
+
+def inicializar_movimientos_stock() -> Dict:
+    """Registra el stock actual como saldo inicial de los productos que aún no tienen
+    movimientos (instalaciones anteriores al libro de movimientos)."""
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO movimientos_stock (producto_id, tipo, cantidad, stock_resultante, nota) "
+            "SELECT p.id, %s, p.stock, p.stock, 'Saldo inicial' FROM productos p "
+            "WHERE NOT EXISTS (SELECT 1 FROM movimientos_stock m WHERE m.producto_id = p.id)",
+            (MOV_AJUSTE,)
+        )
+        cantidad = cur.rowcount
+    return {"exito": True, "mensaje": f"Saldo inicial registrado para {cantidad} producto(s).", "productos": cantidad}
+
+
+def verificar_stock_movimientos() -> List[Dict]:
+    """Productos cuyo `productos.stock` no coincide con el saldo del último movimiento."""
+    manana = (datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    _, fin = _rango_fechas_sargable(manana, manana)
+    diferencias = []
+    for r in fetch_all(_SQL_STOCK_A_FECHA, (fin,)):
+        actual = float(r['stock_actual'])
+        movimientos = float(r['stock_movimientos'] or 0.0)
+        if round(actual - movimientos, 3):
+            diferencias.append({'id': r['id'], 'nombre': r['nombre'], 'stock': actual, 'stock_movimientos': movimientos})
+    return diferencias
 
 
 # --------------------- Clientes ---------------------
@@ -144,26 +550,38 @@ def guardar_nuevo_cliente_desde_gui(nombre: str, telefono: str, direccion: str)
     return {"exito": True, "mensaje": f"Cliente '{nombre.strip()}' (ID: {new_id}) registrado exitosamente."}
 
 
-def obtener_historial_compras_cliente_gui(cliente_id: int) -> Dict:
-    c = fetch_one("SELECT id, nombre, telefono, direccion FROM clientes WHERE id=%s", (cliente_id,))
+def obtener_historial_compras_cliente_gui(cliente_id: int, limite: Optional[int] = None, desplazamiento: int = 0) -> Dict:
+    """Historial de compras de un cliente.
+    El total gastado y la cantidad de compras se calculan en SQL; `limite`/`desplazamiento`
+    permiten paginar historiales largos (sin límite se devuelven todas las compras).
+    """
+    c = fetch_one(
+        "SELECT c.id, c.nombre, c.telefono, c.direccion, "
+        "(SELECT COUNT(*) FROM ventas v WHERE v.cliente_id=c.id) AS total_compras, "
+        "(SELECT COALESCE(SUM(v.total_neto),0) FROM ventas v WHERE v.cliente_id=c.id) AS total_gastado "
+        "FROM clientes c WHERE c.id=%s",
+        (cliente_id,)
+    )
     if not c:
         return {"exito": False, "mensaje": f"Cliente con ID {cliente_id} no encontrado."}
-    ventas = fetch_all("SELECT * FROM ventas WHERE cliente_id=%s ORDER BY fecha DESC", (cliente_id,))
-    historial = []
-    total = 0.0
-    for v in ventas:
-        det = fetch_all("SELECT nombre_producto AS nombre, cantidad, precio_unitario, subtotal FROM ventas_detalle WHERE venta_id=%s", (v['id'],))
-        historial.append({
+    sql = "SELECT id, fecha, total_neto FROM ventas WHERE cliente_id=%s ORDER BY fecha DESC, id DESC"
+    params = [cliente_id]
+    if limite is not None:
+        sql += " LIMIT %s OFFSET %s"
+        params.extend([int(limite), max(0, int(desplazamiento))])
+    ventas = fetch_all(sql, params)
+    detalles = _detalles_por_venta([v['id'] for v in ventas])
+    historial = [
+        {
             'id_venta': v['id'], 'fecha': v['fecha'].strftime('%Y-%m-%d %H:%M:%S'),
-            'total_final': float(v['total_neto']), 'productos_detalle': [
-                {
-                    'nombre': d['nombre'], 'cantidad': float(d['cantidad']),
-                    'precio_unitario': float(d['precio_unitario']), 'subtotal': float(d['subtotal'])
-                } for d in det
-            ]
-        })
-        total += float(v['total_neto'])
-    return {"exito": True, "cliente_info": c, "historial_compras": historial, "total_gastado": total}
+            'total_final': float(v['total_neto']), 'productos_detalle': detalles.get(v['id'], [])
+        } for v in ventas
+    ]
+    cliente_info = {'id': c['id'], 'nombre': c['nombre'], 'telefono': c['telefono'], 'direccion': c['direccion']}
+    return {
+        "exito": True, "cliente_info": cliente_info, "historial_compras": historial,
+        "total_gastado": float(c['total_gastado'] or 0.0), "total_compras": int(c['total_compras'] or 0),
+    }
 
 
 # --------------------- Proveedores ---------------------
@@ -204,11 +622,125 @@ def obtener_proveedor_por_id(proveedor_id: int) -> Optional[Dict]:
 
 def actualizar_proveedor(proveedor_id: int, nombre: str, telefono: str, direccion: str) -> Dict:
     execute("UPDATE proveedores SET nombre=%s, telefono=%s, direccion=%s WHERE id=%s", (nombre.strip(), telefono.strip(), direccion.strip(), proveedor_id))
+    _catalogo.invalidar()  # el nombre del proveedor viaja en las filas del catálogo
     return {"exito": True, "mensaje": "Proveedor actualizado."}
 
 
 # --------------------- Ventas ---------------------
 
+def _registrar_venta(
+    cur,
+    items_vendidos: List[Dict],
+    totales: Dict,
+    clave_idempotencia: Optional[str] = None,
+    fecha: Optional[str] = None,
+    forzar_stock: bool = False,
+) -> Dict:
+    """Inserta una venta usando la transacción del llamador (cabecera, detalle, stock,
+    movimientos y resumen diario).
+
+    Las filas de productos se bloquean y validan con una sola consulta (en orden de id
+    para que terminales concurrentes no se bloqueen mutuamente), el detalle se inserta
+    con executemany y el stock se fija con un único UPDATE, con una fila por producto
+    en `movimientos_stock`.
+
+    Con forzar_stock=True (ventas ya entregadas sin conexión) la falta de stock no impide
+    registrar la venta: el stock queda en 0 y el faltante se anota como ajuste; un producto
+    que ya no existe se registra solo en el detalle. Retorna {'exito': False, 'mensaje'} o
+    {'exito': True, 'venta_id', 'stock_resultante', 'faltantes'}.
+    """
+    cantidades: Dict[int, float] = {}
+    for it in items_vendidos:
+        pid = int(it.get('id'))
+        cantidades[pid] = cantidades.get(pid, 0.0) + float(it.get('cantidad', 0))
+    ids_ordenados = sorted(cantidades)
+    placeholders = ",".join(["%s"] * len(ids_ordenados))
+
+    # Bloquear + validar stock de todos los productos en una sola ida a la DB
+    cur.execute(
+        f"SELECT id, stock, nombre, precio_final_venta FROM productos WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE",
+        ids_ordenados
+    )
+    snapshot = {r['id']: r for r in cur.fetchall()}
+    if not forzar_stock:
+        for pid in ids_ordenados:
+            row = snapshot.get(pid)
+            if not row:
+                return {'exito': False, 'mensaje': f"Producto ID {pid} no encontrado."}
+            if cantidades[pid] > float(row['stock']):
+                return {'exito': False, 'mensaje': f"Stock insuficiente para '{row['nombre']}'."}
+
+    # Insert cabecera
+    total_bruto_sin_itbis = float(totales.get('total_bruto_sin_itbis', 0.0))
+    itbis_total_venta = float(totales.get('itbis_total_venta', 0.0))
+    dinero_recibido = totales.get('dinero_recibido')
+    cambio_devuelto = totales.get('cambio_devuelto')
+    columnas = ["cliente_id", "subtotal_bruto_sin_itbis", "itbis_total_venta", "subtotal_bruto_con_itbis",
+                "descuento_aplicado", "total_neto", "dinero_recibido", "cambio_devuelto", "clave_idempotencia"]
+    valores = [
+        totales.get('cliente_id_seleccionado'),
+        total_bruto_sin_itbis, itbis_total_venta,
+        total_bruto_sin_itbis + itbis_total_venta,
+        float(totales.get('descuento_aplicado', 0.0)), float(totales.get('total_neto', 0.0)),
+        float(dinero_recibido) if dinero_recibido is not None else None,
+        float(cambio_devuelto) if cambio_devuelto is not None else None,
+        clave_idempotencia,
+    ]
+    if fecha:
+        columnas.append("fecha")
+        valores.append(fecha)
+    cur.execute(
+        f"INSERT INTO ventas ({', '.join(columnas)}) VALUES ({','.join(['%s'] * len(columnas))})",
+        valores
+    )
+    venta_id = cur.lastrowid
+
+    # Detalle: reutilizar el snapshot bloqueado en lugar de volver a consultar cada producto
+    filas_detalle = []
+    for it in items_vendidos:
+        p = snapshot.get(int(it.get('id')))
+        cantidad = float(it.get('cantidad', 0))
+        precio_u = float(it.get('precio_unitario', p['precio_final_venta'] if p else 0.0))
+        subtotal = float(it.get('subtotal', cantidad * precio_u))
+        itbis_item_total = float(it.get('itbis_item_total', 0.0))
+        filas_detalle.append((
+            venta_id, p['id'] if p else None, p['nombre'] if p else (it.get('nombre') or f"Producto {it.get('id')}"),
+            cantidad, precio_u, subtotal, itbis_item_total,
+        ))
+    cur.executemany(
+        ("INSERT INTO ventas_detalle (venta_id, producto_id, nombre_producto, cantidad, precio_unitario, subtotal, itbis_item_total) "
+         "VALUES (%s,%s,%s,%s,%s,%s,%s)"),
+        filas_detalle
+    )
+
+    # Stock: valores calculados sobre las filas bloqueadas, en un solo UPDATE
+    presentes = [pid for pid in ids_ordenados if pid in snapshot]
+    stock_resultante: Dict[int, float] = {}
+    faltantes: Dict[int, float] = {}
+    movimientos = []
+    for pid in presentes:
+        despues_venta = round(float(snapshot[pid]['stock']) - cantidades[pid], 3)
+        movimientos.append((pid, MOV_VENTA, -cantidades[pid], despues_venta, venta_id, None))
+        if despues_venta < 0:
+            faltantes[pid] = -despues_venta
+            movimientos.append((pid, MOV_AJUSTE, -despues_venta, 0.0, venta_id, "Faltante al registrar venta sin conexión"))
+        stock_resultante[pid] = max(despues_venta, 0.0)
+    if presentes:
+        casos = " ".join(["WHEN %s THEN %s"] * len(presentes))
+        params_stock = []
+        for pid in presentes:
+            params_stock.extend([pid, stock_resultante[pid]])
+        cur.execute(
+            f"UPDATE productos SET stock = CASE id {casos} END WHERE id IN ({','.join(['%s'] * len(presentes))})",
+            params_stock + presentes
+        )
+        cur.executemany(_SQL_INSERTAR_MOVIMIENTO, movimientos)
+    # Último paso: la fila del día es compartida por todas las cajas, así se bloquea lo menos posible
+    cur.execute(_sql_sumar_resumen_diario(), (venta_id,))
+    return {'exito': True, 'venta_id': venta_id, 'stock_resultante': stock_resultante, 'faltantes': faltantes}
+
+
+@retry_on_deadlock
 def procesar_nueva_venta_gui(
     cliente_id_seleccionado: Optional[int],
     items_vendidos: List[Dict],
@@ -218,52 +750,154 @@ def procesar_nueva_venta_gui(
     total_neto: float,
     dinero_recibido: Optional[float] = None,
     cambio_devuelto: Optional[float] = None,
+    clave_idempotencia: Optional[str] = None,
 ) -> Dict:
-    """Registra una venta con manejo de stock en transacción."""
-    with transaction() as conn:
-        cur = conn.cursor()
-        # Validar stock
-        for it in items_vendidos:
-            cur.execute("SELECT stock, nombre, precio_final_venta, precio_venta_sin_itbis, aplica_itbis FROM productos WHERE id=%s FOR UPDATE", (it.get('id'),))
-            row = cur.fetchone()
-            if not row:
-                return {'exito': False, 'mensaje': f"Producto ID {it.get('id')} no encontrado."}
-            if float(it.get('cantidad', 0)) > float(row['stock']):
-                return {'exito': False, 'mensaje': f"Stock insuficiente para '{row['nombre']}'."}
+    """Registra una venta con manejo de stock en transacción (ver _registrar_venta).
+    El resumen diario (`ventas_resumen_diario`) se actualiza dentro de la misma transacción.
 
-        # Insert cabecera
-        cur.execute(
-            ("INSERT INTO ventas (cliente_id, subtotal_bruto_sin_itbis, itbis_total_venta, subtotal_bruto_con_itbis, "
-             "descuento_aplicado, total_neto, dinero_recibido, cambio_devuelto) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"),
-            (
-                cliente_id_seleccionado,
-                float(total_bruto_sin_itbis), float(itbis_total_venta),
-                float(total_bruto_sin_itbis + itbis_total_venta), float(descuento_aplicado), float(total_neto),
-                float(dinero_recibido) if dinero_recibido is not None else None,
-                float(cambio_devuelto) if cambio_devuelto is not None else None,
-            )
-        )
-        venta_id = cur.lastrowid
+    `clave_idempotencia` la genera el cliente (ver CarritoVenta.clave_idempotencia). Si ya
+    existe una venta con esa clave (doble envío, reintento tras un timeout) no se registra
+    otra: se retorna la venta ya confirmada con 'repetida': True.
+    """
+    if not items_vendidos:
+        return {'exito': False, 'mensaje': "La venta no tiene productos."}
+    totales = {
+        'cliente_id_seleccionado': cliente_id_seleccionado,
+        'total_bruto_sin_itbis': total_bruto_sin_itbis, 'itbis_total_venta': itbis_total_venta,
+        'descuento_aplicado': descuento_aplicado, 'total_neto': total_neto,
+        'dinero_recibido': dinero_recibido, 'cambio_devuelto': cambio_devuelto,
+    }
+    try:
+        with transaction() as conn:
+            if clave_idempotencia:
+                repetida = _venta_por_clave(conn, clave_idempotencia)
+                if repetida:
+                    return repetida
+            resultado = _registrar_venta(conn.cursor(), items_vendidos, totales, clave_idempotencia)
+            if not resultado['exito']:
+                return resultado
+            venta_id = resultado['venta_id']
+            venta_registrada = _venta_para_factura(conn, venta_id)
+    except Exception as e:
+        # Otro envío con la misma clave se confirmó entre la consulta y el INSERT
+        if not (clave_idempotencia and es_error_duplicado(e)):
+            raise
+        with pooled_connection() as conn:
+            repetida = _venta_por_clave(conn, clave_idempotencia)
+        if not repetida:
+            raise
+        return repetida
+
+    # Ya confirmada la transacción: reflejar el nuevo stock en el catálogo en memoria
+    stock = _catalogo.aplicar_stock(resultado['stock_resultante'])
+    return {
+        "exito": True, "mensaje": f"Venta ID: {venta_id} registrada con exito.",
+        "venta_registrada": venta_registrada, "stock_actualizado": stock,
+    }
+
+
+def _venta_por_clave(conn, clave_idempotencia: str) -> Optional[Dict]:
+    """Resultado de procesar_nueva_venta_gui para una venta ya registrada con esa clave, o None."""
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM ventas WHERE clave_idempotencia=%s", (clave_idempotencia,))
+    fila = cur.fetchone()
+    if not fila:
+        return None
+    venta_id = fila['id']
+    # Stock actual de sus productos: quien reintenta puede no haber recibido la primera respuesta
+    cur.execute(
+        "SELECT id, stock FROM productos WHERE id IN (SELECT producto_id FROM ventas_detalle WHERE venta_id=%s)",
+        (venta_id,)
+    )
+    stock = _catalogo.aplicar_stock({r['id']: float(r['stock']) for r in cur.fetchall()})
+    return {
+        "exito": True, "repetida": True, "mensaje": f"Venta ID: {venta_id} ya estaba registrada.",
+        "venta_registrada": _venta_para_factura(conn, venta_id), "stock_actualizado": stock,
+    }
 
-        # Insert detalle + actualizar stock
-        for it in items_vendidos:
-            # Obtener snapshot de nombre y valores actuales por si la UI no los trae completos
-            cur.execute("SELECT nombre, precio_final_venta, precio_venta_sin_itbis, aplica_itbis FROM productos WHERE id=%s", (it.get('id'),))
-            p = cur.fetchone()
-            nombre_prod = p['nombre'] if p else it.get('nombre', 'N/A')
-            cantidad = float(it.get('cantidad', 0))
-            precio_u = float(it.get('precio_unitario', p['precio_final_venta'] if p else 0.0))
-            subtotal = float(it.get('subtotal', cantidad * precio_u))
-            itbis_item_total = float(it.get('itbis_item_total', 0.0))
 
-            cur.execute(
-                ("INSERT INTO ventas_detalle (venta_id, producto_id, nombre_producto, cantidad, precio_unitario, subtotal, itbis_item_total) "
-                 "VALUES (%s,%s,%s,%s,%s,%s,%s)"),
-                (venta_id, it.get('id'), nombre_prod, cantidad, precio_u, subtotal, itbis_item_total)
-            )
-            cur.execute("UPDATE productos SET stock = stock - %s WHERE id=%s", (cantidad, it.get('id')))
+@retry_on_deadlock
+def sincronizar_ventas_offline(pendientes: List[Dict]) -> List[Dict]:
+    """Registra un lote de ventas hechas sin conexión en una sola transacción.
 
-        return {"exito": True, "mensaje": f"Venta ID: {venta_id} registrada con exito.", "venta_registrada": _venta_para_factura(conn, venta_id)}
+    Cada pendiente es {'clave', 'fecha', 'venta'} donde 'venta' tiene los argumentos de
+    procesar_nueva_venta_gui. Se aplican en el orden recibido (orden del diario), siempre
+    con forzar_stock=True: la mercancía ya se entregó, así que la venta se registra completa
+    y el faltante de stock queda como ajuste. Si el cliente se eliminó mientras tanto, la
+    venta se registra sin cliente (lo mismo que ON DELETE SET NULL habría hecho con la venta
+    ya registrada) y se informa en 'avisos'. Una clave ya presente en `ventas` no se vuelve
+    a insertar. Un error en una venta deshace solo esa venta (SAVEPOINT); un error de
+    conexión aborta el lote completo. Retorna por cada pendiente
+    {'clave', 'exito', 'venta_id' | 'mensaje', 'faltantes', 'avisos'}.
+    """
+    if not pendientes:
+        return []
+    resultados = []
+    stock_final: Dict[int, float] = {}
+    registradas: Dict[int, float] = {}  # cantidades que dejan de estar reservadas en el catálogo
+    ids_ya_registradas = set()
+    with transaction() as conn:
+        cur = conn.cursor()
+        claves = [p['clave'] for p in pendientes]
+        cur.execute(
+            f"SELECT id, clave_idempotencia FROM ventas WHERE clave_idempotencia IN ({','.join(['%s'] * len(claves))})",
+            claves
+        )
+        existentes = {r['clave_idempotencia']: r['id'] for r in cur.fetchall()}
+        ids_clientes = sorted({int(p['venta']['cliente_id_seleccionado']) for p in pendientes
+                               if p['venta'].get('cliente_id_seleccionado')})
+        clientes_vigentes = set()
+        if ids_clientes:
+            cur.execute(f"SELECT id FROM clientes WHERE id IN ({','.join(['%s'] * len(ids_clientes))})", ids_clientes)
+            clientes_vigentes = {r['id'] for r in cur.fetchall()}
+        for p in pendientes:
+            if p['clave'] in existentes:
+                for pid, cantidad in _cantidades_por_producto(p['venta'].get('items_vendidos') or []).items():
+                    registradas[pid] = registradas.get(pid, 0.0) + cantidad
+                    ids_ya_registradas.add(pid)
+                resultados.append({'clave': p['clave'], 'exito': True, 'venta_id': existentes[p['clave']], 'faltantes': {}, 'avisos': []})
+                continue
+            venta = dict(p['venta'])
+            items = venta.pop('items_vendidos', None) or []
+            avisos = []
+            cliente_id = venta.get('cliente_id_seleccionado')
+            if cliente_id and int(cliente_id) not in clientes_vigentes:
+                venta['cliente_id_seleccionado'] = None
+                avisos.append(f"El cliente ID {cliente_id} ya no existe; la venta se registró sin cliente.")
+            cur.execute("SAVEPOINT venta_offline")
+            try:
+                if not items:
+                    raise ValueError("La venta no tiene productos.")
+                r = _registrar_venta(cur, items, venta, p['clave'], fecha=p.get('fecha'), forzar_stock=True)
+            except Exception as e:
+                if es_error_conexion(e) or es_error_reintentable(e):
+                    raise
+                cur.execute("ROLLBACK TO SAVEPOINT venta_offline")
+                resultados.append({'clave': p['clave'], 'exito': False, 'mensaje': str(e), 'faltantes': {}, 'avisos': []})
+                continue
+            cur.execute("RELEASE SAVEPOINT venta_offline")
+            existentes[p['clave']] = r['venta_id']
+            stock_final.update(r['stock_resultante'])
+            for pid, cantidad in _cantidades_por_producto(items).items():
+                registradas[pid] = registradas.get(pid, 0.0) + cantidad
+            resultados.append({'clave': p['clave'], 'exito': True, 'venta_id': r['venta_id'], 'faltantes': r['faltantes'], 'avisos': avisos})
+    _catalogo.liberar(registradas)
+    _catalogo.aplicar_stock(stock_final)
+    # Ventas que ya estaban en la DB: su stock no se leyó en este lote
+    _catalogo.refrescar_ids([pid for pid in ids_ya_registradas if pid not in stock_final])
+    return resultados
+
+
+_COLUMNAS_RESUMEN_DIARIO = ("dia", "cantidad_ventas", "subtotal_bruto_sin_itbis", "itbis_total", "descuento_total", "total_neto")
+
+
+def _sql_sumar_resumen_diario() -> str:
+    # El SQL depende del motor activo (ON DUPLICATE KEY / ON CONFLICT): se arma al usarlo
+    return sql_upsert(
+        "ventas_resumen_diario", _COLUMNAS_RESUMEN_DIARIO, ("dia",), sumar=_COLUMNAS_RESUMEN_DIARIO[1:],
+        select="SELECT DATE(fecha), 1, subtotal_bruto_sin_itbis, itbis_total_venta, descuento_aplicado, total_neto "
+               "FROM ventas WHERE id=%s",
+    )
 
 
 def _venta_para_factura(conn, venta_id: int) -> Dict:
@@ -293,79 +927,247 @@ def _venta_para_factura(conn, venta_id: int) -> Dict:
 
 def obtener_venta_para_factura(venta_id: int) -> Dict:
     """Obtiene una venta completa para generar factura (con detalle)."""
-    with get_connection() as conn:
+    with pooled_connection() as conn:
         return _venta_para_factura(conn, venta_id)
 
 
+_DETALLE_LOTE_IDS = 500
+
+
+def _detalles_por_venta(venta_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Carga el detalle de varias ventas en consultas por lotes (evita una consulta por venta)."""
+    detalles: Dict[int, List[Dict]] = {vid: [] for vid in venta_ids}
+    ids = list(detalles.keys())
+    for i in range(0, len(ids), _DETALLE_LOTE_IDS):
+        lote = ids[i:i + _DETALLE_LOTE_IDS]
+        placeholders = ",".join(["%s"] * len(lote))
+        rows = fetch_all(
+            "SELECT venta_id, nombre_producto AS nombre, cantidad, precio_unitario, subtotal "
+            f"FROM ventas_detalle WHERE venta_id IN ({placeholders}) ORDER BY venta_id, id",
+            lote,
+        )
+        for d in rows:
+            detalles[d['venta_id']].append({
+                'nombre': d['nombre'], 'cantidad': float(d['cantidad']),
+                'precio_unitario': float(d['precio_unitario']), 'subtotal': float(d['subtotal'])
+            })
+    return detalles
+
+
+def _rango_fechas_sargable(fecha_inicio_str: str, fecha_fin_str: str):
+    """Convierte fechas inclusivas 'YYYY-MM-DD' en un rango semiabierto [inicio, fin + 1 día).
+    Comparar `fecha` directamente (sin DATE()) permite usar el índice ix_ventas_fecha.
+    """
+    inicio = datetime.datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
+    fin = datetime.datetime.strptime(fecha_fin_str, '%Y-%m-%d') + datetime.timedelta(days=1)
+    return inicio, fin
+
+
+def _venta_para_historial(v: Dict, detalles: Dict[int, List[Dict]]) -> Dict:
+    return {
+        'id_venta': v['id'], 'fecha': v['fecha'].strftime('%Y-%m-%d %H:%M:%S'), 'nombre_cliente': v['nombre_cliente'],
+        'productos_detalle': detalles.get(v['id'], []),
+        'subtotal_bruto_sin_itbis': float(v['subtotal_bruto_sin_itbis']),
+        'itbis_total_venta': float(v['itbis_total_venta']),
+        'subtotal_bruto_con_itbis': float(v['subtotal_bruto_con_itbis']),
+        'descuento_aplicado': float(v['descuento_aplicado']),
+        'total_final': float(v['total_neto'])
+    }
+
+
 def obtener_ventas_para_historial_gui(fecha_inicio_str: Optional[str] = None, fecha_fin_str: Optional[str] = None) -> Dict:
     params = []
     where = []
     if fecha_inicio_str and fecha_fin_str:
-        where.append("DATE(fecha) BETWEEN %s AND %s")
-        params.extend([fecha_inicio_str, fecha_fin_str])
+        where.append("v.fecha >= %s AND v.fecha < %s")
+        params.extend(_rango_fechas_sargable(fecha_inicio_str, fecha_fin_str))
     where_clause = (" WHERE " + " AND ".join(where)) if where else ""
     sql = (
         "SELECT v.*, COALESCE(c.nombre,'Consumidor Final') AS nombre_cliente "
-        "FROM ventas v LEFT JOIN clientes c ON c.id=v.cliente_id" + where_clause + " ORDER BY v.fecha DESC"
+        "FROM ventas v LEFT JOIN clientes c ON c.id=v.cliente_id" + where_clause + " ORDER BY v.fecha DESC, v.id DESC"
     )
     ventas = fetch_all(sql, params)
-    total_periodo = 0.0
-    out = []
-    for v in ventas:
-        det = fetch_all("SELECT nombre_producto AS nombre, cantidad, precio_unitario, subtotal FROM ventas_detalle WHERE venta_id=%s", (v['id'],))
-        out.append({
-            'id_venta': v['id'], 'fecha': v['fecha'].strftime('%Y-%m-%d %H:%M:%S'), 'nombre_cliente': v['nombre_cliente'],
-            'productos_detalle': [
-                {
-                    'nombre': d['nombre'], 'cantidad': float(d['cantidad']), 'precio_unitario': float(d['precio_unitario']), 'subtotal': float(d['subtotal'])
-                } for d in det
-            ],
-            'subtotal_bruto_sin_itbis': float(v['subtotal_bruto_sin_itbis']),
-            'itbis_total_venta': float(v['itbis_total_venta']),
-            'subtotal_bruto_con_itbis': float(v['subtotal_bruto_con_itbis']),
-            'descuento_aplicado': float(v['descuento_aplicado']),
-            'total_final': float(v['total_neto'])
-        })
-        total_periodo += float(v['total_neto'])
+    detalles = _detalles_por_venta([v['id'] for v in ventas])
+    out = [_venta_para_historial(v, detalles) for v in ventas]
+    total_periodo = sum(float(v['total_neto']) for v in ventas)
     return {'ventas_mostradas': out, 'total_periodo': total_periodo}
 
 
-def generar_texto_factura(datos_venta: Dict, nombre_cliente_str: str = "Consumidor Final", datos_empresa: Optional[Dict] = None) -> str:
-    """Construye un bloque de texto listo para imprimir o guardar."""
-    datos_empresa = datos_empresa or {
-        "nombre": "",
-        "direccion": "",
-        "telefono": "",
-        "rnc": "",
+def obtener_pagina_ventas_historial(
+    fecha_inicio_str: Optional[str] = None,
+    fecha_fin_str: Optional[str] = None,
+    limite: int = 200,
+    cursor: Optional[Dict] = None,
+) -> Dict:
+    """Página de ventas (más recientes primero) con paginación por clave (keyset).
+
+    `cursor` es el valor 'siguiente_cursor' devuelto por la página anterior
+    ({'fecha': datetime, 'id': int}); None pide la primera página. 'siguiente_cursor'
+    es None cuando no quedan más ventas.
+    """
+    params = []
+    where = []
+    if fecha_inicio_str and fecha_fin_str:
+        where.append("v.fecha >= %s AND v.fecha < %s")
+        params.extend(_rango_fechas_sargable(fecha_inicio_str, fecha_fin_str))
+    if cursor:
+        where.append("(v.fecha < %s OR (v.fecha = %s AND v.id < %s))")
+        params.extend([cursor['fecha'], cursor['fecha'], cursor['id']])
+    where_clause = (" WHERE " + " AND ".join(where)) if where else ""
+    sql = (
+        "SELECT v.*, COALESCE(c.nombre,'Consumidor Final') AS nombre_cliente "
+        "FROM ventas v LEFT JOIN clientes c ON c.id=v.cliente_id" + where_clause +
+        " ORDER BY v.fecha DESC, v.id DESC LIMIT %s"
+    )
+    params.append(int(limite) + 1)
+    ventas = fetch_all(sql, params)
+    hay_mas = len(ventas) > limite
+    ventas = ventas[:limite]
+    detalles = _detalles_por_venta([v['id'] for v in ventas])
+    siguiente = {'fecha': ventas[-1]['fecha'], 'id': ventas[-1]['id']} if hay_mas and ventas else None
+    return {'ventas_mostradas': [_venta_para_historial(v, detalles) for v in ventas], 'siguiente_cursor': siguiente}
+
+
+def _totales_ventas(fecha_inicio_str: Optional[str] = None, fecha_fin_str: Optional[str] = None) -> Dict:
+    """Totales del periodo: días cerrados desde `ventas_resumen_diario` más el día en curso
+    (según el reloj de la DB) sumado en vivo desde `ventas`, en una sola consulta.
+    Sin fechas cubre todo el historial.
+    """
+    where_resumen, params_resumen = ["dia < CURDATE()"], []
+    where_hoy, params_hoy = ["fecha >= CURDATE()"], []
+    if fecha_inicio_str and fecha_fin_str:
+        inicio, fin = _rango_fechas_sargable(fecha_inicio_str, fecha_fin_str)
+        where_resumen.append("dia >= %s AND dia < %s")
+        params_resumen.extend([inicio.date(), fin.date()])
+        where_hoy.append("fecha >= %s AND fecha < %s")
+        params_hoy.extend([inicio, fin])
+    filas = fetch_all(
+        "SELECT COALESCE(SUM(cantidad_ventas),0) AS cantidad, COALESCE(SUM(subtotal_bruto_sin_itbis),0) AS subtotal, "
+        "COALESCE(SUM(itbis_total),0) AS itbis, COALESCE(SUM(descuento_total),0) AS descuento, "
+        "COALESCE(SUM(total_neto),0) AS total "
+        "FROM ventas_resumen_diario WHERE " + " AND ".join(where_resumen) +
+        " UNION ALL "
+        "SELECT COUNT(*), COALESCE(SUM(subtotal_bruto_sin_itbis),0), COALESCE(SUM(itbis_total_venta),0), "
+        "COALESCE(SUM(descuento_aplicado),0), COALESCE(SUM(total_neto),0) "
+        "FROM ventas WHERE " + " AND ".join(where_hoy),
+        params_resumen + params_hoy
+    )
+    return {
+        'cantidad': sum(int(f['cantidad'] or 0) for f in filas),
+        'subtotal_bruto_sin_itbis': sum(float(f['subtotal'] or 0.0) for f in filas),
+        'itbis_total': sum(float(f['itbis'] or 0.0) for f in filas),
+        'descuento_total': sum(float(f['descuento'] or 0.0) for f in filas),
+        'total_periodo': sum(float(f['total'] or 0.0) for f in filas),
+    }
+
+
+def obtener_total_ventas_periodo(fecha_inicio_str: Optional[str] = None, fecha_fin_str: Optional[str] = None) -> Dict:
+    """Cantidad de ventas y total neto del periodo (más subtotal, ITBIS y descuento),
+    leídos del resumen diario; solo las ventas de hoy se suman desde `ventas`.
+
+    Si el resumen no se ha reconstruido o quedó desfasado, la cantidad puede no
+    coincidir con las filas de `iterar_ventas_periodo`: úsese como estimación.
+    """
+    return _totales_ventas(fecha_inicio_str, fecha_fin_str)
+
+
+def reconstruir_resumen_diario(fecha_inicio_str: Optional[str] = None, fecha_fin_str: Optional[str] = None) -> Dict:
+    """Recalcula `ventas_resumen_diario` a partir de `ventas` (todo el historial o los días
+    del rango, inclusive). Sirve para llenar la tabla en instalaciones existentes."""
+    where_dia, where_fecha, params_dia, params_fecha = "", "", [], []
+    if fecha_inicio_str and fecha_fin_str:
+        inicio, fin = _rango_fechas_sargable(fecha_inicio_str, fecha_fin_str)
+        where_dia, params_dia = " WHERE dia >= %s AND dia < %s", [inicio.date(), fin.date()]
+        where_fecha, params_fecha = " WHERE fecha >= %s AND fecha < %s", [inicio, fin]
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM ventas_resumen_diario" + where_dia, params_dia)
+        cur.execute(
+            "INSERT INTO ventas_resumen_diario "
+            "(dia, cantidad_ventas, subtotal_bruto_sin_itbis, itbis_total, descuento_total, total_neto) "
+            "SELECT DATE(fecha), COUNT(*), SUM(subtotal_bruto_sin_itbis), SUM(itbis_total_venta), "
+            "SUM(descuento_aplicado), SUM(total_neto) FROM ventas" + where_fecha + " GROUP BY DATE(fecha)",
+            params_fecha
+        )
+        dias = cur.rowcount
+    return {"exito": True, "mensaje": f"Resumen diario reconstruido: {dias} día(s) con ventas.", "dias": dias}
+
+
+def iterar_ventas_periodo(fecha_inicio_str: Optional[str] = None, fecha_fin_str: Optional[str] = None, lote: int = 1000) -> Iterator[Dict]:
+    """Genera las ventas del periodo en orden cronológico, de `lote` en `lote` (keyset por fecha, id).
+
+    Pensado para exportaciones: solo hay un lote en memoria y cada consulta usa el
+    índice de fecha, sin OFFSET. No incluye el detalle de productos.
+    """
+    params_base = []
+    where_base = []
+    if fecha_inicio_str and fecha_fin_str:
+        where_base.append("v.fecha >= %s AND v.fecha < %s")
+        params_base.extend(_rango_fechas_sargable(fecha_inicio_str, fecha_fin_str))
+    cursor = None
+    while True:
+        where, params = list(where_base), list(params_base)
+        if cursor:
+            where.append("(v.fecha > %s OR (v.fecha = %s AND v.id > %s))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where_clause = (" WHERE " + " AND ".join(where)) if where else ""
+        filas = fetch_all(
+            "SELECT v.id, v.fecha, v.subtotal_bruto_sin_itbis, v.itbis_total_venta, v.descuento_aplicado, v.total_neto, "
+            "COALESCE(c.nombre,'Consumidor Final') AS nombre_cliente "
+            "FROM ventas v LEFT JOIN clientes c ON c.id=v.cliente_id" + where_clause +
+            " ORDER BY v.fecha, v.id LIMIT %s",
+            params + [int(lote)]
+        )
+        for v in filas:
+            yield {
+                'id_venta': v['id'], 'fecha': v['fecha'].strftime('%Y-%m-%d %H:%M:%S'), 'nombre_cliente': v['nombre_cliente'],
+                'subtotal_bruto_sin_itbis': float(v['subtotal_bruto_sin_itbis']),
+                'itbis_total_venta': float(v['itbis_total_venta']),
+                'descuento_aplicado': float(v['descuento_aplicado']),
+                'total_final': float(v['total_neto']),
+            }
+        if len(filas) < lote:
+            return
+        cursor = (filas[-1]['fecha'], filas[-1]['id'])
+
+
+def obtener_metricas_dashboard(fecha_str: Optional[str] = None) -> Dict:
+    """Contadores de la pantalla de inicio en una sola ida a la DB (solo agregados).
+    `fecha_str` ('YYYY-MM-DD', por defecto hoy) define el día de 'ventas del día'.
+    """
+    fecha_str = fecha_str or datetime.date.today().strftime('%Y-%m-%d')
+    inicio, fin = _rango_fechas_sargable(fecha_str, fecha_str)
+    r = fetch_one(
+        "SELECT "
+        "(SELECT COUNT(*) FROM productos) AS productos, "
+        "(SELECT COUNT(*) FROM clientes) AS clientes, "
+        "(SELECT COUNT(*) FROM proveedores) AS proveedores, "
+        # Día cerrado: una fila del resumen; día en curso: rango de hoy en ventas (ver _totales_ventas)
+        "(SELECT COALESCE(SUM(cantidad_ventas),0) FROM ventas_resumen_diario WHERE dia = %s AND dia < CURDATE()) + "
+        "(SELECT COUNT(*) FROM ventas WHERE fecha >= %s AND fecha < %s AND fecha >= CURDATE()) AS ventas_dia, "
+        "(SELECT COALESCE(SUM(total_neto),0) FROM ventas_resumen_diario WHERE dia = %s AND dia < CURDATE()) + "
+        "(SELECT COALESCE(SUM(total_neto),0) FROM ventas WHERE fecha >= %s AND fecha < %s AND fecha >= CURDATE()) AS total_dia",
+        (inicio.date(), inicio, fin, inicio.date(), inicio, fin)
+    ) or {}
+    return {
+        'productos': int(r.get('productos') or 0),
+        'clientes': int(r.get('clientes') or 0),
+        'proveedores': int(r.get('proveedores') or 0),
+        'ventas_dia': int(r.get('ventas_dia') or 0),
+        'total_dia': float(r.get('total_dia') or 0.0),
     }
-    lineas = []
-    lineas.append(datos_empresa.get("nombre").center(42))
-    if datos_empresa.get("direccion"):
-        lineas.append(datos_empresa["direccion"].center(42))
-    if datos_empresa.get("telefono"):
-        lineas.append(f"Tel: {datos_empresa['telefono']}")
-    if datos_empresa.get("rnc"):
-        lineas.append(f"RNC: {datos_empresa['rnc']}")
-    lineas.append("-" * 42)
-    lineas.append(f"Factura #: {datos_venta.get('id', 'N/A')}")
-    lineas.append(f"Fecha: {datos_venta.get('fecha')}")
-    lineas.append(f"Cliente: {nombre_cliente_str}")
-    lineas.append("-" * 42)
-    lineas.append("Producto                Cant.       Total")
-    lineas.append("-" * 42)
-    for item in datos_venta.get('productos', []):
-        nombre = (item.get('nombre') or '')[:20].ljust(20)
-        cantidad = f"{float(item.get('cantidad', 0)):.2f}".rjust(8)
-        subtotal = f"{float(item.get('subtotal', 0.0)):.2f}".rjust(10)
-        lineas.append(f"{nombre}{cantidad}{subtotal}")
-    lineas.append("-" * 42)
-    lineas.append(f"Subtotal: RD$ {datos_venta.get('subtotal_bruto_con_itbis', 0.0):.2f}")
-    lineas.append(f"Descuento: RD$ {datos_venta.get('descuento_aplicado', 0.0):.2f}")
-    lineas.append(f"Total: RD$ {datos_venta.get('total_neto', 0.0):.2f}")
-    lineas.append(f"ITBIS: RD$ {datos_venta.get('itbis_total_venta', 0.0):.2f}")
-    lineas.append("-" * 42)
-    lineas.append("¡Gracias por su compra!".center(42))
-    return "\n".join(lineas)
+
+
+def generar_texto_factura(datos_venta: Dict, nombre_cliente_str: str = "Consumidor Final", datos_empresa: Optional[Dict] = None, ancho: int = ANCHO_PREDETERMINADO) -> str:
+    """Construye un bloque de texto listo para imprimir o guardar (ver Modulos.PlantillaFactura)."""
+    return plantilla_para(datos_empresa, ancho).renderizar(datos_venta, nombre_cliente_str)
+
+
+def generar_textos_factura_lote(ventas: List[Dict], datos_empresa: Optional[Dict] = None, ancho: int = ANCHO_PREDETERMINADO) -> List[str]:
+    """Facturas de varias ventas con una sola plantilla. Cada venta puede traer 'nombre_cliente'."""
+    return plantilla_para(datos_empresa, ancho).renderizar_lote(
+        (v, v.get('nombre_cliente') or "Consumidor Final") for v in ventas
+    )
 
 
 # --------------------- Usuarios ---------------------
@@ -491,6 +1293,12 @@ def obtener_configuracion_app() -> Optional[Dict]:
         "colores_botones": colores if isinstance(colores, dict) else {}
     }
 
+_COLUMNAS_CONFIGURACION_APP = (
+    "id", "tema", "empresa_nombre", "empresa_rnc", "empresa_direccion", "empresa_ciudad",
+    "empresa_telefono", "empresa_correo", "empresa_tagline", "logo_path", "colores_json",
+)
+
+
 def guardar_configuracion_app(config: Dict) -> Dict:
     """
     Guarda (upsert) la configuracion completa. Espera el mismo payload que maneja la GUI.
@@ -510,45 +1318,15 @@ def guardar_configuracion_app(config: Dict) -> Dict:
         (empresa.get("logo_path") or "").strip(),
         colores_json,
     )
-    sql = (
-        "INSERT INTO configuracion_app "
-        "(id, tema, empresa_nombre, empresa_rnc, empresa_direccion, empresa_ciudad, "
-        "empresa_telefono, empresa_correo, empresa_tagline, logo_path, colores_json) "
-        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
-        "ON DUPLICATE KEY UPDATE "
-        "tema=VALUES(tema), "
-        "empresa_nombre=VALUES(empresa_nombre), "
-        "empresa_rnc=VALUES(empresa_rnc), "
-        "empresa_direccion=VALUES(empresa_direccion), "
-        "empresa_ciudad=VALUES(empresa_ciudad), "
-        "empresa_telefono=VALUES(empresa_telefono), "
-        "empresa_correo=VALUES(empresa_correo), "
-        "empresa_tagline=VALUES(empresa_tagline), "
-        "logo_path=VALUES(logo_path), "
-        "colores_json=VALUES(colores_json)"
-    )
+    sql = sql_upsert("configuracion_app", _COLUMNAS_CONFIGURACION_APP, ("id",), reemplazar=_COLUMNAS_CONFIGURACION_APP[1:])
     try:
         execute(sql, params)
     except Exception as exc:
         if "colores_json" not in str(exc).lower():
             raise
         # Compatibilidad con esquemas antiguos sin la columna colores_json
-        legacy_sql = (
-            "INSERT INTO configuracion_app "
-            "(id, tema, empresa_nombre, empresa_rnc, empresa_direccion, empresa_ciudad, "
-            "empresa_telefono, empresa_correo, empresa_tagline, logo_path) "
-            "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) "
-            "ON DUPLICATE KEY UPDATE "
-            "tema=VALUES(tema), "
-            "empresa_nombre=VALUES(empresa_nombre), "
-            "empresa_rnc=VALUES(empresa_rnc), "
-            "empresa_direccion=VALUES(empresa_direccion), "
-            "empresa_ciudad=VALUES(empresa_ciudad), "
-            "empresa_telefono=VALUES(empresa_telefono), "
-            "empresa_correo=VALUES(empresa_correo), "
-            "empresa_tagline=VALUES(empresa_tagline), "
-            "logo_path=VALUES(logo_path)"
-        )
+        columnas = _COLUMNAS_CONFIGURACION_APP[:-1]
+        legacy_sql = sql_upsert("configuracion_app", columnas, ("id",), reemplazar=columnas[1:])
         legacy_params = params[:-1]
         execute(legacy_sql, legacy_params)
         print("Advertencia: la columna colores_json no está presente en configuracion_app. "
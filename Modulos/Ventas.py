@@ -1,13 +1,20 @@
-"""Operaciones de ventas respaldadas por la base de datos."""
+"""Operaciones de ventas respaldadas por la base de datos.
+
+Reconstruir el resumen diario de ventas (todo el historial o un rango de días):
+    python -m Modulos.Ventas reconstruir-resumen [YYYY-MM-DD YYYY-MM-DD]
+"""
 
 from __future__ import annotations
 
+import sys
+
 from typing import Dict, List, Optional
 
 from Modulos.Repo import (
     procesar_nueva_venta_gui as _procesar_nueva_venta_gui,
     obtener_ventas_para_historial_gui as _obtener_ventas_para_historial_gui,
     obtener_venta_para_factura as _obtener_venta_para_factura,
+    reconstruir_resumen_diario as _reconstruir_resumen_diario,
     obtener_productos_para_gui,
     obtener_lista_clientes_para_combobox,
 )
@@ -15,6 +22,7 @@ from Modulos.Repo import (
 procesar_nueva_venta_gui = _procesar_nueva_venta_gui
 obtener_ventas_para_historial_gui = _obtener_ventas_para_historial_gui
 obtener_venta_para_factura = _obtener_venta_para_factura
+reconstruir_resumen_diario = _reconstruir_resumen_diario
 
 
 def nueva_venta():
@@ -144,3 +152,10 @@ def nueva_venta():
             print(f"Venta #{venta.get('id')} registrada. Total: RD$ {venta.get('total_neto', 0.0):.2f} | Cambio: RD$ {cambio:.2f}")
     else:
         print(f"❌ {resultado.get('mensaje')}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (2, 4) and sys.argv[1] == "reconstruir-resumen":
+        print(reconstruir_resumen_diario(*sys.argv[2:4])["mensaje"])
+    else:
+        print("Uso: python -m Modulos.Ventas reconstruir-resumen [YYYY-MM-DD YYYY-MM-DD]")
@@ -0,0 +1,366 @@
+"""Ventas sin conexión: diario local en SQLite y sincronización en segundo plano.
+
+Si el servidor de base de datos no responde, la venta se valida contra el último
+catálogo cargado en memoria, se anota en `Facturas/offline/diario.sqlite3` con su
+clave de idempotencia y recibe un número provisional (PROV-<terminal>-000123) para
+la factura. Un hilo revisa la conexión cada pocos segundos y, cuando la DB vuelve,
+reenvía las ventas en lotes y en el orden en que se hicieron
+(ver `Repo.sincronizar_ventas_offline`). La clave evita duplicados si un lote se
+confirmó en la DB pero el diario no alcanzó a marcarlo. Una venta ya cobrada nunca se
+descarta: si falla al registrarse sigue pendiente y se reintenta con espera creciente.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from Modulos.DBUtil import DBConnectionError, es_error_conexion, fetch_one
+from Modulos.Repo import (
+    procesar_nueva_venta_gui, sincronizar_ventas_offline, descontar_stock_sin_conexion, reservar_stock_sin_conexion,
+)
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_SINCRONIZADA = "sincronizada"
+
+INTERVALO_SINCRONIZACION = 5.0  # segundos entre revisiones de la conexión
+LOTE_SINCRONIZACION = 50  # ventas por transacción al sincronizar
+REINTENTOS_EN_LINEA = 1  # reintentos con la misma clave si la conexión se corta a mitad de la venta
+ESPERA_REINTENTO_BASE = 30.0  # segundos antes de reintentar una venta que falló al sincronizar
+ESPERA_REINTENTO_MAX = 3600.0
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ventas_pendientes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    numero_provisional TEXT,
+    fecha TEXT NOT NULL,
+    nombre_cliente TEXT,
+    datos TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    venta_id INTEGER,
+    mensaje TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo_intento REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_ventas_pendientes_estado ON ventas_pendientes (estado, id);
+"""
+
+
+def _nombre_terminal() -> str:
+    """Identificador corto de la caja para los números provisionales (TERMINAL_ID o nombre del equipo)."""
+    nombre = os.environ.get("TERMINAL_ID") or platform.node()
+    return "".join(c for c in nombre.upper() if c.isalnum())[:10] or "CAJA"
+
+
+class DiarioVentas:
+    """Diario SQLite de ventas hechas sin conexión (seguro entre hilos del mismo proceso).
+
+    Las ventas sincronizadas se conservan con su id definitivo, así se puede saber a qué
+    venta corresponde cada número provisional.
+    """
+
+    def __init__(self, ruta: str = os.path.join("Facturas", "offline", "diario.sqlite3")):
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self.ruta = ruta
+        self.terminal = _nombre_terminal()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # la venta ya se cobró: no perderla ante un corte
+        self._conn.executescript(_ESQUEMA)
+
+    def registrar(self, clave: str, venta: Dict, nombre_cliente: str) -> Dict:
+        """Anota la venta (argumentos de procesar_nueva_venta_gui). Retorna la entrada con su número provisional."""
+        fecha = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO ventas_pendientes (clave, fecha, nombre_cliente, datos) VALUES (?,?,?,?)",
+                (clave, fecha, nombre_cliente, json.dumps(venta, ensure_ascii=False)),
+            )
+            numero = f"PROV-{self.terminal}-{cur.lastrowid:06d}"
+            self._conn.execute("UPDATE ventas_pendientes SET numero_provisional=? WHERE id=?", (numero, cur.lastrowid))
+        return {'id': cur.lastrowid, 'clave': clave, 'numero_provisional': numero, 'fecha': fecha,
+                'nombre_cliente': nombre_cliente, 'venta': venta}
+
+    def por_clave(self, clave: str) -> Optional[Dict]:
+        """Entrada ya anotada con esa clave de idempotencia, o None."""
+        with self._lock:
+            f = self._conn.execute(
+                "SELECT id, clave, numero_provisional, fecha, nombre_cliente, datos FROM ventas_pendientes WHERE clave=?",
+                (clave,),
+            ).fetchone()
+        if f is None:
+            return None
+        return {
+            'id': f['id'], 'clave': f['clave'], 'numero_provisional': f['numero_provisional'], 'fecha': f['fecha'],
+            'nombre_cliente': f['nombre_cliente'], 'venta': json.loads(f['datos']),
+        }
+
+    def pendientes(self, limite: int = LOTE_SINCRONIZACION) -> List[Dict]:
+        """Ventas por sincronizar, en el orden en que se hicieron (sin las que esperan un reintento)."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT id, clave, numero_provisional, fecha, nombre_cliente, datos, intentos FROM ventas_pendientes "
+                "WHERE estado=? AND proximo_intento <= ? ORDER BY id LIMIT ?",
+                (ESTADO_PENDIENTE, time.time(), int(limite)),
+            ).fetchall()
+        return [{
+            'id': f['id'], 'clave': f['clave'], 'numero_provisional': f['numero_provisional'], 'fecha': f['fecha'],
+            'nombre_cliente': f['nombre_cliente'], 'venta': json.loads(f['datos']), 'intentos': f['intentos'],
+        } for f in filas]
+
+    def marcar(self, resultados: List[Dict]):
+        """Aplica los resultados de Repo.sincronizar_ventas_offline: las registradas pasan a
+        sincronizada; las que fallaron siguen pendientes con el error y la hora del próximo intento."""
+        ahora = time.time()
+        with self._lock, self._conn:
+            for r in resultados:
+                if r['exito']:
+                    self._conn.execute(
+                        "UPDATE ventas_pendientes SET estado=?, venta_id=?, mensaje=NULL WHERE clave=?",
+                        (ESTADO_SINCRONIZADA, r['venta_id'], r['clave']),
+                    )
+                    continue
+                intentos = self._conn.execute(
+                    "SELECT intentos FROM ventas_pendientes WHERE clave=?", (r['clave'],)
+                ).fetchone()['intentos'] + 1
+                espera = min(ESPERA_REINTENTO_MAX, ESPERA_REINTENTO_BASE * (2 ** (intentos - 1)))
+                self._conn.execute(
+                    "UPDATE ventas_pendientes SET intentos=?, proximo_intento=?, mensaje=? WHERE clave=?",
+                    (intentos, ahora + espera, r.get('mensaje'), r['clave']),
+                )
+
+    def reintentar_ahora(self):
+        """Quita la espera de las ventas que fallaron (p. ej. tras corregir el problema en la DB)."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE ventas_pendientes SET proximo_intento=0 WHERE estado=?", (ESTADO_PENDIENTE,))
+
+    def conteo(self) -> Dict[str, int]:
+        """Ventas por estado, más 'con_error': pendientes cuyo último intento falló."""
+        with self._lock:
+            filas = self._conn.execute("SELECT estado, COUNT(*) FROM ventas_pendientes GROUP BY estado").fetchall()
+            con_error = self._conn.execute(
+                "SELECT COUNT(*) FROM ventas_pendientes WHERE estado=? AND intentos > 0", (ESTADO_PENDIENTE,)
+            ).fetchone()[0]
+        conteo = {estado: cantidad for estado, cantidad in filas}
+        conteo['con_error'] = con_error
+        return conteo
+
+    def productos_pendientes(self) -> List[Dict]:
+        """Productos vendidos (items_vendidos) de todas las ventas aún sin sincronizar."""
+        with self._lock:
+            filas = self._conn.execute("SELECT datos FROM ventas_pendientes WHERE estado=?", (ESTADO_PENDIENTE,)).fetchall()
+        return [it for f in filas for it in (json.loads(f['datos']).get('items_vendidos') or [])]
+
+    def hay_pendientes(self) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM ventas_pendientes WHERE estado=? LIMIT 1", (ESTADO_PENDIENTE,)
+            ).fetchone() is not None
+
+
+def _venta_provisional(entrada: Dict) -> Dict:
+    """Venta con el formato de Repo._venta_para_factura para imprimir la factura provisional."""
+    venta = entrada['venta']
+    bruto_sin_itbis = float(venta.get('total_bruto_sin_itbis', 0.0))
+    itbis = float(venta.get('itbis_total_venta', 0.0))
+    return {
+        'id': entrada['numero_provisional'], 'fecha': entrada['fecha'], 'cliente_id': venta.get('cliente_id_seleccionado'),
+        'productos': [
+            {
+                'nombre': it.get('nombre'), 'cantidad': float(it.get('cantidad', 0)),
+                'precio_unitario': float(it.get('precio_unitario', 0.0)), 'subtotal': float(it.get('subtotal', 0.0)),
+                'itbis_item_total': float(it.get('itbis_item_total', 0.0)),
+            } for it in venta.get('items_vendidos', [])
+        ],
+        'subtotal_bruto_sin_itbis': bruto_sin_itbis,
+        'itbis_total_venta': itbis,
+        'subtotal_bruto_con_itbis': bruto_sin_itbis + itbis,
+        'descuento_aplicado': float(venta.get('descuento_aplicado', 0.0)),
+        'total_neto': float(venta.get('total_neto', 0.0)),
+        'dinero_recibido': venta.get('dinero_recibido'),
+        'cambio_devuelto': venta.get('cambio_devuelto'),
+    }
+
+
+class VentasOffline:
+    """Registra ventas en la DB o, sin conexión, en el diario local; sincroniza en un hilo propio.
+
+    `al_sincronizar(entrada, venta_id)` se llama desde el hilo de sincronización por cada
+    venta provisional que quedó registrada en la DB (p. ej. para archivar la factura definitiva).
+    `estado()` se puede consultar desde el hilo de Tk.
+    """
+
+    def __init__(
+        self,
+        diario: Optional[DiarioVentas] = None,
+        al_sincronizar: Optional[Callable[[Dict, int], None]] = None,
+        intervalo: float = INTERVALO_SINCRONIZACION,
+        lote: int = LOTE_SINCRONIZACION,
+    ):
+        self.diario = diario or DiarioVentas()
+        # Ventas de una sesión anterior sin sincronizar: su stock ya no está disponible
+        reservar_stock_sin_conexion(self.diario.productos_pendientes())
+        self.al_sincronizar = al_sincronizar
+        self.intervalo = float(intervalo)
+        self.lote = int(lote)
+        self._cond = threading.Condition()
+        self._sin_conexion = False
+        self._ultimo_error: Optional[str] = None
+        self._detenido = False
+        self._hilo = threading.Thread(target=self._procesar, name="sincronizar-ventas", daemon=True)
+        self._hilo.start()
+
+    # --- Ventas ---
+    def procesar_venta(self, nombre_cliente: str = "Consumidor Final", clave_idempotencia: Optional[str] = None, **venta) -> Dict:
+        """Mismos argumentos y resultado que procesar_nueva_venta_gui. Sin conexión el resultado
+        trae 'offline': True y 'venta_registrada' lleva el número provisional como id.
+
+        Si la conexión se corta a mitad de la venta (p. ej. durante el COMMIT) la venta pudo
+        quedar registrada; como se repite con la misma clave, el reintento y luego el diario
+        reciben la venta ya confirmada en lugar de duplicarla.
+        """
+        clave = clave_idempotencia or uuid.uuid4().hex
+        if not self._sin_conexion:
+            for _ in range(REINTENTOS_EN_LINEA + 1):
+                try:
+                    return procesar_nueva_venta_gui(clave_idempotencia=clave, **venta)
+                except Exception as e:
+                    if not es_error_conexion(e):
+                        raise
+                    error = e
+                    if isinstance(e, DBConnectionError):
+                        break  # el servidor no acepta conexiones: reintentar solo agrega espera
+            self._marcar_sin_conexion(error)
+        return self._registrar_sin_conexion(clave, venta, nombre_cliente)
+
+    def _registrar_sin_conexion(self, clave: str, venta: Dict, nombre_cliente: str) -> Dict:
+        items = venta.get('items_vendidos') or []
+        if not items:
+            return {'exito': False, 'mensaje': "La venta no tiene productos."}
+        entrada = self.diario.por_clave(clave)
+        if entrada is not None:
+            # Mismo carrito enviado otra vez: no se anota ni se descuenta stock de nuevo
+            return {
+                'exito': True, 'offline': True, 'repetida': True,
+                'mensaje': f"La venta ya estaba guardada en esta caja como {entrada['numero_provisional']}.",
+                'venta_registrada': _venta_provisional(entrada), 'stock_actualizado': {},
+            }
+        reserva = descontar_stock_sin_conexion(items)
+        if not reserva['exito']:
+            return reserva
+        entrada = self.diario.registrar(clave, venta, nombre_cliente)
+        return {
+            'exito': True, 'offline': True,
+            'mensaje': (f"Sin conexión con la base de datos: la venta se guardó en esta caja como "
+                        f"{entrada['numero_provisional']} y se registrará al volver la conexión."),
+            'venta_registrada': _venta_provisional(entrada),
+            'stock_actualizado': reserva['stock_actualizado'],
+        }
+
+    # --- Estado ---
+    def estado(self) -> Dict:
+        """{'sin_conexion': bool, 'pendientes': n, 'con_error': n, 'ultimo_error': str | None}"""
+        conteo = self.diario.conteo()
+        with self._cond:
+            return {
+                'sin_conexion': self._sin_conexion,
+                'pendientes': conteo.get(ESTADO_PENDIENTE, 0),
+                'con_error': conteo.get('con_error', 0),
+                'ultimo_error': self._ultimo_error,
+            }
+
+    def sincronizar_ahora(self, reintentar_errores: bool = False):
+        """Despierta el hilo de sincronización; con reintentar_errores=True también reenvía
+        ya las ventas que fallaron en vez de esperar su próximo intento."""
+        if reintentar_errores:
+            self.diario.reintentar_ahora()
+        with self._cond:
+            self._cond.notify()
+
+    def detener(self):
+        """Detiene el hilo; lo pendiente queda en el diario para la próxima vez."""
+        with self._cond:
+            self._detenido = True
+            self._cond.notify()
+
+    def _marcar_sin_conexion(self, error: Exception):
+        with self._cond:
+            if not self._sin_conexion:
+                print(f"Advertencia: sin conexión con la DB, las ventas se guardan en el diario local: {error}")
+            self._sin_conexion = True
+            self._ultimo_error = str(error)
+
+    # --- Hilo de sincronización ---
+    def _procesar(self):
+        while True:
+            with self._cond:
+                if self._detenido:
+                    return
+                self._cond.wait(self.intervalo)
+                if self._detenido:
+                    return
+            try:
+                self._sincronizar()
+            except Exception as e:
+                with self._cond:
+                    self._ultimo_error = str(e)
+                print(f"Advertencia: falló la sincronización de ventas sin conexión: {e}")
+
+    def _sincronizar(self):
+        if not self._sin_conexion and not self.diario.hay_pendientes():
+            return
+        try:
+            fetch_one("SELECT 1")
+        except Exception as e:
+            if es_error_conexion(e):
+                self._marcar_sin_conexion(e)
+                return
+            raise
+        with self._cond:
+            self._sin_conexion = False
+            self._ultimo_error = None
+        while not self._detenido:
+            lote = self.diario.pendientes(self.lote)
+            if not lote:
+                return
+            try:
+                resultados = sincronizar_ventas_offline(
+                    [{'clave': e['clave'], 'fecha': e['fecha'], 'venta': e['venta']} for e in lote]
+                )
+            except Exception as e:
+                if es_error_conexion(e):
+                    self._marcar_sin_conexion(e)
+                    return
+                raise
+            self.diario.marcar(resultados)
+            for entrada, r in zip(lote, resultados):
+                self._notificar_resultado(entrada, r)
+            if len(lote) < self.lote:
+                return
+
+    def _notificar_resultado(self, entrada: Dict, resultado: Dict):
+        numero = entrada['numero_provisional']
+        if not resultado['exito']:
+            print(f"Advertencia: la venta {numero} no se pudo sincronizar (intento {entrada.get('intentos', 0) + 1}), "
+                  f"sigue pendiente y se reintentará: {resultado.get('mensaje')}")
+            return
+        for aviso in resultado.get('avisos') or []:
+            print(f"Advertencia: venta {numero}: {aviso}")
+        if resultado.get('faltantes'):
+            print(f"Advertencia: la venta {numero} se registró con faltante de stock (ajustado a 0): {resultado['faltantes']}")
+        if self.al_sincronizar:
+            try:
+                self.al_sincronizar(entrada, resultado['venta_id'])
+            except Exception as e:
+                print(f"Advertencia: no se pudo procesar la venta sincronizada {numero}: {e}")
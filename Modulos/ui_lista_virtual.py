@@ -0,0 +1,268 @@
+"""Lista virtual sobre ttk.Treeview para tablas con miles de filas.
+
+El Treeview solo contiene las filas que caben en pantalla; los datos viven en una
+lista de Python y el desplazamiento, la selección, las filas alternas y el orden
+se calculan sobre esa lista. Usa el estilo 'Treeview' de `Modulos.ui_styles`.
+"""
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+FLECHA_ASC = " ▲"
+FLECHA_DESC = " ▼"
+
+
+class ListaVirtual(ttk.Frame):
+    """Treeview que materializa solo la ventana visible de `filas`.
+
+    - formatear(fila) -> tupla de valores a mostrar (una por columna).
+    - al_seleccionar(fila | None): se llama cuando el usuario cambia la selección.
+    - al_llegar_al_final(): se llama cuando la vista muestra la última fila (paginación).
+    Las cabeceras y anchos se configuran como siempre sobre `self.tree`.
+    """
+
+    PASO_RUEDA = 3
+
+    def __init__(self, parent, columnas: Sequence[str], formatear: Callable[[Any], Sequence],
+                 colores: Optional[Dict[str, str]] = None,
+                 al_seleccionar: Optional[Callable[[Any], None]] = None,
+                 al_llegar_al_final: Optional[Callable[[], None]] = None,
+                 mensaje_vacio: str = "", **kwargs):
+        super().__init__(parent, **kwargs)
+        self.columnas = tuple(columnas)
+        self.tree = ttk.Treeview(self, columns=self.columnas, show="headings", selectmode="browse", height=1)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self._formatear = formatear
+        self._al_seleccionar = al_seleccionar
+        self._al_llegar_al_final = al_llegar_al_final
+        self.mensaje_vacio = mensaje_vacio
+        self._filas: List[Any] = []
+        self._inicio = 0
+        self._visibles = 10
+        self._slots: List[str] = []
+        self._seleccion: Optional[int] = None
+        self._encabezados: Dict[str, str] = {}
+        self._claves_orden: Dict[str, Callable[[Any], Any]] = {}
+        self._orden: List[tuple] = []  # [(columna, descendente)] en orden de prioridad
+
+        colores = colores or {}
+        self.tree.tag_configure('evenrow', background=colores.get('panel', '#ffffff'), foreground=colores.get('text', '#000000'))
+        self.tree.tag_configure('oddrow', background=colores.get('panel_alt', '#f4f6fb'), foreground=colores.get('text', '#000000'))
+        try:
+            self._alto_fila = int(ttk.Style(self).lookup('Treeview', 'rowheight') or 20)
+        except (tk.TclError, ValueError):
+            self._alto_fila = 20
+
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<Shift-Button-1>", self._on_shift_click)
+        self.tree.bind("<MouseWheel>", self._on_rueda)
+        self.tree.bind("<Button-4>", lambda e: self._desplazar(-self.PASO_RUEDA))
+        self.tree.bind("<Button-5>", lambda e: self._desplazar(self.PASO_RUEDA))
+        for tecla, paso in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-pagina"), ("<Next>", "pagina"),
+                            ("<Home>", "inicio"), ("<End>", "fin")):
+            self.tree.bind(tecla, lambda e, p=paso: self._on_tecla(p))
+
+    # --- Datos ---
+    @property
+    def filas(self) -> List[Any]:
+        """Filas en el orden mostrado (no modificar directamente)."""
+        return self._filas
+
+    def set_filas(self, filas: Sequence[Any]):
+        """Reemplaza los datos; conserva el orden de columna activo."""
+        self._filas = list(filas)
+        self._aplicar_orden()
+        self._inicio = 0
+        self._seleccion = None
+        self._renderizar()
+
+    def agregar_filas(self, filas: Sequence[Any]):
+        """Agrega filas (p. ej. otra página) sin mover la vista ni perder la selección."""
+        if not filas:
+            return
+        seleccionada = self.seleccion()
+        self._filas.extend(filas)
+        if self._orden:
+            self._aplicar_orden()
+            self._seleccion = self._indice_de(seleccionada)
+        self._renderizar()
+
+    def limpiar(self):
+        self.set_filas([])
+
+    def seleccion(self) -> Optional[Any]:
+        if self._seleccion is None or self._seleccion >= len(self._filas):
+            return None
+        return self._filas[self._seleccion]
+
+    def _indice_de(self, fila) -> Optional[int]:
+        if fila is None:
+            return None
+        for i, f in enumerate(self._filas):
+            if f is fila:
+                return i
+        return None
+
+    # --- Orden ---
+    def habilitar_orden(self, encabezados: Dict[str, str], claves: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        """Ordena al pulsar cabeceras (Shift+clic agrega columnas secundarias).
+        `claves` da claves tipadas por columna; el resto usa el texto mostrado."""
+        self._encabezados = dict(encabezados)
+        self._claves_orden = dict(claves or {})
+        for col in self._encabezados:
+            self.tree.heading(col, command=lambda c=col: self.ordenar_por(c))
+
+    def ordenar_por(self, col: str, agregar: bool = False):
+        """Clic: ordena por col (alterna asc/desc). agregar=True: col pasa a ser criterio secundario."""
+        orden = list(self._orden)
+        posicion = next((i for i, (c, _) in enumerate(orden) if c == col), None)
+        if agregar:
+            if posicion is None:
+                orden.append((col, False))
+            else:
+                orden[posicion] = (col, not orden[posicion][1])
+        else:
+            orden = [(col, posicion == 0 and not orden[0][1])]
+        seleccionada = self.seleccion()
+        self._orden = orden
+        self._aplicar_orden()
+        self._seleccion = self._indice_de(seleccionada)
+        prioridad = {c: (i, desc) for i, (c, desc) in enumerate(orden)}
+        for c, texto in self._encabezados.items():
+            flecha = ""
+            if c in prioridad:
+                i, desc = prioridad[c]
+                flecha = (FLECHA_DESC if desc else FLECHA_ASC) + (str(i + 1) if len(orden) > 1 else "")
+            self.tree.heading(c, text=f"{texto}{flecha}")
+        self._renderizar()
+
+    def _aplicar_orden(self):
+        # sort() es estable: aplicar de la columna menos prioritaria a la principal
+        for col, descendente in reversed(self._orden):
+            clave = self._claves_orden.get(col)
+            if clave is None:
+                pos = self.columnas.index(col)
+                clave = lambda fila, pos=pos: str(self._formatear(fila)[pos]).casefold()
+            self._filas.sort(key=clave, reverse=descendente)
+
+    # --- Vista ---
+    def _renderizar(self):
+        total = len(self._filas)
+        self._inicio = max(0, min(self._inicio, total - self._visibles))
+        n = min(self._visibles, total - self._inicio)
+        vacio = total == 0 and bool(self.mensaje_vacio)
+        if vacio:
+            n = 1
+        while len(self._slots) < n:
+            self._slots.append(self.tree.insert("", tk.END, iid=f"fila{len(self._slots)}"))
+        while len(self._slots) > n:
+            self.tree.delete(self._slots.pop())
+
+        slot_seleccionado = None
+        if vacio:
+            self.tree.item(self._slots[0], values=(self.mensaje_vacio,), tags=('evenrow',))
+        else:
+            for pos, iid in enumerate(self._slots):
+                idx = self._inicio + pos
+                self.tree.item(iid, values=tuple(self._formatear(self._filas[idx])),
+                               tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+                if idx == self._seleccion:
+                    slot_seleccionado = iid
+        if slot_seleccionado:
+            self.tree.selection_set(slot_seleccionado)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+
+        if total:
+            self.scrollbar.set(self._inicio / total, (self._inicio + n) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        if total and self._inicio + n >= total and self._al_llegar_al_final:
+            self.after_idle(self._al_llegar_al_final)
+
+    def _desplazar(self, filas: int):
+        inicio = self._inicio
+        self._inicio = max(0, min(self._inicio + filas, len(self._filas) - self._visibles))
+        if self._inicio != inicio:
+            self._renderizar()
+        return "break"
+
+    def _asegurar_visible(self, idx: int):
+        if idx < self._inicio:
+            self._inicio = idx
+        elif idx >= self._inicio + self._visibles:
+            self._inicio = idx - self._visibles + 1
+
+    def _seleccionar(self, idx: Optional[int]):
+        self._seleccion = idx
+        if idx is not None:
+            self._asegurar_visible(idx)
+        self._renderizar()
+        if self._al_seleccionar:
+            self._al_seleccionar(self.seleccion())
+
+    # --- Eventos ---
+    def _on_configure(self, event):
+        encabezado = self._alto_fila
+        if self._slots:
+            bbox = self.tree.bbox(self._slots[0])
+            if bbox:
+                encabezado = bbox[1]
+        visibles = max(1, (event.height - encabezado) // self._alto_fila)
+        if visibles != self._visibles:
+            self._visibles = visibles
+            self._renderizar()
+
+    def _on_scrollbar(self, accion, valor, unidad=None):
+        total = len(self._filas)
+        if accion == "moveto":
+            self._inicio = int(float(valor) * total)
+        elif accion == "scroll":
+            paso = int(valor) * (self._visibles if unidad == "pages" else 1)
+            self._inicio += paso
+        self._renderizar()
+
+    def _on_shift_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "heading":
+            return self._on_click(event)
+        try:
+            col = self.columnas[int(self.tree.identify_column(event.x).lstrip("#")) - 1]
+        except (ValueError, IndexError):
+            return "break"
+        if col in self._encabezados:
+            self.ordenar_por(col, agregar=True)
+        return "break"
+
+    def _on_rueda(self, event):
+        return self._desplazar(-self.PASO_RUEDA if event.delta > 0 else self.PASO_RUEDA)
+
+    def _on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) in ("heading", "separator"):
+            return None
+        self.tree.focus_set()
+        iid = self.tree.identify_row(event.y)
+        if iid in self._slots and self._filas:
+            self._seleccionar(self._inicio + self._slots.index(iid))
+        return "break"
+
+    def _on_tecla(self, paso):
+        total = len(self._filas)
+        if not total:
+            return "break"
+        actual = self._seleccion if self._seleccion is not None else self._inicio - 1
+        if paso == "inicio":
+            nuevo = 0
+        elif paso == "fin":
+            nuevo = total - 1
+        elif paso == "pagina":
+            nuevo = actual + self._visibles
+        elif paso == "-pagina":
+            nuevo = actual - self._visibles
+        else:
+            nuevo = actual + paso
+        self._seleccionar(max(0, min(nuevo, total - 1)))
+        return "break"
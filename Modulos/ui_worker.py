@@ -0,0 +1,125 @@
+"""Ejecución de llamadas a la base de datos fuera del hilo de Tkinter.
+
+Tkinter no es seguro entre hilos: las funciones se ejecutan en un pool de hilos y
+los resultados vuelven al hilo de la interfaz por una cola que se revisa con
+`root.after`. Cada tarea puede llevar una `clave`; al enviar otra tarea con la
+misma clave, el resultado de la anterior se descarta (petición obsoleta).
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class TkWorker:
+    """Pool de hilos con entrega de resultados en el hilo de Tk."""
+
+    INTERVALO_MS = 30
+
+    def __init__(self, root, max_hilos: int = 3):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="db-worker")
+        self._resultados: "queue.Queue" = queue.Queue()
+        self._generaciones: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._sondeando = False
+        self._indicadores = []
+        self._cerrado = False
+
+    # --- Indicador de ocupado ---
+    def agregar_indicador(self, callback: Callable[[bool], None]):
+        """Registra un callback(ocupado: bool) llamado al empezar/terminar el trabajo pendiente."""
+        self._indicadores.append(callback)
+
+    def _notificar_ocupado(self, ocupado: bool):
+        for cb in list(self._indicadores):
+            try:
+                cb(ocupado)
+            except Exception as exc:
+                print(f"Advertencia: indicador de ocupado falló: {exc}")
+
+    @property
+    def ocupado(self) -> bool:
+        return self._pendientes > 0
+
+    # --- Envío y cancelación ---
+    def ejecutar(self, func: Callable, *args,
+                 al_terminar: Optional[Callable[[Any], None]] = None,
+                 al_fallar: Optional[Callable[[BaseException], None]] = None,
+                 clave: Optional[str] = None, **kwargs) -> None:
+        """Ejecuta func(*args, **kwargs) en segundo plano.
+
+        `al_terminar(resultado)` o `al_fallar(excepcion)` se llaman en el hilo de Tk,
+        salvo que la tarea haya quedado obsoleta (otra con la misma clave o `cancelar`).
+        Debe llamarse desde el hilo de Tk.
+        """
+        if self._cerrado:
+            return
+        generacion = None
+        if clave is not None:
+            with self._lock:
+                generacion = self._generaciones.get(clave, 0) + 1
+                self._generaciones[clave] = generacion
+
+        self._pendientes += 1
+        if self._pendientes == 1:
+            self._notificar_ocupado(True)
+
+        def tarea():
+            try:
+                resultado, error = func(*args, **kwargs), None
+            except BaseException as exc:
+                resultado, error = None, exc
+            self._resultados.put((clave, generacion, resultado, error, al_terminar, al_fallar))
+
+        self._executor.submit(tarea)
+        if not self._sondeando:
+            self._sondeando = True
+            self.root.after(self.INTERVALO_MS, self._sondear)
+
+    def cancelar(self, clave: str):
+        """Descarta el resultado de la tarea en curso con esa clave (la consulta no se interrumpe)."""
+        with self._lock:
+            self._generaciones[clave] = self._generaciones.get(clave, 0) + 1
+
+    def _vigente(self, clave, generacion) -> bool:
+        if clave is None:
+            return True
+        with self._lock:
+            return self._generaciones.get(clave) == generacion
+
+    def _sondear(self):
+        while True:
+            try:
+                clave, generacion, resultado, error, al_terminar, al_fallar = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            self._pendientes -= 1
+            if self._pendientes == 0:
+                self._notificar_ocupado(False)
+            if self._cerrado or not self._vigente(clave, generacion):
+                continue
+            try:
+                if error is None:
+                    if al_terminar:
+                        al_terminar(resultado)
+                elif al_fallar:
+                    al_fallar(error)
+                else:
+                    print(f"Advertencia: error en tarea de fondo ({clave or 'sin clave'}): {error}")
+            except Exception as exc:
+                print(f"Advertencia: error al entregar resultado de tarea de fondo: {exc}")
+
+        if self._pendientes > 0 and not self._cerrado:
+            try:
+                self.root.after(self.INTERVALO_MS, self._sondear)
+                return
+            except Exception:
+                pass
+        self._sondeando = False
+
+    def cerrar(self):
+        """Detiene la entrega de resultados; las consultas en curso terminan en segundo plano."""
+        self._cerrado = True
+        self._executor.shutdown(wait=False)
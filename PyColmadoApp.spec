@@ -5,8 +5,8 @@ a = Analysis(
     ['app_gui.py'],
     pathex=[],
     binaries=[],
-    datas=[],
-    hiddenimports=[],
+    datas=[('db/sistemaPy.sql', 'db')],
+    hiddenimports=['Modulos.DBSqlite'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,8 +1,4 @@
 ﻿import os 
-import platform
-import tempfile
-import shutil
-import subprocess
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext, colorchooser 
 import datetime
@@ -22,7 +18,8 @@ from Modulos.Repo import (
     obtener_clientes_para_tabla_gui,
     obtener_historial_compras_cliente_gui,
     # Ventas
-    procesar_nueva_venta_gui, obtener_ventas_para_historial_gui, generar_texto_factura, obtener_venta_para_factura,
+    obtener_ventas_para_historial_gui, obtener_venta_para_factura,
+    obtener_pagina_ventas_historial, obtener_total_ventas_periodo, obtener_metricas_dashboard, iterar_ventas_periodo,
     # Proveedores
     obtener_lista_proveedores_para_combobox, obtener_historial_proveedor_gui, guardar_nuevo_proveedor_desde_gui,
     obtener_proveedores_para_tabla_gui,
@@ -32,9 +29,18 @@ from Modulos.Repo import (
     # Configuracion
     obtener_configuracion_app, guardar_configuracion_app,
     # Productos extra
-    obtener_producto_por_id, actualizar_producto,
+    obtener_producto_por_id, actualizar_producto, obtener_producto_por_codigo_barras,
 )
 from Modulos.ui_styles import configure_app_styles, get_available_themes, get_theme_palette
+from Modulos.ui_worker import TkWorker
+from Modulos.ui_lista_virtual import ListaVirtual, FLECHA_ASC, FLECHA_DESC
+from Modulos.Busqueda import IndiceBusqueda
+from Modulos.Carrito import CarritoVenta, LINEA_AGREGADA, LINEA_MODIFICADA, LINEA_ELIMINADA
+from Modulos.ColaImpresion import ColaImpresion
+from Modulos.ArchivoFacturas import ArchivoFacturas
+from Modulos.PlantillaFactura import PlantillaFactura, plantilla_para, ANCHOS_SOPORTADOS, ANCHO_PREDETERMINADO
+from Modulos.Exportacion import exportar_filas, ProgresoExportacion, ExportacionCancelada, FORMATO_PDF, FORMATO_XLSX
+from Modulos.VentasOffline import VentasOffline
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -54,6 +60,18 @@ DEFAULT_APP_CONFIG = {
     "colores_botones": {}
 }
 
+def _clave_desde_texto(valor, numeric: bool = False, money: bool = False):
+    """Clave de orden para un valor ya formateado ('RD$ 1,234.50' -> 1234.5)."""
+    texto = str(valor)
+    if money or numeric:
+        texto = texto.replace('RD$', '').replace('$', '').replace(',', '').strip()
+        try:
+            return float(texto)
+        except ValueError:
+            return 0.0
+    return texto.casefold()
+
+
 def _load_logo_image(path: str, max_size: int = 200):
     if not path:
         return None
@@ -173,6 +191,9 @@ class LoginDialog(tk.Toplevel):
 
         login_btn = ttk.Button(form, text="Iniciar sesión", style="Accent.TButton", command=self._on_login)
         login_btn.grid(row=6, column=0, sticky="ew")
+        self.login_btn = login_btn
+        # La verificación del hash (PBKDF2) y la consulta corren fuera del hilo de Tk
+        self.worker = TkWorker(self, max_hilos=1)
 
         # Facilitar login con Enter
         entry_pass.bind("<Return>", lambda e: self._on_login())
@@ -196,17 +217,37 @@ class LoginDialog(tk.Toplevel):
         return info
 
     def _on_login(self):
+        if self.worker.ocupado:
+            return
         username = self.user_var.get()
         password = self.pass_var.get()
-        res = autenticar_usuario(username, password)
+        self.login_btn.state(["disabled"])
+        self.login_btn.configure(text="Verificando...")
+        self.configure(cursor="watch")
+        self.worker.ejecutar(autenticar_usuario, username, password, clave="login",
+                             al_terminar=self._login_resuelto, al_fallar=self._login_fallido)
+
+    def _restaurar_boton_login(self):
+        self.configure(cursor="")
+        self.login_btn.state(["!disabled"])
+        self.login_btn.configure(text="Iniciar sesión")
+
+    def _login_resuelto(self, res):
         if res.get("exito"):
             self.result = {"exito": True, "usuario": res.get("usuario")}
+            self.worker.cerrar()
             self.destroy()
         else:
+            self._restaurar_boton_login()
             messagebox.showerror("Login", res.get("mensaje", "Credenciales inválidas."), parent=self)
 
+    def _login_fallido(self, exc):
+        self._restaurar_boton_login()
+        messagebox.showerror("Login", f"No se pudo verificar el usuario:\n{exc}", parent=self)
+
     def _on_cancel(self):
         self.result = {"exito": False, "usuario": None}
+        self.worker.cerrar()
         self.destroy()
 
     def _center_dialog(self):
@@ -225,10 +266,37 @@ class LoginDialog(tk.Toplevel):
 
 
 MARGEN_GANANCIA_POR_DEFECTO = 0.30 # 30% de margen sobre el precio de compra
+HISTORIAL_CLIENTE_PAGINA = 100 # compras por página en Historial de Cliente
+HISTORIAL_VENTAS_PAGINA = 200 # ventas por página en Historial de Ventas
+BUSQUEDA_ESPERA_MS = 150 # pausa de tecleo antes de filtrar listas de productos
+FACTURA_ANCHO = os.environ.get("FACTURA_ANCHO", str(ANCHO_PREDETERMINADO)) # columnas del papel: 32, 42, 48 u 80
+
+
+def _ancho_factura() -> int:
+    try:
+        ancho = int(FACTURA_ANCHO)
+    except ValueError:
+        ancho = 0
+    if ancho not in ANCHOS_SOPORTADOS:
+        print(f"Advertencia: FACTURA_ANCHO={FACTURA_ANCHO} no soportado, se usa {ANCHO_PREDETERMINADO}.")
+        ancho = ANCHO_PREDETERMINADO
+    return ancho
+
+
+ANCHO_FACTURA = _ancho_factura()
+
 
 class ColmadoApp:
     def __init__(self, root_window, current_user: dict | None = None):
         self.root = root_window
+        # Consultas a la DB fuera del hilo de Tk; las claves de pantalla se cancelan al navegar
+        self.worker = TkWorker(self.root)
+        self._claves_pantalla = set()
+        # Guardado e impresión de facturas en un hilo propio, con pendientes en disco
+        self.archivo_facturas = ArchivoFacturas()
+        self.cola_impresion = ColaImpresion(archivo=self.archivo_facturas)
+        # Sin conexión con la DB las ventas van a un diario local y se sincronizan al volver
+        self.ventas_offline = VentasOffline(al_sincronizar=self._archivar_venta_sincronizada)
         self.app_config = self._load_app_config()
         if "colores_botones" not in self.app_config or not isinstance(self.app_config["colores_botones"], dict):
             self.app_config["colores_botones"] = {}
@@ -258,6 +326,7 @@ class ColmadoApp:
 
         # --- Variables para el formulario de agregar producto ---
         self.nombre_prod_var = tk.StringVar()
+        self.codigo_barras_prod_var = tk.StringVar()
         self.precio_compra_prod_var = tk.StringVar()
         self.precio_venta_sin_itbis_prod_var = tk.StringVar()
         self.tasa_itbis_seleccionada_var = tk.DoubleVar(value=0.18) 
@@ -276,15 +345,19 @@ class ColmadoApp:
         self.cliente_venta_var = tk.StringVar()
         self.producto_venta_seleccionado_var = tk.StringVar()
         self.cantidad_venta_var = tk.StringVar(value="1")
+        self.codigo_barras_venta_var = tk.StringVar()
         self.descuento_venta_var = tk.StringVar(value="0")
         self.dinero_recibido_var = tk.StringVar()
         self.cambio_devuelto_var = tk.StringVar()
         self.clientes_venta_map = {}
         self.lista_display_clientes_venta = ["Ninguno"]
         self.productos_para_venta_datos = []
+        self._productos_venta_por_id = {}
+        self._productos_venta_por_codigo = {}
         self.lista_display_productos_venta_original = []
         self.lista_display_productos_venta_filtrada = []
-        self.items_en_venta_actual = []
+        self.carrito_venta = CarritoVenta()
+        self.carrito_venta.suscribir(self._on_carrito_cambio)
         self.subtotal_bruto_venta_var = tk.DoubleVar(value=0.0)
         self.itbis_total_venta_var = tk.DoubleVar(value=0.0) 
         self.total_neto_venta_var = tk.DoubleVar(value=0.0)
@@ -361,6 +434,20 @@ class ColmadoApp:
         self.nav_clock_label.pack(anchor="w", pady=(2, 0))
         self.session_card_labels.append(self.nav_clock_label)
         self._start_dashboard_clock(self.nav_clock_label, full_format=False)
+        self.busy_label = tk.Label(user_card, text="", bg=card_bg, fg=card_fg, font=("Segoe UI", 9, "italic"))
+        self.busy_label.pack(anchor="w", pady=(2, 0))
+        self.session_card_labels.append(self.busy_label)
+        self.worker.agregar_indicador(self._mostrar_ocupado)
+        self.cola_impresion_label = tk.Label(user_card, text="", bg=card_bg, fg=card_fg, font=("Segoe UI", 9, "italic"))
+        self.cola_impresion_label.pack(anchor="w", pady=(2, 0))
+        self.session_card_labels.append(self.cola_impresion_label)
+        self._start_estado_cola_impresion(self.cola_impresion_label)
+        self.ventas_offline_label = tk.Label(user_card, text="", bg=card_bg, fg=card_fg, font=("Segoe UI", 9, "italic"))
+        self.ventas_offline_label.pack(anchor="w", pady=(2, 0))
+        self.session_card_labels.append(self.ventas_offline_label)
+        # Clic: reenviar ya las ventas que fallaron al sincronizar (sin esperar el próximo intento)
+        self.ventas_offline_label.bind("<Button-1>", lambda e: self.ventas_offline.sincronizar_ahora(reintentar_errores=True))
+        self._start_estado_ventas_offline(self.ventas_offline_label)
 
         self.nav_buttons = {}
         nav_items = [
@@ -392,9 +479,32 @@ class ColmadoApp:
         self.show_welcome_message_in_display()
 
     def _clear_display_frame(self):
+        # Los resultados pendientes de la pantalla anterior ya no tienen dónde mostrarse
+        for clave in self._claves_pantalla:
+            self.worker.cancelar(clave)
+        self._claves_pantalla.clear()
         for widget in self.display_frame.winfo_children():
             widget.destroy()
 
+    def _ejecutar_en_fondo(self, clave, func, *args, al_terminar=None, al_fallar=None, **kwargs):
+        """Ejecuta func en el worker; el resultado se descarta si se cambia de pantalla o se repite la clave."""
+        self._claves_pantalla.add(clave)
+        self.worker.ejecutar(
+            func, *args, clave=clave, al_terminar=al_terminar,
+            al_fallar=al_fallar or self._mostrar_error_en_fondo, **kwargs
+        )
+
+    def _mostrar_error_en_fondo(self, exc):
+        messagebox.showerror("Error de Base de Datos", f"No se pudo completar la operación:\n{exc}", parent=self.root)
+
+    def _mostrar_ocupado(self, ocupado: bool):
+        try:
+            self.root.configure(cursor="watch" if ocupado else "")
+            if getattr(self, 'busy_label', None):
+                self.busy_label.config(text="Consultando datos..." if ocupado else "")
+        except tk.TclError:
+            pass
+
     def show_welcome_message_in_display(self):
         self._set_active_nav_action('inicio')
         self._clear_display_frame()
@@ -416,7 +526,7 @@ class ColmadoApp:
             style="Subheader.TLabel"
         ).pack(anchor="w", pady=(4, 12))
 
-        stats = self._collect_dashboard_metrics()
+        stats = self._collect_dashboard_metrics(None)
         self.dashboard_cards = []
         cards_frame = ttk.Frame(container, style="Content.TFrame")
         cards_frame.pack(fill=tk.X, pady=(0, 14))
@@ -439,6 +549,15 @@ class ColmadoApp:
             text="Seleccione una accion desde el panel izquierdo para continuar.",
             style="Muted.TLabel"
         ).pack(anchor="w", pady=(8, 0))
+        self._ejecutar_en_fondo('dashboard', obtener_metricas_dashboard, al_terminar=self._mostrar_metricas_dashboard,
+                                al_fallar=lambda exc: self._mostrar_metricas_dashboard({}))
+
+    def _mostrar_metricas_dashboard(self, metricas):
+        for btn, (concepto, valor) in zip(getattr(self, 'dashboard_cards', []), self._collect_dashboard_metrics(metricas)):
+            try:
+                btn.configure(text=f"{concepto}\n{valor}")
+            except tk.TclError:
+                pass
 
     def _set_active_nav_action(self, action_key: str | None):
         self._active_nav_key = action_key
@@ -581,6 +700,11 @@ class ColmadoApp:
     def _get_empresa_info(self) -> dict:
         return (self.app_config.get("empresa") or DEFAULT_APP_CONFIG["empresa"]).copy()
 
+    def _plantilla_factura(self) -> PlantillaFactura:
+        """Plantilla con la cabecera del negocio ya armada (cacheada por plantilla_para según
+        los datos de empresa y el ancho, así que cambia sola al guardar los datos de empresa)."""
+        return plantilla_para(self._get_empresa_info(), ANCHO_FACTURA)
+
     def _update_window_title(self):
         empresa_info = self._get_empresa_info()
         empresa_nombre = empresa_info.get("nombre") or DEFAULT_APP_CONFIG["empresa"]["nombre"]
@@ -725,11 +849,14 @@ class ColmadoApp:
         luminance = (0.299 * r + 0.587 * g + 0.114 * b)
         return "#1f2933" if luminance > 180 else "#f5f7fa"
 
-    def _collect_dashboard_metrics(self):
-        """Genera datos para la tabla de bienvenida."""
+    def _collect_dashboard_metrics(self, metricas):
+        """Genera datos para la tabla de bienvenida (con metricas=None, filas en espera)."""
         stats = []
 
         def add_row(label, supplier, formatter=str):
+            if metricas is None:
+                stats.append((label, "Cargando..."))
+                return
             try:
                 value = supplier()
                 stats.append((label, formatter(value)))
@@ -737,16 +864,16 @@ class ColmadoApp:
                 stats.append((label, "N/D"))
                 print(f"Advertencia dashboard '{label}': {exc}")
 
-        add_row("Productos activos", lambda: len(obtener_productos_para_gui()))
-        add_row("Clientes registrados", lambda: len(obtener_lista_clientes_para_combobox()))
-        add_row("Proveedores registrados", lambda: len(obtener_lista_proveedores_para_combobox()))
+        # Todos los contadores salen de una sola consulta de agregados (obtener_metricas_dashboard)
+        def metrica(clave):
+            return lambda: metricas[clave]
+
+        add_row("Productos activos", metrica('productos'))
+        add_row("Clientes registrados", metrica('clientes'))
+        add_row("Proveedores registrados", metrica('proveedores'))
 
         def ventas_supplier():
-            today = datetime.date.today().strftime("%Y-%m-%d")
-            info = obtener_ventas_para_historial_gui(today, today) or {}
-            ventas = info.get("ventas_mostradas", [])
-            total = float(info.get("total_periodo", 0.0))
-            return len(ventas), total
+            return metricas['ventas_dia'], metricas['total_dia']
 
         def ventas_formatter(data):
             cantidad, total = data
@@ -772,14 +899,55 @@ class ColmadoApp:
                 pass
         _update()
 
+    def _start_estado_cola_impresion(self, label):
+        def _update():
+            estado = self.cola_impresion.estado()
+            if estado["reintentando"]:
+                text = f"Facturas: {estado['pendientes']} pendiente(s), reintentando ({estado['ultimo_error']})"
+            elif estado["pendientes"]:
+                text = f"Facturas: {estado['pendientes']} en cola..."
+            else:
+                text = ""
+            try:
+                label.config(text=text)
+                label.after(1000, _update)
+            except Exception:
+                pass
+        _update()
+
+    def _start_estado_ventas_offline(self, label):
+        def _update():
+            estado = self.ventas_offline.estado()
+            partes = []
+            if estado["sin_conexion"]:
+                partes.append("Sin conexión con la DB")
+            if estado["pendientes"]:
+                partes.append(f"{estado['pendientes']} venta(s) por sincronizar")
+            if estado["con_error"]:
+                partes.append(f"{estado['con_error']} con error al sincronizar (clic para reintentar)")
+            try:
+                label.config(text="Ventas: " + ", ".join(partes) if partes else "")
+                label.after(2000, _update)
+            except Exception:
+                pass
+        _update()
+
+    def _archivar_venta_sincronizada(self, entrada, venta_id):
+        """Desde el hilo de sincronización: archiva la factura definitiva de una venta hecha sin conexión."""
+        venta = obtener_venta_para_factura(venta_id)
+        texto = self._plantilla_factura().renderizar(venta, entrada.get('nombre_cliente') or "Consumidor Final")
+        self.cola_impresion.archivar(venta_id, texto)
+
     def _on_dashboard_metric_click(self, label: str = None):
         if label != "Ventas del dia":
             return
         today = datetime.date.today().strftime("%Y-%m-%d")
-        data = obtener_ventas_para_historial_gui(today, today) or {}
-        ventas = data.get("ventas_mostradas", [])
-        total = float(data.get("total_periodo", 0.0))
-        self._mostrar_modal_ventas_dia(ventas, total, today)
+
+        def mostrar(data):
+            data = data or {}
+            self._mostrar_modal_ventas_dia(data.get("ventas_mostradas", []), float(data.get("total_periodo", 0.0)), today)
+
+        self._ejecutar_en_fondo('ventas_dia', obtener_ventas_para_historial_gui, today, today, al_terminar=mostrar)
 
     def _mostrar_modal_ventas_dia(self, ventas, total, fecha_str):
         dlg = tk.Toplevel(self.root)
@@ -846,7 +1014,7 @@ class ColmadoApp:
 
         actions = ttk.Frame(dlg, padding=10)
         actions.pack(fill=tk.X, side=tk.BOTTOM)
-        ttk.Button(actions, text="Exportar", style="Secondary.TButton", command=lambda: self._exportar_ventas_modal(tree, desde_var.get(), hasta_var.get())).pack(side=tk.LEFT, padx=5)
+        ttk.Button(actions, text="Exportar", style="Secondary.TButton", command=lambda: self._exportar_ventas_modal(desde_var.get().strip(), hasta_var.get().strip(), parent=dlg)).pack(side=tk.LEFT, padx=5)
         ttk.Button(actions, text="Cerrar", style="Secondary.TButton", command=dlg.destroy).pack(side=tk.RIGHT, padx=5)
 
         def cargar_fechas():
@@ -861,29 +1029,37 @@ class ColmadoApp:
             except ValueError:
                 messagebox.showerror("Fechas", "Formato inválido (use YYYY-MM-DD).", parent=dlg)
                 return
-            data = obtener_ventas_para_historial_gui(fecha_ini, fecha_fin) or {}
-            ventas_nuevas = data.get("ventas_mostradas", [])
-            total_nuevo = float(data.get("total_periodo", 0.0))
-            for item in tree.get_children():
-                tree.delete(item)
-            for venta in ventas_nuevas:
-                tree.insert("", tk.END, values=(
-                    venta.get("id_venta", "N/A"),
-                    venta.get("nombre_cliente", "N/A"),
-                    f"RD$ {venta.get('subtotal_bruto_sin_itbis', 0.0):.2f}",
-                    f"RD$ {venta.get('itbis_total_venta', 0.0):.2f}",
-                    f"RD$ {venta.get('descuento_aplicado', 0.0):.2f}",
-                    f"RD$ {venta.get('total_final', 0.0):.2f}"
-                ))
-            self._apply_treeview_striping(tree)
-            total_str_var.set(f"Total del periodo: RD$ {total_nuevo:,.2f}")
-
-    def _exportar_ventas_modal(self, tree: ttk.Treeview, fecha_ini: str, fecha_fin: str):
-        ventas = []
-        for item in tree.get_children():
-            ventas.append(tree.item(item).get("values", []))
-        if not ventas:
-            messagebox.showwarning("Sin datos", "No hay ventas para exportar.", parent=self.root)
+            def mostrar(data):
+                if not self._widget_vivo(dlg):
+                    return
+                data = data or {}
+                ventas_nuevas = data.get("ventas_mostradas", [])
+                total_nuevo = float(data.get("total_periodo", 0.0))
+                for item in tree.get_children():
+                    tree.delete(item)
+                for venta in ventas_nuevas:
+                    tree.insert("", tk.END, values=(
+                        venta.get("id_venta", "N/A"),
+                        venta.get("nombre_cliente", "N/A"),
+                        f"RD$ {venta.get('subtotal_bruto_sin_itbis', 0.0):.2f}",
+                        f"RD$ {venta.get('itbis_total_venta', 0.0):.2f}",
+                        f"RD$ {venta.get('descuento_aplicado', 0.0):.2f}",
+                        f"RD$ {venta.get('total_final', 0.0):.2f}"
+                    ))
+                self._apply_treeview_striping(tree)
+                total_str_var.set(f"Total del periodo: RD$ {total_nuevo:,.2f}")
+
+            # Misma clave que la carga inicial: filtrar de nuevo descarta la consulta anterior
+            self._ejecutar_en_fondo('ventas_dia', obtener_ventas_para_historial_gui, fecha_ini, fecha_fin, al_terminar=mostrar)
+
+    def _exportar_ventas_modal(self, fecha_ini: str, fecha_fin: str, parent=None):
+        """Exporta todas las ventas del rango (no solo las visibles) en segundo plano, con barra de progreso."""
+        parent = parent or self.root
+        try:
+            datetime.datetime.strptime(fecha_ini, "%Y-%m-%d")
+            datetime.datetime.strptime(fecha_fin, "%Y-%m-%d")
+        except ValueError:
+            messagebox.showerror("Fechas", "Formato inválido (use YYYY-MM-DD).", parent=parent)
             return
         formato = self._preguntar_formato_exportacion()
         if not formato:
@@ -891,20 +1067,64 @@ class ColmadoApp:
 
         downloads = Path.home() / "Downloads"
         downloads.mkdir(parents=True, exist_ok=True)
-        if formato == "pdf":
-            file_path = downloads / f"ventas_{fecha_ini}_{fecha_fin}.pdf"
-            try:
-                self._exportar_pdf_simple(file_path, ventas, fecha_ini, fecha_fin)
-                messagebox.showinfo("Exportación", f"Archivo guardado en:\n{file_path}", parent=self.root)
-            except Exception as exc:
-                messagebox.showerror("Exportación", f"No se pudo exportar a PDF: {exc}", parent=self.root)
-        else:
-            file_path = downloads / f"ventas_{fecha_ini}_{fecha_fin}.csv"
-            try:
-                self._exportar_csv_simple(file_path, ventas)
-                messagebox.showinfo("Exportación", f"Archivo guardado en:\n{file_path}", parent=self.root)
-            except Exception as exc:
-                messagebox.showerror("Exportación", f"No se pudo exportar: {exc}", parent=self.root)
+        file_path = downloads / f"ventas_{fecha_ini}_{fecha_fin}.{formato}"
+        titulo = f"Ventas del periodo {fecha_ini} al {fecha_fin}"
+        progreso = ProgresoExportacion()
+
+        # Hija de `parent` para seguir recibiendo eventos si el modal de origen tiene grab
+        dlg = tk.Toplevel(parent)
+        self._style_toplevel(dlg)
+        dlg.title("Exportando ventas")
+        dlg.geometry("380x150")
+        dlg.transient(parent)
+        estado_var = tk.StringVar(value="Contando ventas...")
+        ttk.Label(dlg, textvariable=estado_var).pack(fill=tk.X, padx=12, pady=(14, 6))
+        barra = ttk.Progressbar(dlg, mode="determinate", maximum=1)
+        barra.pack(fill=tk.X, padx=12)
+        btn_cancelar = ttk.Button(dlg, text="Cancelar", style="Secondary.TButton", command=progreso.cancelar)
+        btn_cancelar.pack(pady=12)
+        dlg.protocol("WM_DELETE_WINDOW", progreso.cancelar)
+
+        def actualizar():
+            if not self._widget_vivo(dlg):
+                return
+            if progreso.total or progreso.hechas:
+                # El total viene del resumen diario y es solo una estimación para la barra
+                total = max(progreso.total, progreso.hechas)
+                barra.configure(maximum=total, value=progreso.hechas)
+                estado_var.set(f"Exportando {progreso.hechas:,} de {total:,} ventas...")
+            if progreso.cancelado:
+                estado_var.set("Cancelando...")
+                btn_cancelar.state(["disabled"])
+            dlg.after(200, actualizar)
+
+        def tarea():
+            progreso.total = obtener_total_ventas_periodo(fecha_ini, fecha_fin)['cantidad']
+            cantidad = exportar_filas(iterar_ventas_periodo(fecha_ini, fecha_fin), str(file_path), formato, titulo, progreso=progreso)
+            if not cantidad:
+                # No dejar un archivo vacío en Descargas
+                try:
+                    file_path.unlink()
+                except OSError:
+                    pass
+            return cantidad
+
+        def terminado(cantidad):
+            dlg.destroy()
+            if not cantidad:
+                messagebox.showwarning("Sin datos", "No hay ventas para exportar.", parent=parent)
+            else:
+                messagebox.showinfo("Exportación", f"{cantidad:,} ventas exportadas en:\n{file_path}", parent=parent)
+
+        def fallido(exc):
+            dlg.destroy()
+            if isinstance(exc, ExportacionCancelada):
+                return
+            messagebox.showerror("Exportación", f"No se pudo exportar: {exc}", parent=parent)
+
+        # Sin clave de pantalla: la exportación sigue aunque se navegue a otra sección
+        self.worker.ejecutar(tarea, al_terminar=terminado, al_fallar=fallido)
+        actualizar()
 
     def _preguntar_formato_exportacion(self):
         opciones = ["Excel (.xlsx)", "PDF (.pdf)"]
@@ -922,75 +1142,13 @@ class ColmadoApp:
         result = {"value": None}
         def confirmar():
             val = seleccion.get()
-            result["value"] = "pdf" if "PDF" in val.upper() else "excel"
+            result["value"] = FORMATO_PDF if "PDF" in val.upper() else FORMATO_XLSX
             dlg.destroy()
         ttk.Button(dlg, text="Exportar", style="Accent.TButton", command=confirmar).pack(pady=(10, 5))
         ttk.Button(dlg, text="Cancelar", style="Secondary.TButton", command=lambda: dlg.destroy()).pack()
         dlg.wait_window()
         return result["value"]
 
-    def _pdf_escape_text(self, text: str) -> str:
-        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-
-    def _exportar_pdf_simple(self, file_path: Path, ventas, fecha_ini: str, fecha_fin: str):
-        lines = [
-            f"Ventas del periodo {fecha_ini} al {fecha_fin}",
-            "",
-            "ID Venta | Cliente | Subtotal | ITBIS | Descuento | Total",
-        ]
-        for row in ventas:
-            lines.append(" | ".join(map(str, row)))
-
-        stream_lines = [
-            "BT",
-            "/F1 11 Tf",
-            "1 0 0 1 50 800 Tm",
-            "14 TL",
-        ]
-        for line in lines:
-            stream_lines.append(f"({self._pdf_escape_text(line)}) Tj")
-            stream_lines.append("T*")
-        stream_lines.append("ET")
-        stream = "\n".join(stream_lines)
-        stream_bytes = stream.encode("latin-1", "replace")
-
-        objects = []
-        objects.append("<< /Type /Catalog /Pages 2 0 R >>")
-        objects.append("<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
-        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>")
-        objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
-        objects.append(f"<< /Length {len(stream_bytes)} >>\nstream\n{stream}\nendstream")
-
-        pdf_parts = ["%PDF-1.4"]
-        offsets = [0]
-        current_offset = len(pdf_parts[0].encode("latin-1"))
-        for idx, obj in enumerate(objects, start=1):
-            offsets.append(current_offset)
-            obj_text = f"\n{idx} 0 obj\n{obj}\nendobj"
-            pdf_parts.append(obj_text)
-            current_offset += len(obj_text.encode("latin-1"))
-
-        xref_offset = current_offset
-        pdf_parts.append("\nxref")
-        pdf_parts.append(f"0 {len(objects)+1}")
-        pdf_parts.append("0000000000 65535 f ")
-        for off in offsets[1:]:
-            pdf_parts.append(f"{off:010} 00000 n ")
-
-        pdf_parts.append("trailer")
-        pdf_parts.append(f"<< /Size {len(objects)+1} /Root 1 0 R >>")
-        pdf_parts.append("startxref")
-        pdf_parts.append(str(xref_offset))
-        pdf_parts.append("%%EOF")
-
-        with file_path.open("wb") as fh:
-            fh.write("".join(pdf_parts).encode("latin-1"))
-
-    def _exportar_csv_simple(self, file_path: Path, ventas):
-        with file_path.open("w", encoding="utf-8", newline="") as f:
-            f.write("ID Venta;Cliente;Subtotal;ITBIS;Descuento;Total\n")
-            for row in ventas:
-                f.write(";".join(map(str, row)) + "\n")
     def _allowed(self, action_key: str) -> bool:
         return action_key in self._role_permissions.get(self._role, set()) or self._role == 'admin'
 
@@ -1048,7 +1206,8 @@ class ColmadoApp:
         self._enable_treeview_sorting(
             self.tree_usuarios,
             original_headers={"id_u": "ID", "username_u": "Usuario", "rol_u": "Rol"},
-            numeric_cols={"id_u"}, money_cols=set()
+            numeric_cols={"id_u"}, money_cols=set(),
+            claves={"id_u": lambda u: u.get("id") or 0}
         )
 
     def _crear_usuario_submit(self):
@@ -1066,25 +1225,21 @@ class ColmadoApp:
     def _refrescar_lista_usuarios(self):
         if not hasattr(self, 'tree_usuarios'):
             return
-        for i in self.tree_usuarios.get_children():
-            self.tree_usuarios.delete(i)
-        for u in obtener_usuarios_para_gui():
-            self.tree_usuarios.insert("", tk.END, values=(u.get("id"), u.get("username"), u.get("rol")))
-        self._apply_treeview_striping(self.tree_usuarios)
+        self._poblar_treeview(
+            self.tree_usuarios, obtener_usuarios_para_gui(),
+            lambda u: (u.get("id"), u.get("username"), u.get("rol"))
+        )
 
     def _abrir_cambiar_contrasena_dialog(self):
         if not hasattr(self, 'tree_usuarios'):
             return
-        sel = self.tree_usuarios.selection()
-        if not sel:
+        usuario_sel = self._fila_seleccionada_treeview(self.tree_usuarios)
+        if not usuario_sel:
             messagebox.showwarning("Sin selección", "Seleccione un usuario de la lista.", parent=self.display_frame)
             return
-        vals = self.tree_usuarios.item(sel[0]).get('values', [])
-        if not vals:
-            return
         try:
-            user_id = int(vals[0])
-            username = str(vals[1]) if len(vals) > 1 else ''
+            user_id = int(usuario_sel.get("id"))
+            username = str(usuario_sel.get("username") or '')
         except Exception:
             messagebox.showerror("Error", "No se pudo determinar el usuario seleccionado.", parent=self.display_frame)
             return
@@ -1128,52 +1283,39 @@ class ColmadoApp:
     def _refrescar_tabla_clientes_registrados(self):
         if not hasattr(self, 'tree_clientes_registrados'):
             return
-        for item in self.tree_clientes_registrados.get_children():
-            self.tree_clientes_registrados.delete(item)
-        for cliente in obtener_clientes_para_tabla_gui():
-            self.tree_clientes_registrados.insert(
-                "",
-                tk.END,
-                values=(
-                    cliente.get("id", ""),
-                    cliente.get("nombre", ""),
-                    cliente.get("telefono", "") or "N/D",
-                    cliente.get("direccion", "") or "",
-                ),
-            )
-        self._apply_treeview_striping(self.tree_clientes_registrados)
+        self._poblar_treeview(
+            self.tree_clientes_registrados, obtener_clientes_para_tabla_gui(),
+            lambda cliente: (
+                cliente.get("id", ""),
+                cliente.get("nombre", ""),
+                cliente.get("telefono", "") or "N/D",
+                cliente.get("direccion", "") or "",
+            ),
+        )
 
     def _refrescar_tabla_proveedores_registrados(self):
         if not hasattr(self, 'tree_proveedores_registrados'):
             return
-        for item in self.tree_proveedores_registrados.get_children():
-            self.tree_proveedores_registrados.delete(item)
-        for proveedor in obtener_proveedores_para_tabla_gui():
-            self.tree_proveedores_registrados.insert(
-                "",
-                tk.END,
-                values=(
-                    proveedor.get("id", ""),
-                    proveedor.get("nombre", ""),
-                    proveedor.get("telefono", "") or "N/D",
-                    proveedor.get("direccion", "") or "",
-                ),
-            )
-        self._apply_treeview_striping(self.tree_proveedores_registrados)
+        self._poblar_treeview(
+            self.tree_proveedores_registrados, obtener_proveedores_para_tabla_gui(),
+            lambda proveedor: (
+                proveedor.get("id", ""),
+                proveedor.get("nombre", ""),
+                proveedor.get("telefono", "") or "N/D",
+                proveedor.get("direccion", "") or "",
+            ),
+        )
 
     def _eliminar_usuario_submit(self):
         if not hasattr(self, 'tree_usuarios'):
             return
-        sel = self.tree_usuarios.selection()
-        if not sel:
+        usuario_sel = self._fila_seleccionada_treeview(self.tree_usuarios)
+        if not usuario_sel:
             messagebox.showwarning("Sin selección", "Seleccione un usuario para eliminar.", parent=self.display_frame)
             return
-        vals = self.tree_usuarios.item(sel[0]).get('values', [])
-        if not vals:
-            return
         try:
-            user_id = int(vals[0])
-            username = str(vals[1]) if len(vals) > 1 else ''
+            user_id = int(usuario_sel.get("id"))
+            username = str(usuario_sel.get("username") or '')
         except Exception:
             messagebox.showerror("Error", "No se pudo determinar el usuario seleccionado.", parent=self.display_frame)
             return
@@ -1186,18 +1328,15 @@ class ColmadoApp:
                 messagebox.showerror("Error", res.get('mensaje', 'No se pudo eliminar el usuario.'), parent=self.display_frame)
 
 
-    def _abrir_editar_producto_dialog(self, tree_widget):
+    def _abrir_editar_producto_dialog(self, lista):
         """Abre un diálogo para editar el producto seleccionado (solo admin)."""
         if not self._allowed('editar_producto'):
             messagebox.showerror("Acceso denegado", "Solo un administrador puede editar productos.", parent=self.display_frame); return
-        sel = tree_widget.selection()
-        if not sel:
+        producto_sel = lista.seleccion()
+        if not producto_sel:
             messagebox.showwarning("Sin selección", "Seleccione un producto de la lista.", parent=self.display_frame); return
-        vals = tree_widget.item(sel[0]).get('values', [])
-        if not vals:
-            return
         try:
-            prod_id = int(vals[0])
+            prod_id = int(producto_sel['id'])
         except Exception:
             messagebox.showerror("Error", "No se pudo obtener el ID del producto seleccionado.", parent=self.display_frame); return
 
@@ -1215,6 +1354,7 @@ class ColmadoApp:
         # Variables
         v_nombre = tk.StringVar(value=prod.get('nombre',''))
         v_desc = tk.StringVar(value=prod.get('descripcion','') or '')
+        v_codigo = tk.StringVar(value=prod.get('codigo_barras','') or '')
         v_precio_compra = tk.StringVar(value=f"{float(prod.get('precio_compra',0.0)):.2f}")
         v_precio_sin_itbis = tk.StringVar(value=f"{float(prod.get('precio_venta_sin_itbis',0.0)):.2f}")
         v_tasa = tk.DoubleVar(value=float(prod.get('tasa_itbis',0.0)))
@@ -1230,6 +1370,7 @@ class ColmadoApp:
         # Diseño simple
         r=0
         ttk.Label(f, text="Nombre:").grid(row=r, column=0, sticky='w'); e_nombre = ttk.Entry(f, textvariable=v_nombre, width=50); e_nombre.grid(row=r, column=1, columnspan=3, sticky='ew', padx=5, pady=5); r+=1
+        ttk.Label(f, text="Código de Barras:").grid(row=r, column=0, sticky='w'); e_codigo = ttk.Entry(f, textvariable=v_codigo, width=30); e_codigo.grid(row=r, column=1, columnspan=2, sticky='w', padx=5, pady=5); r+=1
         ttk.Label(f, text="Descripción:").grid(row=r, column=0, sticky='w'); e_desc = ttk.Entry(f, textvariable=v_desc, width=50); e_desc.grid(row=r, column=1, columnspan=3, sticky='ew', padx=5, pady=5); r+=1
         ttk.Label(f, text="Precio Compra:").grid(row=r, column=0, sticky='w'); e_pc = ttk.Entry(f, textvariable=v_precio_compra, width=16); e_pc.grid(row=r, column=1, sticky='w', padx=5, pady=5)
         ttk.Label(f, text="Precio s/ITBIS:").grid(row=r, column=2, sticky='e'); e_ps = ttk.Entry(f, textvariable=v_precio_sin_itbis, width=16); e_ps.grid(row=r, column=3, sticky='w', padx=5, pady=5); r+=1
@@ -1244,6 +1385,42 @@ class ColmadoApp:
         ttk.Label(f, text="Proveedor:").grid(row=r, column=0, sticky='w'); cb_prov = ttk.Combobox(f, textvariable=v_proveedor, values=list(prov_map.keys()), width=40, state='readonly'); cb_prov.grid(row=r, column=1, columnspan=3, sticky='ew', padx=5, pady=5); r+=1
 
         btns = ttk.Frame(f); btns.grid(row=r, column=0, columnspan=4, pady=10)
+        # Versión del producto sobre la que se editó (se reemplaza al resolver un conflicto)
+        estado = {'original': prod}
+        etiquetas_campos = {
+            'nombre': "Nombre", 'codigo_barras': "Código de Barras", 'descripcion': "Descripción",
+            'precio_compra': "Precio Compra", 'precio_venta_sin_itbis': "Precio s/ITBIS", 'aplica_itbis': "Aplica ITBIS",
+            'tasa_itbis': "Tasa ITBIS", 'itbis_monto_producto': "ITBIS", 'precio_final_venta': "Precio Final",
+            'categoria': "Categoría", 'proveedor_id': "Proveedor",
+        }
+
+        def cargar_valores_actuales(actual, campos, stock_escrito):
+            """Trae de `actual` los campos en conflicto y conserva la diferencia de stock escrita por el usuario."""
+            prov_por_id = {pid: nombre for nombre, pid in prov_map.items()}
+            setters = {
+                'nombre': lambda: v_nombre.set(actual.get('nombre') or ''),
+                'codigo_barras': lambda: v_codigo.set(actual.get('codigo_barras') or ''),
+                'descripcion': lambda: v_desc.set(actual.get('descripcion') or ''),
+                'precio_compra': lambda: v_precio_compra.set(f"{float(actual.get('precio_compra') or 0.0):.2f}"),
+                'precio_venta_sin_itbis': lambda: v_precio_sin_itbis.set(f"{float(actual.get('precio_venta_sin_itbis') or 0.0):.2f}"),
+                'aplica_itbis': lambda: v_aplica.set(bool(actual.get('aplica_itbis'))),
+                'tasa_itbis': lambda: v_tasa.set(float(actual.get('tasa_itbis') or 0.0)),
+                'categoria': lambda: v_categoria.set(actual.get('categoria') or ''),
+                'proveedor_id': lambda: v_proveedor.set(prov_por_id.get(actual.get('proveedor_id'), '')),
+            }
+            for campo in campos:
+                if campo in setters:
+                    setters[campo]()
+            diferencia = stock_escrito - float(estado['original'].get('stock') or 0.0)
+            v_stock.set(str(round(float(actual.get('stock') or 0.0) + diferencia, 3)))
+            # La nueva base toma de `actual` solo lo que se recargó en el formulario: los demás
+            # campos siguen mostrando el valor original, y con `actual` como base se tomarían
+            # por ediciones del usuario y pisarían lo que cambió la otra terminal.
+            base = dict(estado['original'])
+            for campo in list(campos) + ['stock', 'version']:
+                base[campo] = actual.get(campo)
+            estado['original'] = base
+
         def guardar():
             try:
                 pc = float(v_precio_compra.get().replace(',','.') or 0)
@@ -1257,16 +1434,26 @@ class ColmadoApp:
                 messagebox.showerror("Error", "Valores numéricos inválidos.", parent=dlg); return
             prov_id = prov_map.get(v_proveedor.get()) if v_proveedor.get() in prov_map else None
             datos = {
-                'nombre': v_nombre.get(), 'descripcion': v_desc.get(), 'precio_compra': pc,
+                'nombre': v_nombre.get(), 'codigo_barras': v_codigo.get(), 'descripcion': v_desc.get(), 'precio_compra': pc,
                 'precio_venta_sin_itbis': pv_sin, 'aplica_itbis': aplica, 'tasa_itbis': tasa,
                 'itbis_monto_producto': round(itbis_monto,2), 'precio_final_venta': round(precio_final,2),
                 'stock': stock, 'categoria': v_categoria.get(), 'proveedor_id': prov_id
             }
-            res = actualizar_producto(prod_id, datos)
+            res = actualizar_producto(prod_id, datos, original=estado['original'])
             if res.get('exito'):
                 messagebox.showinfo("Éxito", res.get('mensaje','Actualizado.'), parent=dlg)
                 dlg.destroy()
                 self.listar_productos_action()
+            elif res.get('conflicto'):
+                campos = res.get('campos_en_conflicto', [])
+                nombres = ", ".join(etiquetas_campos.get(c, c) for c in campos)
+                if messagebox.askyesno(
+                    "Conflicto de edición",
+                    f"{res.get('mensaje')}\nCampos modificados por otro usuario: {nombres}.\n\n"
+                    "¿Cargar los valores actuales de esos campos? Sus demás cambios se conservan; revise y guarde de nuevo.",
+                    parent=dlg,
+                ):
+                    cargar_valores_actuales(res.get('producto_actual') or {}, campos, stock)
             else:
                 messagebox.showerror("Error", res.get('mensaje','No se pudo actualizar.'), parent=dlg)
         ttk.Button(btns, text="Guardar Cambios", command=guardar, style='Accent.TButton').pack(side=tk.LEFT, padx=5)
@@ -1299,68 +1486,136 @@ class ColmadoApp:
         return self._validate_numeric(proposed)
 
     # -------- Utilidades de ordenamiento en Treeview --------
-    def _enable_treeview_sorting(self, tree: ttk.Treeview, original_headers: dict, numeric_cols=None, money_cols=None):
-        """Activa ordenamiento clicando encabezados.
+    def _poblar_treeview(self, tree: ttk.Treeview, filas, formatear):
+        """Llena el Treeview y guarda junto a él las filas (dicts) para ordenar sin releer Tk."""
+        for item in tree.get_children():
+            tree.delete(item)
+        modelo = {'filas': {}, 'valores': {}, 'claves': {}}
+        for idx, fila in enumerate(filas):
+            iid = str(idx)
+            valores = tuple(formatear(fila))
+            modelo['filas'][iid] = fila
+            modelo['valores'][iid] = valores
+            tree.insert("", tk.END, iid=iid, values=valores, tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+        if not hasattr(self, '_tree_modelos'):
+            self._tree_modelos = {}
+        self._tree_modelos[str(tree)] = modelo
+        self._apply_treeview_striping(tree, reetiquetar=False)
+        # Mantener el orden elegido por el usuario al refrescar
+        if getattr(self, '_tree_sort_state', {}).get(str(tree)):
+            self._sort_treeview(tree)
+
+    def _fila_seleccionada_treeview(self, tree: ttk.Treeview):
+        """Dict de la fila seleccionada en un Treeview llenado con _poblar_treeview (o None)."""
+        sel = tree.selection()
+        if not sel:
+            return None
+        return getattr(self, '_tree_modelos', {}).get(str(tree), {}).get('filas', {}).get(sel[0])
+
+    def _enable_treeview_sorting(self, tree: ttk.Treeview, original_headers: dict, numeric_cols=None, money_cols=None, claves=None):
+        """Activa ordenamiento clicando encabezados (Shift+clic agrega columnas secundarias).
         - original_headers: dict col -> texto base del encabezado
         - numeric_cols: set de columnas tratadas como números
         - money_cols: set de columnas con formato monetario 'RD$ ...'
+        - claves: dict col -> función(fila) con la clave tipada; si falta se interpreta el texto mostrado
         """
-        numeric_cols = numeric_cols or set()
-        money_cols = money_cols or set()
-        tree_id = id(tree)
+        tree_id = str(tree)  # ruta Tk del widget: no se reutiliza como id() tras destruirlo
         # Guardar textos originales y estado por árbol
         if not hasattr(self, '_tree_headers'):
             self._tree_headers = {}
         if not hasattr(self, '_tree_sort_state'):
             self._tree_sort_state = {}
+        if not hasattr(self, '_tree_sort_config'):
+            self._tree_sort_config = {}
         self._tree_headers[tree_id] = dict(original_headers)
-        self._tree_sort_state[tree_id] = {col: False for col in original_headers.keys()}  # False = asc
+        self._tree_sort_state[tree_id] = []  # [(col, descendente)] en orden de prioridad
+        self._tree_sort_config[tree_id] = {
+            'numeric': set(numeric_cols or ()), 'money': set(money_cols or ()), 'claves': dict(claves or {})
+        }
 
         for col in original_headers.keys():
-            is_money = col in money_cols
-            is_numeric = col in numeric_cols
-            tree.heading(col, command=lambda c=col, m=is_money, n=is_numeric: self._on_treeview_heading_click(tree, c, n, m))
+            tree.heading(col, command=lambda c=col: self._on_treeview_heading_click(tree, c, agregar=False))
+        tree.bind("<Shift-Button-1>", lambda e: self._on_treeview_shift_click(tree, e), add="+")
         self._apply_treeview_striping(tree)
 
-    def _on_treeview_heading_click(self, tree: ttk.Treeview, col: str, numeric: bool, money: bool):
-        tree_id = id(tree)
-        reverse = self._tree_sort_state.get(tree_id, {}).get(col, False)
-        # Ejecutar ordenamiento
-        self._sort_treeview(tree, col, numeric=numeric, money=money, reverse=reverse)
-        # Alternar estado para próximo click
-        self._tree_sort_state[tree_id][col] = not reverse
-        # Actualizar textos de encabezado con flecha
-        base_map = self._tree_headers.get(tree_id, {})
-        for c, base_text in base_map.items():
+    def _on_treeview_shift_click(self, tree: ttk.Treeview, event):
+        if tree.identify_region(event.x, event.y) != "heading":
+            return None
+        columna = tree.identify_column(event.x)  # '#n'
+        try:
+            col = tree['columns'][int(columna.lstrip('#')) - 1]
+        except (ValueError, IndexError):
+            return None
+        if col in self._tree_headers.get(str(tree), {}):
+            self._on_treeview_heading_click(tree, col, agregar=True)
+        return "break"
+
+    def _on_treeview_heading_click(self, tree: ttk.Treeview, col: str, agregar: bool = False):
+        tree_id = str(tree)
+        orden = list(self._tree_sort_state.get(tree_id, []))
+        posicion = next((i for i, (c, _) in enumerate(orden) if c == col), None)
+        if agregar:
+            if posicion is None:
+                orden.append((col, False))
+            else:
+                orden[posicion] = (col, not orden[posicion][1])
+        else:
+            descendente = posicion == 0 and not orden[0][1]
+            orden = [(col, descendente)]
+        self._tree_sort_state[tree_id] = orden
+        self._sort_treeview(tree)
+        # Actualizar textos de encabezado con flecha (y prioridad si hay varias columnas)
+        prioridad = {c: (i, desc) for i, (c, desc) in enumerate(orden)}
+        for c, base_text in self._tree_headers.get(tree_id, {}).items():
             arrow = ''
-            if c == col:
-                arrow = ' â–²' if not reverse else ' â–¼'
+            if c in prioridad:
+                i, desc = prioridad[c]
+                arrow = (FLECHA_DESC if desc else FLECHA_ASC) + (str(i + 1) if len(orden) > 1 else '')
             tree.heading(c, text=f"{base_text}{arrow}")
 
-    def _sort_treeview(self, tree: ttk.Treeview, col: str, numeric: bool, money: bool, reverse: bool = False):
-        def parse_value(v):
-            s = str(v)
-            if money:
-                s = s.replace('RD$', '').replace('$', '').replace(',', '.').strip()
-                try:
-                    return float(s)
-                except ValueError:
-                    return 0.0
-            if numeric:
-                try:
-                    return float(s.replace(',', '.'))
-                except ValueError:
-                    return 0.0
-            return s.lower()
-
-        items = [(parse_value(tree.set(k, col)), k) for k in tree.get_children('')]
-        items.sort(reverse=reverse)
-        for index, (_, k) in enumerate(items):
-            tree.move(k, '', index)
+    def _clave_orden_treeview(self, tree: ttk.Treeview, modelo: dict, col: str):
+        """Claves tipadas de una columna, calculadas una vez por carga de datos."""
+        cache = modelo['claves'].get(col)
+        if cache is not None:
+            return cache
+        config = self._tree_sort_config.get(str(tree), {})
+        funcion = config.get('claves', {}).get(col)
+        if funcion:
+            cache = {iid: funcion(fila) for iid, fila in modelo['filas'].items()}
+        else:
+            pos = list(tree['columns']).index(col)
+            money = col in config.get('money', ())
+            numeric = col in config.get('numeric', ())
+            cache = {iid: _clave_desde_texto(valores[pos], numeric=numeric, money=money)
+                     for iid, valores in modelo['valores'].items()}
+        modelo['claves'][col] = cache
+        return cache
+
+    def _sort_treeview(self, tree: ttk.Treeview):
+        orden = self._tree_sort_state.get(str(tree), [])
+        modelo = getattr(self, '_tree_modelos', {}).get(str(tree))
+        if not orden:
+            return
+        if modelo is None:
+            # Treeview llenado sin _poblar_treeview: construir el modelo desde lo mostrado
+            modelo = {'filas': {}, 'valores': {}, 'claves': {}}
+            for iid in tree.get_children(''):
+                modelo['valores'][iid] = tuple(tree.item(iid, 'values'))
+                modelo['filas'][iid] = dict(zip(tree['columns'], modelo['valores'][iid]))
+            if not hasattr(self, '_tree_modelos'):
+                self._tree_modelos = {}
+            self._tree_modelos[str(tree)] = modelo
+        iids = list(modelo['filas'].keys())
+        # Orden estable: de la columna menos prioritaria a la principal
+        for col, descendente in reversed(orden):
+            claves = self._clave_orden_treeview(tree, modelo, col)
+            iids.sort(key=claves.__getitem__, reverse=descendente)
+        tree.set_children('', *iids)  # reordena todo en una sola llamada
         self._apply_treeview_striping(tree)
 
-    def _apply_treeview_striping(self, tree: ttk.Treeview | None):
-        """Aplica filas alternas para dar contraste a los Treeview."""
+    def _apply_treeview_striping(self, tree: ttk.Treeview | None, reetiquetar: bool = True):
+        """Aplica filas alternas para dar contraste a los Treeview.
+        - reetiquetar=False solo configura los colores (las filas ya traen su tag)."""
         if not tree:
             return
         try:
@@ -1368,6 +1623,8 @@ class ColmadoApp:
                 tree.tag_configure('evenrow', background=self.colors.get('panel', '#ffffff'), foreground=self.colors.get('text', '#000000'))
                 tree.tag_configure('oddrow', background=self.colors.get('panel_alt', '#f4f6fb'), foreground=self.colors.get('text', '#000000'))
                 tree._striping_configured = True  # type: ignore[attr-defined]
+            if not reetiquetar:
+                return
             for idx, item in enumerate(tree.get_children('')):
                 tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
                 tree.item(item, tags=(tag,))
@@ -1375,40 +1632,40 @@ class ColmadoApp:
             print(f"Advertencia: no se pudo aplicar striping en Treeview: {exc}")
 
     def _refrescar_treeview_productos(self, productos):
-        tree = getattr(self, 'tree_productos_listado', None)
-        if not tree:
+        lista = getattr(self, 'lista_productos_listado', None)
+        if not lista:
             return
-        for item in tree.get_children():
-            tree.delete(item)
-        for producto in productos:
-            tree.insert("", tk.END, values=(
-                producto.get("id"),
-                producto.get("nombre"),
-                f"{producto.get('precio', 0.0):.2f}",
-                producto.get("stock"),
-                producto.get("categoria"),
-                producto.get("proveedor")
-            ))
-        self._apply_treeview_striping(tree)
+        lista.set_filas(productos)
+
+    @staticmethod
+    def _formatear_fila_producto(producto):
+        return (
+            producto.get("id"),
+            producto.get("nombre"),
+            f"{producto.get('precio', 0.0):.2f}",
+            producto.get("stock"),
+            producto.get("categoria"),
+            producto.get("proveedor")
+        )
+
+    def _programar_busqueda(self, clave, funcion, espera_ms=BUSQUEDA_ESPERA_MS):
+        """Ejecuta funcion cuando el usuario deja de teclear (una sola vez por ráfaga)."""
+        if not hasattr(self, '_busquedas_pendientes'):
+            self._busquedas_pendientes = {}
+        pendiente = self._busquedas_pendientes.pop(clave, None)
+        if pendiente:
+            self.root.after_cancel(pendiente)
+        def ejecutar():
+            self._busquedas_pendientes.pop(clave, None)
+            funcion()
+        self._busquedas_pendientes[clave] = self.root.after(espera_ms, ejecutar)
 
     def _filtrar_listado_productos(self, event=None):
-        if not hasattr(self, 'productos_listados_cache'):
+        indice = getattr(self, 'indice_productos_listado', None)
+        if indice is None:
             return
-        texto = (self.producto_busqueda_var.get() or "").lower()
-        if not texto:
-            filtrados = self.productos_listados_cache
-        else:
-            filtrados = []
-            for prod in self.productos_listados_cache:
-                cadena = " ".join([
-                    str(prod.get("nombre", "")),
-                    str(prod.get("categoria", "")),
-                    str(prod.get("proveedor", "")),
-                    str(prod.get("id", "")),
-                ]).lower()
-                if texto in cadena:
-                    filtrados.append(prod)
-        self._refrescar_treeview_productos(filtrados)
+        texto = self.producto_busqueda_var.get() or ""
+        self._refrescar_treeview_productos(indice.buscar(texto))
 
     def _style_scrolled_text(self, widget):
         if not widget:
@@ -1440,8 +1697,9 @@ class ColmadoApp:
             return
         self._set_active_nav_action('listar_productos')
         self._clear_display_frame()
-        productos = obtener_productos_para_gui()
-        self.productos_listados_cache = productos or []
+        self.productos_listados_cache = []
+        self.indice_productos_listado = None
+        self.lista_productos_listado = None
         self.producto_busqueda_var = tk.StringVar()
 
         search_frame = ttk.Frame(self.display_frame, padding=(0, 0, 0, 4))
@@ -1449,17 +1707,32 @@ class ColmadoApp:
         ttk.Label(search_frame, text="Buscar producto:").pack(side=tk.LEFT, padx=(0, 6))
         entry_buscar = ttk.Entry(search_frame, textvariable=self.producto_busqueda_var, width=30)
         entry_buscar.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        entry_buscar.bind("<KeyRelease>", self._filtrar_listado_productos)
-        entry_buscar.bind("<Return>", lambda e: (self.tree_productos_listado.focus_set(), "break"))
+        entry_buscar.bind("<KeyRelease>", lambda e: self._programar_busqueda('listado_productos', self._filtrar_listado_productos))
+        entry_buscar.bind("<Return>", lambda e: (self.lista_productos_listado and self.lista_productos_listado.tree.focus_set(), "break"))
+
+        cargando_label = ttk.Label(self.display_frame, text="Cargando productos...", font=("Arial", 12))
+        cargando_label.pack(padx=10, pady=10, anchor="center", expand=True)
+        self._ejecutar_en_fondo(
+            'listar_productos', obtener_productos_para_gui,
+            al_terminar=lambda productos: (cargando_label.destroy(), self._construir_listado_productos(productos))
+        )
 
+    def _construir_listado_productos(self, productos):
+        self.productos_listados_cache = productos or []
+        self.indice_productos_listado = IndiceBusqueda(
+            self.productos_listados_cache,
+            lambda p: (p.get("nombre"), p.get("categoria"), p.get("proveedor"), p.get("id"), p.get("codigo_barras"))
+        )
         if not productos:
             no_data_label = ttk.Label(self.display_frame, text="No hay productos para mostrar.", font=("Arial", 12))
             no_data_label.pack(padx=10, pady=10, anchor="center", expand=True)
             return
 
         columnas = ("id", "nombre", "precio_final", "stock", "categoria", "proveedor")
-        self.tree_productos_listado = ttk.Treeview(self.display_frame, columns=columnas, show="headings", height=15)
-        tree = self.tree_productos_listado
+        # Lista virtual: solo las filas visibles existen como items de Tk
+        self.lista_productos_listado = ListaVirtual(self.display_frame, columnas, self._formatear_fila_producto, colores=self.colors)
+        lista = self.lista_productos_listado
+        tree = lista.tree
         tree.heading("id", text="ID")
         tree.column("id", minwidth=0, width=50, stretch=tk.NO, anchor=tk.CENTER)
         tree.heading("nombre", text="Nombre")
@@ -1473,26 +1746,29 @@ class ColmadoApp:
         tree.heading("proveedor", text="Proveedor")
         tree.column("proveedor", minwidth=0, width=150, stretch=tk.YES)
 
-        scrollbar = ttk.Scrollbar(self.display_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self._refrescar_treeview_productos(self.productos_listados_cache)
-        # Habilitar ordenamiento por columnas (ID, Precio y Stock numéricos)
-        self._enable_treeview_sorting(
-            tree,
-            original_headers={
+        lista.pack(fill=tk.BOTH, expand=True)
+        # Ordenamiento sobre los datos (ID, Precio y Stock numéricos)
+        lista.habilitar_orden(
+            {
                 'id': 'ID', 'nombre': 'Nombre', 'precio_final': 'Precio Venta Final (RD$)',
                 'stock': 'Stock', 'categoria': 'Categoria', 'proveedor': 'Proveedor'
             },
-            numeric_cols={'id', 'stock'}, money_cols={'precio_final'}
+            {
+                'id': lambda p: p.get('id') or 0,
+                'nombre': lambda p: str(p.get('nombre') or '').casefold(),
+                'precio_final': lambda p: p.get('precio') or 0.0,
+                'stock': lambda p: p.get('stock') or 0.0,
+                'categoria': lambda p: str(p.get('categoria') or '').casefold(),
+                'proveedor': lambda p: str(p.get('proveedor') or '').casefold(),
+            }
         )
+        self._filtrar_listado_productos()  # respeta lo escrito en la búsqueda mientras cargaba
 
         # Acciones para administradores: Editar producto seleccionado
         actions_frame = ttk.Frame(self.display_frame)
         actions_frame.pack(fill=tk.X, pady=6)
         if self._allowed('editar_producto'):
-            ttk.Button(actions_frame, text="Editar Producto Seleccionado", command=lambda: self._abrir_editar_producto_dialog(tree), style="Accent.TButton").pack(side=tk.LEFT, padx=5)
+            ttk.Button(actions_frame, text="Editar Producto Seleccionado", command=lambda: self._abrir_editar_producto_dialog(lista), style="Accent.TButton").pack(side=tk.LEFT, padx=5)
 
     def _cargar_datos_combobox_agregar_prod(self):
         self.lista_categorias = obtener_categorias_existentes()
@@ -1504,6 +1780,7 @@ class ColmadoApp:
 
     def _clear_agregar_producto_form(self):
         self.nombre_prod_var.set("")
+        self.codigo_barras_prod_var.set("")
         self.precio_compra_prod_var.set("")
         self.precio_venta_sin_itbis_prod_var.set("") 
         self.tasa_itbis_seleccionada_var.set(0.18) 
@@ -1565,6 +1842,13 @@ class ColmadoApp:
         self.nombre_entry_prod.grid(row=current_row, column=1, columnspan=3, padx=5, pady=5, sticky="ew")
         current_row += 1
 
+        ttk.Label(form_frame, text="Código de Barras (Opcional):").grid(row=current_row, column=0, padx=5, pady=5, sticky="w")
+        self.codigo_barras_entry_prod = ttk.Entry(form_frame, textvariable=self.codigo_barras_prod_var, width=30)
+        self.codigo_barras_entry_prod.grid(row=current_row, column=1, padx=5, pady=5, sticky="ew")
+        # El lector envía Enter tras el código; no debe disparar nada más en el formulario
+        self.codigo_barras_entry_prod.bind("<Return>", lambda event: "break")
+        current_row += 1
+
         ttk.Label(form_frame, text="Precio Compra (RD$):").grid(row=current_row, column=0, padx=5, pady=5, sticky="w")
         # Validación numérica para precio de compra
         vcmd_num = (self.root.register(self._validate_numeric), '%P')
@@ -1682,6 +1966,7 @@ class ColmadoApp:
         
         datos_producto_nuevo = {
             "nombre": nombre,
+            "codigo_barras": self.codigo_barras_prod_var.get(),
             "precio_compra": precio_compra,
             "precio_venta_sin_itbis": precio_venta_sin_itbis,
             "aplica_itbis": aplica_itbis_final, 
@@ -1778,6 +2063,7 @@ class ColmadoApp:
             },
             numeric_cols={"id_c"},
             money_cols=set(),
+            claves={"id_c": lambda c: c.get("id") or 0},
         )
 
 
@@ -1831,6 +2117,7 @@ class ColmadoApp:
             },
             numeric_cols={"id_p"},
             money_cols=set(),
+            claves={"id_p": lambda p: p.get("id") or 0},
         )
 
     def _clear_registrar_proveedor_form(self):
@@ -1869,13 +2156,24 @@ class ColmadoApp:
             messagebox.showerror("Error al Guardar", resultado.get("mensaje", "No se pudo guardar el proveedor."), parent=self.display_frame)
 
     def _on_producto_venta_keyup(self, event=None):
-        texto_busqueda = self.producto_venta_seleccionado_var.get().lower()
-        if not texto_busqueda:
+        if event is not None and event.keysym in ("Return", "KP_Enter", "Up", "Down", "Escape", "Tab"):
+            return
+        self._programar_busqueda('producto_venta', self._filtrar_productos_venta)
+
+    def _filtrar_productos_venta(self):
+        if not self._widget_vivo(getattr(self, 'producto_venta_combo', None)):
+            return
+        texto_busqueda = self.producto_venta_seleccionado_var.get()
+        indice = getattr(self, 'indice_productos_venta', None)
+        if not texto_busqueda or indice is None:
             self.lista_display_productos_venta_filtrada = self.lista_display_productos_venta_original[:]
+        elif "(Precio:" in texto_busqueda and texto_busqueda in self.lista_display_productos_venta_original:
+            # Opción ya elegida en el combobox ("ID - Nombre (Precio: ...)")
+            self.lista_display_productos_venta_filtrada = [texto_busqueda]
         else:
             self.lista_display_productos_venta_filtrada = [
-                item_display for item_display in self.lista_display_productos_venta_original
-                if texto_busqueda in item_display.lower()
+                self._texto_venta_por_id[p['id']] for p in indice.buscar(texto_busqueda)
+                if p['id'] in self._texto_venta_por_id
             ]
         current_text_in_box = self.producto_venta_combo.get()
         self.producto_venta_combo['values'] = self.lista_display_productos_venta_filtrada
@@ -1893,9 +2191,62 @@ class ColmadoApp:
                 pass
 
     def _agregar_item_a_venta_actual_event(self, event=None):
-        self._agregar_item_a_venta_actual()
+        # Un lector escaneando sobre el combo también termina en Enter
+        codigo = self.producto_venta_seleccionado_var.get().strip()
+        if codigo in getattr(self, '_productos_venta_por_codigo', {}):
+            self.producto_venta_seleccionado_var.set("")
+            self._agregar_codigo_barras_a_venta(codigo)
+        else:
+            self._agregar_item_a_venta_actual()
+        return "break"
+
+    def _agregar_por_codigo_barras_event(self, event=None):
+        if self._avisar_venta_en_proceso():
+            return "break"  # el código queda en el campo para reintentar con Enter
+        codigo = self.codigo_barras_venta_var.get().strip()
+        self.codigo_barras_venta_var.set("")
+        if codigo:
+            self._agregar_codigo_barras_a_venta(codigo)
         return "break"
 
+    def _agregar_codigo_barras_a_venta(self, codigo):
+        """Escaneo: busca el código en el índice en memoria y agrega el producto a la venta."""
+        cantidad = self._leer_cantidad_venta()
+        if cantidad is None:
+            return
+        producto_info = self._productos_venta_por_codigo.get(codigo)
+        if producto_info is not None:
+            self._agregar_producto_a_venta(producto_info, cantidad)
+            return
+        # No está en la lista de venta (sin stock o creado en otra terminal): consultar por el índice único
+        self._ejecutar_en_fondo(
+            f'codigo_barras:{codigo}', obtener_producto_por_codigo_barras, codigo,
+            al_terminar=lambda producto: self._codigo_barras_resuelto(codigo, producto, cantidad)
+        )
+
+    def _codigo_barras_resuelto(self, codigo, producto, cantidad):
+        if not self._widget_vivo(getattr(self, 'codigo_barras_venta_entry', None)):
+            return
+        if producto is None:
+            messagebox.showwarning("Código no encontrado", f"No hay ningún producto con el código '{codigo}'.", parent=self.display_frame)
+        elif producto.get('stock', 0) <= 0:
+            messagebox.showwarning("Sin Stock", f"'{producto.get('nombre', 'N/A')}' no tiene stock disponible.", parent=self.display_frame)
+        else:
+            producto = self._registrar_producto_venta(producto)
+            self._agregar_producto_a_venta(producto, cantidad)
+        self.codigo_barras_venta_entry.focus()
+
+    def _registrar_producto_venta(self, producto):
+        """Agrega a la lista de venta un producto que no estaba cargada (o retorna el existente)."""
+        existente = self._productos_venta_por_id.get(producto.get('id'))
+        if existente is not None:
+            return existente
+        self.productos_para_venta_datos.append(producto)
+        self.lista_display_productos_venta_original.append(self._texto_producto_venta(producto))
+        self.lista_display_productos_venta_filtrada = self.lista_display_productos_venta_original[:]
+        self._indexar_productos_venta()
+        return producto
+
     def _confirmar_venta_action_event(self, event=None):
         self._confirmar_venta_action()
         return "break"
@@ -1906,13 +2257,60 @@ class ColmadoApp:
         self.lista_display_clientes_venta = ["Ninguno"] + sorted(list(self.clientes_venta_map.keys()))
 
         self.productos_para_venta_datos = obtener_productos_para_venta_gui() 
-        self.lista_display_productos_venta_original = []
-        for p in self.productos_para_venta_datos:
-            precio_a_mostrar = p.get('precio_final_venta', p.get('precio', 0.0))
-            display_text = f"{p.get('id','N/A')} - {p.get('nombre','N/A')} (Precio: RD$ {precio_a_mostrar:.2f} - Stock: {p.get('stock',0)})"
-            self.lista_display_productos_venta_original.append(display_text)
+        self.lista_display_productos_venta_original = [self._texto_producto_venta(p) for p in self.productos_para_venta_datos]
         self.lista_display_productos_venta_filtrada = self.lista_display_productos_venta_original[:]
+        self._indexar_productos_venta()
+
+    def _indexar_productos_venta(self):
+        # Índices O(1) para selección y escaneo; comparten los dicts de productos_para_venta_datos
+        self._productos_venta_por_id = {p.get('id'): p for p in self.productos_para_venta_datos}
+        self._productos_venta_por_codigo = {
+            p['codigo_barras']: p for p in self.productos_para_venta_datos if p.get('codigo_barras')
+        }
+        self._texto_venta_por_id = {
+            p.get('id'): texto for p, texto in zip(self.productos_para_venta_datos, self.lista_display_productos_venta_original)
+        }
+        self.indice_productos_venta = IndiceBusqueda(
+            self.productos_para_venta_datos,
+            lambda p: (p.get('id'), p.get('nombre'), p.get('categoria'))
+        )
+
+    def _texto_producto_venta(self, p):
+        precio_a_mostrar = p.get('precio_final_venta', p.get('precio', 0.0))
+        return f"{p.get('id','N/A')} - {p.get('nombre','N/A')} (Precio: RD$ {precio_a_mostrar:.2f} - Stock: {p.get('stock',0)})"
+
+    def _aplicar_stock_vendido(self, stock_actualizado):
+        """Actualiza stock y texto solo de los productos vendidos; quita los que quedaron en cero."""
+        if not stock_actualizado:
+            return
+        productos, textos = [], []
+        agotados = False
+        for p, texto in zip(self.productos_para_venta_datos, self.lista_display_productos_venta_original):
+            nuevo_stock = stock_actualizado.get(p.get('id'))
+            if nuevo_stock is not None:
+                if nuevo_stock <= 0:
+                    agotados = True
+                    continue
+                p['stock'] = float(nuevo_stock)
+                texto = self._texto_producto_venta(p)
+                if hasattr(self, '_texto_venta_por_id'):
+                    self._texto_venta_por_id[p.get('id')] = texto
+            productos.append(p)
+            textos.append(texto)
+        self.productos_para_venta_datos = productos
+        self.lista_display_productos_venta_original = textos
+        self.lista_display_productos_venta_filtrada = textos[:]
+        if agotados:
+            self._indexar_productos_venta()
     
+    def _producto_venta_desde_texto(self, texto):
+        """Producto de la lista de venta para el texto "id - nombre (...)" del combo, o None."""
+        try:
+            producto_id = int(texto.split(" - ")[0])
+        except (ValueError, IndexError):
+            return None
+        return getattr(self, '_productos_venta_por_id', {}).get(producto_id)
+
     def _actualizar_info_producto_seleccionado_venta(self, event=None):
         seleccion_actual_str = self.producto_venta_seleccionado_var.get()
         if not seleccion_actual_str or not self.productos_para_venta_datos:
@@ -1921,13 +2319,11 @@ class ColmadoApp:
             return
 
         try:
-            producto_id_seleccionado = int(seleccion_actual_str.split(" - ")[0])
-            producto_info = next((p for p in self.productos_para_venta_datos if p.get("id") == producto_id_seleccionado), None)
+            producto_info = self._producto_venta_desde_texto(seleccion_actual_str)
 
             if producto_info:
-                stock_ya_en_cesta = 0.0
-                item_en_cesta = next((item for item in self.items_en_venta_actual if item.get("id") == producto_id_seleccionado), None)
-                if item_en_cesta: stock_ya_en_cesta = float(item_en_cesta.get("cantidad",0))
+                producto_id_seleccionado = producto_info.get("id")
+                stock_ya_en_cesta = self.carrito_venta.cantidad(producto_id_seleccionado)
                 
                 stock_visual_disponible = float(producto_info.get('stock', 0)) - stock_ya_en_cesta
                 self.stock_disponible_venta_label.config(text=f"Stock Disp: {stock_visual_disponible:.2f}")
@@ -1944,33 +2340,43 @@ class ColmadoApp:
             self.stock_disponible_venta_label.config(text="Stock Disp: Error")
             self.precio_unitario_venta_label.config(text="Precio U: Error")
 
+    def _leer_cantidad_venta(self):
+        """Cantidad del campo de venta como float > 0; muestra el aviso y retorna None si no es válida."""
+        try:
+            cantidad = float(self.cantidad_venta_var.get().replace(',', '.'))
+        except ValueError:
+            messagebox.showwarning("Cantidad Invalida", "La cantidad debe ser un numero valido (ej: 1 o 0.5).", parent=self.display_frame)
+            return None
+        if cantidad <= 0:
+            messagebox.showwarning("Cantidad Invalida", "La cantidad debe ser mayor a cero.", parent=self.display_frame)
+            return None
+        return cantidad
+
     def _agregar_item_a_venta_actual(self):
         producto_seleccionado_str = self.producto_venta_seleccionado_var.get()
-        cantidad_str = self.cantidad_venta_var.get()
 
         if not producto_seleccionado_str:
             messagebox.showwarning("Producto no seleccionado", "Por favor, seleccione un producto de la lista.", parent=self.display_frame)
             return
 
-        try:
-            cantidad_a_agregar = float(cantidad_str.replace(',', '.')) 
-            if cantidad_a_agregar <= 0:
-                messagebox.showwarning("Cantidad Invalida", "La cantidad debe ser mayor a cero.", parent=self.display_frame)
-                return
-        except ValueError:
-            messagebox.showwarning("Cantidad Invalida", "La cantidad debe ser un numero valido (ej: 1 o 0.5).", parent=self.display_frame)
+        cantidad_a_agregar = self._leer_cantidad_venta()
+        if cantidad_a_agregar is None:
             return
 
-        try:
-            producto_id = int(producto_seleccionado_str.split(" - ")[0])
-            producto_info_original = next((p for p in self.productos_para_venta_datos if p.get("id") == producto_id), None)
-
-            if not producto_info_original:
-                messagebox.showerror("Error de Producto", "El producto seleccionado no es valido.", parent=self.display_frame)
-                return
+        producto_info_original = self._producto_venta_desde_texto(producto_seleccionado_str)
+        if not producto_info_original:
+            messagebox.showerror("Error de Producto", "El producto seleccionado no es valido.", parent=self.display_frame)
+            return
+        if self._agregar_producto_a_venta(producto_info_original, cantidad_a_agregar):
+            if hasattr(self, 'cantidad_venta_entry'): self.cantidad_venta_entry.focus()
 
-            item_existente_en_cesta = next((item for item in self.items_en_venta_actual if item.get("id") == producto_id), None)
-            cantidad_ya_en_cesta = float(item_existente_en_cesta.get("cantidad",0.0)) if item_existente_en_cesta else 0.0
+    def _agregar_producto_a_venta(self, producto_info_original, cantidad_a_agregar):
+        """Suma cantidad_a_agregar del producto al carrito validando stock. Retorna True si se agregó."""
+        if self._avisar_venta_en_proceso():
+            return False
+        try:
+            producto_id = producto_info_original.get("id")
+            cantidad_ya_en_cesta = self.carrito_venta.cantidad(producto_id)
             stock_original_producto = float(producto_info_original.get('stock', 0))
 
             if stock_original_producto != 0 and (cantidad_ya_en_cesta + cantidad_a_agregar) > stock_original_producto:
@@ -1981,79 +2387,80 @@ class ColmadoApp:
                                        f"Intentando agregar: {cantidad_a_agregar}\n"
                                        f"Maximo adicional posible: {stock_original_producto - cantidad_ya_en_cesta:.2f}",
                                        parent=self.display_frame)
-                return
-            
-            precio_unitario_item_venta = float(producto_info_original.get('precio_final_venta', producto_info_original.get('precio',0.0)))
-            precio_sin_itbis_item = float(producto_info_original.get('precio_venta_sin_itbis', precio_unitario_item_venta))
-            itbis_del_item_unitario = 0.0
-            if producto_info_original.get('aplica_itbis'): 
-                itbis_del_item_unitario = precio_unitario_item_venta - precio_sin_itbis_item
-
-            if item_existente_en_cesta:
-                item_existente_en_cesta["cantidad"] += cantidad_a_agregar
-                item_existente_en_cesta["subtotal"] = item_existente_en_cesta["cantidad"] * item_existente_en_cesta["precio_unitario"]
-                item_existente_en_cesta["itbis_item_total"] = item_existente_en_cesta["cantidad"] * itbis_del_item_unitario 
-            else:
-                self.items_en_venta_actual.append({
-                    "id": producto_info_original.get("id"), 
-                    "nombre": producto_info_original.get("nombre"),
-                    "cantidad": cantidad_a_agregar,
-                    "precio_unitario": precio_unitario_item_venta, 
-                    "subtotal": cantidad_a_agregar * precio_unitario_item_venta,
-                    "itbis_item_total": cantidad_a_agregar * itbis_del_item_unitario 
-                })
-
-            self._actualizar_treeview_items_venta()
-            self._actualizar_sumario_venta() 
+                return False
+
+            # El carrito notifica la línea cambiada: fila del Treeview y totales se actualizan solos
+            self.carrito_venta.agregar(producto_info_original, cantidad_a_agregar)
             self._actualizar_info_producto_seleccionado_venta()
             self.cantidad_venta_var.set("1") 
-            if hasattr(self, 'cantidad_venta_entry'): self.cantidad_venta_entry.focus()
+            return True
 
-        except (ValueError, IndexError) as e:
-            print(f"Error de seleccion o valor al agregar item: {e}, string: '{producto_seleccionado_str}'")
+        except (ValueError, TypeError) as e:
+            print(f"Error de valor al agregar item: {e}, producto: '{producto_info_original.get('id')}'")
             messagebox.showerror("Error de Seleccion/Valor", "Producto o valor no valido al agregar item.", parent=self.display_frame)
         except Exception as e:
             print(f"Error general al agregar item: {e}")
             messagebox.showerror("Error al agregar", f"Ocurrio un error inesperado: {e}", parent=self.display_frame)
+        return False
     
+    @staticmethod
+    def _valores_linea_venta(item):
+        return (
+            item.get("id"),
+            item.get("nombre"),
+            f"{item.get('cantidad'):.2f}" if isinstance(item.get('cantidad'), float) else item.get('cantidad'),
+            f"RD$ {item.get('precio_unitario', 0.0):.2f}",
+            f"RD$ {item.get('subtotal', 0.0):.2f}"
+        )
+
     def _actualizar_treeview_items_venta(self):
+        """Redibuja todas las líneas (solo al construir la pantalla; luego se usa _on_carrito_cambio)."""
         if hasattr(self, 'tree_items_venta'):
-            for i in self.tree_items_venta.get_children():
-                self.tree_items_venta.delete(i)
-            for item in self.items_en_venta_actual:
-                self.tree_items_venta.insert("", tk.END, values=(
-                    item.get("id"),
-                    item.get("nombre"),
-                    f"{item.get('cantidad'):.2f}" if isinstance(item.get('cantidad'), float) else item.get('cantidad'),
-                    f"RD$ {item.get('precio_unitario', 0.0):.2f}",
-                    f"RD$ {item.get('subtotal', 0.0):.2f}"
-                ))
-            self._apply_treeview_striping(self.tree_items_venta)
-    
+            self.tree_items_venta.delete(*self.tree_items_venta.get_children())
+            for idx, item in enumerate(self.carrito_venta):
+                self.tree_items_venta.insert("", tk.END, iid=str(item.get("id")), values=self._valores_linea_venta(item),
+                                             tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+            self._apply_treeview_striping(self.tree_items_venta, reetiquetar=False)
+
+    def _on_carrito_cambio(self, evento, linea):
+        """Aplica al Treeview solo la fila afectada y refresca los totales acumulados."""
+        tree = getattr(self, 'tree_items_venta', None)
+        if self._widget_vivo(tree):
+            if evento == LINEA_AGREGADA:
+                tag = 'evenrow' if len(tree.get_children()) % 2 == 0 else 'oddrow'
+                tree.insert("", tk.END, iid=str(linea['id']), values=self._valores_linea_venta(linea), tags=(tag,))
+            elif evento == LINEA_MODIFICADA:
+                tree.item(str(linea['id']), values=self._valores_linea_venta(linea))
+            elif evento == LINEA_ELIMINADA:
+                iid = str(linea['id'])
+                desde = tree.index(iid)
+                tree.delete(iid)
+                # Solo cambian de color las filas que estaban debajo de la eliminada
+                for idx, item in enumerate(tree.get_children()[desde:], start=desde):
+                    tree.item(item, tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+            else:
+                tree.delete(*tree.get_children())
+        self._actualizar_sumario_venta()
+
     def _eliminar_item_de_venta_actual(self):
         if not hasattr(self, 'tree_items_venta'): return
+        if self._avisar_venta_en_proceso(): return
         seleccion = self.tree_items_venta.selection()
         if not seleccion: 
             messagebox.showwarning("Nada seleccionado", "Seleccione un producto de la lista para eliminar.", parent=self.display_frame)
             return
 
-        item_seleccionado_values = self.tree_items_venta.item(seleccion[0])["values"]
-        if not item_seleccionado_values: return
-
-        item_seleccionado_id_tree = item_seleccionado_values[0]
-
-        self.items_en_venta_actual = [item for item in self.items_en_venta_actual if str(item.get("id")) != str(item_seleccionado_id_tree)]
-        self._actualizar_treeview_items_venta()
-        self._actualizar_sumario_venta()
+        try:
+            producto_id = int(seleccion[0])
+        except ValueError:
+            return
+        self.carrito_venta.eliminar(producto_id)
         self._actualizar_info_producto_seleccionado_venta()
 
     def _actualizar_sumario_venta(self, event=None):
-        subtotal_con_itbis_antes_descuento = 0.0
-        itbis_total_de_la_venta = 0.0
-
-        for item in self.items_en_venta_actual:
-            subtotal_con_itbis_antes_descuento += item.get("subtotal", 0.0) 
-            itbis_total_de_la_venta += item.get("itbis_item_total", 0.0) 
+        # Totales acumulados por el carrito: no se recorren las líneas
+        subtotal_con_itbis_antes_descuento = self.carrito_venta.subtotal
+        itbis_total_de_la_venta = self.carrito_venta.itbis
 
         self.subtotal_bruto_venta_var.set(round(subtotal_con_itbis_antes_descuento, 2))
         self.itbis_total_venta_var.set(round(itbis_total_de_la_venta, 2))
@@ -2093,7 +2500,9 @@ class ColmadoApp:
             self.cambio_devuelto_var.set("Entrada Invalida") if self.dinero_recibido_var.get() else "RD$ 0.00"
 
     def _confirmar_venta_action(self):
-        if not self.items_en_venta_actual:
+        if getattr(self, '_venta_en_proceso', False):
+            return
+        if not self.carrito_venta:
             messagebox.showwarning("Venta Vacia", "Agregue productos a la venta antes de confirmar.", parent=self.display_frame)
             return
         self._actualizar_sumario_venta() 
@@ -2118,51 +2527,91 @@ class ColmadoApp:
         descuento_monto = self.descuento_aplicado_monto_var.get()
         itbis_total_para_guardar = self.itbis_total_venta_var.get()
         
-        subtotal_real_sin_itbis = 0.0
-        for item in self.items_en_venta_actual:
-            precio_unitario_final_item = item.get("precio_unitario", 0.0)
-            itbis_item_total = item.get("itbis_item_total", 0.0)
-            cantidad_item = item.get("cantidad", 1)
-            if cantidad_item == 0: cantidad_item = 1 # Evitar división por cero si la cantidad es 0
-            
-            precio_unitario_sin_itbis_item = precio_unitario_final_item - (itbis_item_total / cantidad_item)
-            subtotal_real_sin_itbis += precio_unitario_sin_itbis_item * cantidad_item
+        subtotal_real_sin_itbis = self.carrito_venta.subtotal_sin_itbis
 
         confirm_msg = (f"Total a Pagar: RD$ {total_a_pagar:.2f}\nITBIS Incluido: RD$ {itbis_total_para_guardar:.2f}\nDinero Recibido: RD$ {dinero_recibido_float:.2f}\nCambio a Devolver: RD$ {cambio_calculado:.2f}\n\n¿Confirmar y guardar la venta?")
         confirm = messagebox.askyesno("Confirmar Venta Final", confirm_msg, parent=self.display_frame)
         if not confirm: return
-        resultado = procesar_nueva_venta_gui( cliente_id_seleccionado=cliente_id_final, items_vendidos=self.items_en_venta_actual, total_bruto_sin_itbis=subtotal_real_sin_itbis, itbis_total_venta=itbis_total_para_guardar, descuento_aplicado=descuento_monto, total_neto=total_a_pagar, dinero_recibido=dinero_recibido_float, cambio_devuelto=cambio_calculado )
+        # La venta se guarda en segundo plano; no se cancela al cambiar de pantalla
+        clave_enviada = self.carrito_venta.clave_idempotencia
+        self._marcar_venta_en_proceso(True)
+        self.worker.ejecutar(
+            self.ventas_offline.procesar_venta,
+            nombre_cliente="Consumidor Final" if cliente_nombre_sel == "Ninguno" else cliente_nombre_sel,
+            clave_idempotencia=clave_enviada,
+            cliente_id_seleccionado=cliente_id_final, items_vendidos=self.carrito_venta.lineas(),
+            total_bruto_sin_itbis=subtotal_real_sin_itbis, itbis_total_venta=itbis_total_para_guardar,
+            descuento_aplicado=descuento_monto, total_neto=total_a_pagar,
+            dinero_recibido=dinero_recibido_float, cambio_devuelto=cambio_calculado,
+            al_terminar=lambda resultado: self._venta_procesada(resultado, clave_enviada, cliente_nombre_sel),
+            al_fallar=lambda exc: (self._marcar_venta_en_proceso(False), self._mostrar_error_en_fondo(exc)),
+        )
+
+    def _marcar_venta_en_proceso(self, en_proceso: bool):
+        self._venta_en_proceso = en_proceso
+        btn = getattr(self, 'btn_confirmar_venta', None)
+        try:
+            if btn:
+                btn.state(["disabled"] if en_proceso else ["!disabled"])
+                btn.configure(text="Guardando venta..." if en_proceso else "Confirmar y Guardar Venta")
+        except tk.TclError:
+            pass
+
+    def _avisar_venta_en_proceso(self) -> bool:
+        """True (con aviso) si hay una venta guardándose: el carrito enviado no se edita hasta que termine."""
+        if not getattr(self, '_venta_en_proceso', False):
+            return False
+        messagebox.showwarning("Venta en proceso", "Espere a que termine de guardarse la venta antes de modificar el carrito.", parent=self.display_frame)
+        return True
+
+    def _venta_procesada(self, resultado, clave_enviada, cliente_nombre_sel):
+        self._marcar_venta_en_proceso(False)
+        pantalla_venta_visible = self._widget_vivo(getattr(self, 'tree_items_venta', None))
         if resultado["exito"]:
-            messagebox.showinfo("Venta Exitosa", resultado["mensaje"], parent=self.display_frame)
+            if resultado.get('offline'):
+                messagebox.showwarning("Venta sin conexión", resultado["mensaje"], parent=self.display_frame)
+            else:
+                messagebox.showinfo("Venta Exitosa", resultado["mensaje"], parent=self.display_frame)
             if 'venta_registrada' in resultado:
                 venta_guardada = resultado['venta_registrada']
                 nombre_cliente_factura = cliente_nombre_sel if cliente_nombre_sel != "Ninguno" else "Consumidor Final"
-                texto_factura_generada = generar_texto_factura(venta_guardada, nombre_cliente_factura, datos_empresa=self._get_empresa_info())
+                texto_factura_generada = self._plantilla_factura().renderizar(venta_guardada, nombre_cliente_factura)
                 nombre_archivo_factura = ""
-                try:
-                    factura_dir = "Facturas"; os.makedirs(factura_dir, exist_ok=True)
-                    id_venta_actual = venta_guardada.get('id', 'desconocida')
-                    nombre_archivo_factura = os.path.join(factura_dir, f"factura_{id_venta_actual:05d}.txt")
-                    with open(nombre_archivo_factura, "w", encoding="utf-8") as f_out: f_out.write(texto_factura_generada)
-                    print(f"Factura guardada en: {nombre_archivo_factura}")
-                except Exception as e_file: messagebox.showerror("Error al Guardar Factura", f"No se pudo guardar el archivo de factura:\n{e_file}", parent=self.display_frame)
+                # Factura provisional (sin conexión): la definitiva se archiva al sincronizar
+                if not resultado.get('offline'):
+                    try:
+                        # Se agrega al archivo de facturas desde la cola en segundo plano (reintenta si falla)
+                        self.cola_impresion.archivar(venta_guardada.get('id'), texto_factura_generada)
+                        nombre_archivo_factura = self.archivo_facturas.carpeta
+                    except Exception as e_file: messagebox.showerror("Error al Guardar Factura", f"No se pudo guardar el archivo de factura:\n{e_file}", parent=self.display_frame)
                 self._mostrar_factura_en_ventana(texto_factura_generada, venta_guardada.get('id', 0), nombre_archivo_factura)
-            self._limpiar_estado_nueva_venta()
-            self._cargar_datos_para_nueva_venta() 
-            if hasattr(self, 'producto_venta_combo'): self.producto_venta_combo['values'] = self.lista_display_productos_venta_filtrada
-            if hasattr(self, 'cliente_venta_combo'): self.cliente_venta_combo['values'] = self.lista_display_clientes_venta
-            self.cliente_venta_var.set("Ninguno") 
-            if hasattr(self, 'producto_venta_combo'): self.producto_venta_combo.focus()
+            # Solo se parchean los productos vendidos; clientes y demás productos no cambian
+            self._aplicar_stock_vendido(resultado.get('stock_actualizado') or {})
+            # Si mientras se guardaba el carrito cambió (venta cancelada y otra empezada), no se toca
+            if self.carrito_venta.clave_idempotencia == clave_enviada:
+                if pantalla_venta_visible:
+                    self._limpiar_estado_nueva_venta()
+                    self.cliente_venta_var.set("Ninguno") 
+                    self.codigo_barras_venta_entry.focus()
+                else:
+                    self.carrito_venta.vaciar()
         else: messagebox.showerror("Error en Venta", resultado["mensaje"], parent=self.display_frame)
 
+    @staticmethod
+    def _widget_vivo(widget) -> bool:
+        try:
+            return bool(widget) and bool(widget.winfo_exists())
+        except tk.TclError:
+            return False
+
     def _limpiar_estado_nueva_venta(self):
         self.cliente_venta_var.set("Ninguno")
         self.producto_venta_seleccionado_var.set("")
+        self.codigo_barras_venta_var.set("")
         self.cantidad_venta_var.set("1")
         self.descuento_venta_var.set("0")
         self.dinero_recibido_var.set("")
-        self.items_en_venta_actual = []
-        if hasattr(self, 'tree_items_venta'): self._actualizar_treeview_items_venta()
+        self.carrito_venta.vaciar()
         self._actualizar_sumario_venta() 
         if hasattr(self, 'stock_disponible_venta_label'): self.stock_disponible_venta_label.config(text="Stock Disp: -")
         if hasattr(self, 'precio_unitario_venta_label'): self.precio_unitario_venta_label.config(text="Precio U: -")
@@ -2184,7 +2633,11 @@ class ColmadoApp:
         venta_main_frame.pack(fill=tk.BOTH, expand=True)
         top_controls_frame = ttk.Frame(venta_main_frame)
         top_controls_frame.pack(fill=tk.X, pady=(0, 5))
-        ttk.Label(top_controls_frame, text="Cliente:").pack(side=tk.LEFT, padx=(0, 2))
+        ttk.Label(top_controls_frame, text="Código:").pack(side=tk.LEFT, padx=(0, 2))
+        self.codigo_barras_venta_entry = ttk.Entry(top_controls_frame, textvariable=self.codigo_barras_venta_var, width=16)
+        self.codigo_barras_venta_entry.pack(side=tk.LEFT, padx=2)
+        self.codigo_barras_venta_entry.bind("<Return>", self._agregar_por_codigo_barras_event)
+        ttk.Label(top_controls_frame, text="Cliente:").pack(side=tk.LEFT, padx=(5, 2))
         self.cliente_venta_combo = ttk.Combobox(top_controls_frame, textvariable=self.cliente_venta_var, values=self.lista_display_clientes_venta, state="readonly", width=18)
         self.cliente_venta_combo.pack(side=tk.LEFT, padx=2)
         ttk.Label(top_controls_frame, text="Producto:").pack(side=tk.LEFT, padx=(5, 2))
@@ -2224,6 +2677,7 @@ class ColmadoApp:
         scrollbar_items_venta.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree_items_venta.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.tree_items_venta.bind("<Delete>", lambda e: (self._eliminar_item_de_venta_actual(), "break"))
+        self._actualizar_treeview_items_venta()
         
         summary_payment_frame = ttk.LabelFrame(venta_main_frame, text="Resumen y Pago", padding="10")
         summary_payment_frame.pack(fill=tk.X, pady=5)
@@ -2276,12 +2730,14 @@ class ColmadoApp:
             style="Secondary.TButton"
         )
         btn_cancelar_venta.pack(side=tk.LEFT, padx=5)
-        btn_confirmar_venta = ttk.Button(venta_actions_frame, text="Confirmar y Guardar Venta", command=self._confirmar_venta_action, style="Accent.TButton")
-        btn_confirmar_venta.pack(side=tk.RIGHT, padx=10)
+        self.btn_confirmar_venta = ttk.Button(venta_actions_frame, text="Confirmar y Guardar Venta", command=self._confirmar_venta_action, style="Accent.TButton")
+        self.btn_confirmar_venta.pack(side=tk.RIGHT, padx=10)
+        self._marcar_venta_en_proceso(getattr(self, '_venta_en_proceso', False))
         
         self._limpiar_estado_nueva_venta() 
         self._actualizar_info_producto_seleccionado_venta()
-        if hasattr(self, 'producto_venta_combo'): self.producto_venta_combo.focus()
+        # El foco inicial queda en el código de barras: el lector escribe el código y envía Enter
+        self.codigo_barras_venta_entry.focus()
 
     def historial_ventas_action(self):
         if not self._guard('historial_ventas'):
@@ -2309,7 +2765,13 @@ class ColmadoApp:
         hist_main_frame = ttk.Frame(self.display_frame)
         hist_main_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         columnas_hist = ("id_v", "fecha_v", "cliente_v", "subtotal_s_itbis_v", "itbis_v", "descuento_v", "total_v")
-        self.tree_historial_ventas = ttk.Treeview(hist_main_frame, columns=columnas_hist, show="headings", height=10)
+        self.lista_historial_ventas = ListaVirtual(
+            hist_main_frame, columnas_hist, self._formatear_fila_historial_venta, colores=self.colors,
+            al_seleccionar=self._mostrar_detalle_venta_historial,
+            al_llegar_al_final=self._on_historial_ventas_fin,
+            mensaje_vacio="No hay ventas en este periodo."
+        )
+        self.tree_historial_ventas = self.lista_historial_ventas.tree
         self.tree_historial_ventas.heading("id_v", text="ID Venta"); self.tree_historial_ventas.column("id_v", width=60, anchor=tk.CENTER, stretch=tk.NO)
         self.tree_historial_ventas.heading("fecha_v", text="Fecha y Hora"); self.tree_historial_ventas.column("fecha_v", width=130, stretch=tk.NO)
         self.tree_historial_ventas.heading("cliente_v", text="Cliente"); self.tree_historial_ventas.column("cliente_v", width=150, stretch=tk.YES)
@@ -2317,11 +2779,20 @@ class ColmadoApp:
         self.tree_historial_ventas.heading("itbis_v", text="ITBIS"); self.tree_historial_ventas.column("itbis_v", width=80, anchor=tk.E, stretch=tk.NO)
         self.tree_historial_ventas.heading("descuento_v", text="Descuento"); self.tree_historial_ventas.column("descuento_v", width=80, anchor=tk.E, stretch=tk.NO)
         self.tree_historial_ventas.heading("total_v", text="Total Venta"); self.tree_historial_ventas.column("total_v", width=100, anchor=tk.E, stretch=tk.NO)
-        scrollbar_hist_main = ttk.Scrollbar(hist_main_frame, orient=tk.VERTICAL, command=self.tree_historial_ventas.yview)
-        self.tree_historial_ventas.configure(yscrollcommand=scrollbar_hist_main.set)
-        scrollbar_hist_main.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree_historial_ventas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.tree_historial_ventas.bind("<<TreeviewSelect>>", self._mostrar_detalle_venta_historial)
+        self.lista_historial_ventas.pack(fill=tk.BOTH, expand=True)
+        self.lista_historial_ventas.habilitar_orden(
+            {'id_v': 'ID Venta', 'fecha_v': 'Fecha y Hora', 'cliente_v': 'Cliente', 'subtotal_s_itbis_v': 'Subtotal s/ITBIS',
+             'itbis_v': 'ITBIS', 'descuento_v': 'Descuento', 'total_v': 'Total Venta'},
+            {
+                'id_v': lambda v: v.get('id_venta') or 0,
+                'fecha_v': lambda v: v.get('fecha') or '',
+                'cliente_v': lambda v: str(v.get('nombre_cliente') or '').casefold(),
+                'subtotal_s_itbis_v': lambda v: v.get('subtotal_bruto_sin_itbis') or 0.0,
+                'itbis_v': lambda v: v.get('itbis_total_venta') or 0.0,
+                'descuento_v': lambda v: v.get('descuento_aplicado') or 0.0,
+                'total_v': lambda v: v.get('total_final') or 0.0,
+            }
+        )
         self.label_detalle_venta_id_frame = ttk.LabelFrame(self.display_frame, text="Detalles de Venta ID: - (Seleccione una venta de arriba)", padding="10")
         self.label_detalle_venta_id_frame.pack(fill=tk.X, pady=10)
         columnas_detalle = ("prod_d", "cant_d", "pu_d", "sub_d")
@@ -2353,43 +2824,91 @@ class ColmadoApp:
                 if fecha_inicio > fecha_fin:
                     messagebox.showerror("Error de Fechas", "La fecha de inicio no puede ser posterior a la fecha de fin.", parent=self.display_frame); return
             except ValueError: messagebox.showerror("Error de Fechas", "Formato de fecha incorrecto. Use YYYY-MM-DD.", parent=self.display_frame); return
-        resultado_ventas = obtener_ventas_para_historial_gui(fecha_inicio, fecha_fin)
-        self.ventas_cargadas_actualmente = resultado_ventas.get('ventas_mostradas', [])
-        for widget_tree in [getattr(self, 'tree_historial_ventas', None), getattr(self, 'tree_detalle_historial_venta', None)]:
-            if widget_tree:
-                for i in widget_tree.get_children(): widget_tree.delete(i)
+        # Estado de paginación: las páginas siguientes se piden al llegar al final del scroll
+        self._historial_ventas_filtro = (fecha_inicio, fecha_fin)
+        self._historial_ventas_cursor = None
+        self._historial_ventas_cargando = False
+        self.ventas_cargadas_actualmente = []
+        if hasattr(self, 'lista_historial_ventas'):
+            self.lista_historial_ventas.mensaje_vacio = "Cargando ventas..."
+            self.lista_historial_ventas.limpiar()
+        if hasattr(self, 'tree_detalle_historial_venta'):
+            for i in self.tree_detalle_historial_venta.get_children(): self.tree_detalle_historial_venta.delete(i)
         if hasattr(self, 'label_detalle_venta_id_frame'): self.label_detalle_venta_id_frame.config(text="Detalles de Venta ID: - (Seleccione una venta)")
-        if not self.ventas_cargadas_actualmente:
-            if hasattr(self, 'tree_historial_ventas'): self.tree_historial_ventas.insert("", tk.END, values=("No hay ventas en este periodo.", "", "", "", "", "", ""))
-            if hasattr(self, 'label_total_periodo_hist'): self.label_total_periodo_hist.config(text="Total del Periodo: RD$ 0.00")
-            return
-        if hasattr(self, 'tree_historial_ventas'):
-            for venta in self.ventas_cargadas_actualmente:
-                self.tree_historial_ventas.insert("", tk.END, iid=str(venta.get("id_venta")), values=(
-                    venta.get("id_venta", "N/A"), venta.get("fecha", "N/A"), venta.get("nombre_cliente", "N/A"),
-                    f"RD$ {venta.get('subtotal_bruto_sin_itbis', 0.0):.2f}", f"RD$ {venta.get('itbis_total_venta', 0.0):.2f}",
-                    f"RD$ {venta.get('descuento_aplicado', 0.0):.2f}", f"RD$ {venta.get('total_final', 0.0):.2f}" ))
-        if hasattr(self, 'label_total_periodo_hist'): self.label_total_periodo_hist.config(text=f"Total del Periodo: RD$ {resultado_ventas.get('total_periodo', 0.0):.2f}")
-        self._apply_treeview_striping(getattr(self, 'tree_historial_ventas', None))
+        if hasattr(self, 'label_total_periodo_hist'): self.label_total_periodo_hist.config(text="Total del Periodo: calculando...")
         self._apply_treeview_striping(getattr(self, 'tree_detalle_historial_venta', None))
 
-    def _mostrar_detalle_venta_historial(self, event=None):
+        def cargar():
+            totales = obtener_total_ventas_periodo(fecha_inicio, fecha_fin)
+            pagina = obtener_pagina_ventas_historial(fecha_inicio, fecha_fin, limite=HISTORIAL_VENTAS_PAGINA, cursor=None)
+            return totales, pagina
+
+        def mostrar(resultado):
+            totales, pagina = resultado
+            self._historial_ventas_cargando = False
+            if hasattr(self, 'label_total_periodo_hist'): self.label_total_periodo_hist.config(text=f"Total del Periodo: RD$ {totales.get('total_periodo', 0.0):.2f}")
+            if hasattr(self, 'lista_historial_ventas'): self.lista_historial_ventas.mensaje_vacio = "No hay ventas en este periodo."
+            self._agregar_pagina_historial_ventas(pagina)
+
+        # Misma clave que las páginas siguientes: cambiar el filtro descarta cargas en curso
+        self._historial_ventas_cargando = True
+        self._ejecutar_en_fondo('historial_ventas', cargar, al_terminar=mostrar, al_fallar=self._fallo_carga_historial_ventas)
+
+    def _fallo_carga_historial_ventas(self, exc):
+        self._historial_ventas_cargando = False
+        self._mostrar_error_en_fondo(exc)
+
+    def _cargar_pagina_historial_ventas(self):
+        """Pide en segundo plano la siguiente página de ventas según el cursor actual."""
+        fecha_inicio, fecha_fin = getattr(self, '_historial_ventas_filtro', (None, None))
+        self._historial_ventas_cargando = True
+
+        def mostrar(pagina):
+            self._historial_ventas_cargando = False
+            self._agregar_pagina_historial_ventas(pagina)
+
+        self._ejecutar_en_fondo(
+            'historial_ventas', obtener_pagina_ventas_historial, fecha_inicio, fecha_fin,
+            limite=HISTORIAL_VENTAS_PAGINA, cursor=self._historial_ventas_cursor,
+            al_terminar=mostrar, al_fallar=self._fallo_carga_historial_ventas
+        )
+
+    def _agregar_pagina_historial_ventas(self, pagina):
+        """Agrega al Treeview una página de ventas y guarda el cursor de la siguiente."""
+        nuevas = pagina.get('ventas_mostradas', [])
+        self._historial_ventas_cursor = pagina.get('siguiente_cursor')
+        self.ventas_cargadas_actualmente.extend(nuevas)
+        if hasattr(self, 'lista_historial_ventas'):
+            if nuevas:
+                self.lista_historial_ventas.agregar_filas(nuevas)
+            elif not self.ventas_cargadas_actualmente:
+                self.lista_historial_ventas.set_filas([])  # muestra el mensaje de periodo vacío
+
+    @staticmethod
+    def _formatear_fila_historial_venta(venta):
+        return (
+            venta.get("id_venta", "N/A"), venta.get("fecha", "N/A"), venta.get("nombre_cliente", "N/A"),
+            f"RD$ {venta.get('subtotal_bruto_sin_itbis', 0.0):.2f}", f"RD$ {venta.get('itbis_total_venta', 0.0):.2f}",
+            f"RD$ {venta.get('descuento_aplicado', 0.0):.2f}", f"RD$ {venta.get('total_final', 0.0):.2f}"
+        )
+
+    def _on_historial_ventas_fin(self):
+        """La lista virtual llegó a su última fila: pedir la siguiente página si existe."""
+        if getattr(self, '_historial_ventas_cursor', None) is None or self._historial_ventas_cargando:
+            return
+        self._cargar_pagina_historial_ventas()
+
+    def _mostrar_detalle_venta_historial(self, venta_seleccionada_completa=None):
         if not hasattr(self, 'tree_detalle_historial_venta'): return
         for i in self.tree_detalle_historial_venta.get_children(): self.tree_detalle_historial_venta.delete(i)
         if hasattr(self, 'label_detalle_venta_id_frame'): self.label_detalle_venta_id_frame.config(text="Detalles de Venta ID: -")
-        seleccion = self.tree_historial_ventas.selection()
-        if not seleccion: return 
-        item_id_tree = seleccion[0] 
-        venta_seleccionada_completa = next((v for v in self.ventas_cargadas_actualmente if str(v.get("id_venta")) == str(item_id_tree)), None)
-        if venta_seleccionada_completa:
-            if hasattr(self, 'label_detalle_venta_id_frame'): self.label_detalle_venta_id_frame.config(text=f"Detalles de Venta ID: {venta_seleccionada_completa['id_venta']}")
-            for prod in venta_seleccionada_completa.get("productos_detalle", []):
-                self.tree_detalle_historial_venta.insert("", tk.END, values=(
-                    prod.get("nombre", "N/A"), prod.get("cantidad", 0),
-                    f"RD$ {prod.get('precio_unitario', 0.0):.2f}", f"RD$ {prod.get('subtotal', 0.0):.2f}" ))
-            self._apply_treeview_striping(self.tree_detalle_historial_venta)
-        else:
-             if hasattr(self, 'label_detalle_venta_id_frame'): self.label_detalle_venta_id_frame.config(text="Detalle de Venta ID: - (Error al cargar)")
+        if not venta_seleccionada_completa: return 
+        if hasattr(self, 'label_detalle_venta_id_frame'): self.label_detalle_venta_id_frame.config(text=f"Detalles de Venta ID: {venta_seleccionada_completa['id_venta']}")
+        for prod in venta_seleccionada_completa.get("productos_detalle", []):
+            self.tree_detalle_historial_venta.insert("", tk.END, values=(
+                prod.get("nombre", "N/A"), prod.get("cantidad", 0),
+                f"RD$ {prod.get('precio_unitario', 0.0):.2f}", f"RD$ {prod.get('subtotal', 0.0):.2f}" ))
+        self._apply_treeview_striping(self.tree_detalle_historial_venta)
     
     def _cargar_clientes_para_historial_combo(self):
         clientes_data = obtener_lista_clientes_para_combobox()
@@ -2405,11 +2924,15 @@ class ColmadoApp:
         self.cliente_hist_info_telefono_var.set("")
         self.cliente_hist_info_direccion_var.set("")
         self.cliente_hist_total_gastado_var.set("Total Gastado: RD$0.00")
-        if hasattr(self, 'tree_historial_compras_cliente'):
-            for i in self.tree_historial_compras_cliente.get_children(): self.tree_historial_compras_cliente.delete(i)
+        if hasattr(self, 'lista_historial_compras_cliente'):
+            self.lista_historial_compras_cliente.limpiar()
         if hasattr(self, 'tree_detalle_venta_cliente'):
             for i in self.tree_detalle_venta_cliente.get_children(): self.tree_detalle_venta_cliente.delete(i)
         if hasattr(self, 'label_detalle_venta_cliente_frame'): self.label_detalle_venta_cliente_frame.config(text="Detalle de Venta ID: -")
+        self.historial_compras_cliente_actual = []
+        self._historial_cliente_id_actual = None
+        self._historial_cliente_total_compras = 0
+        self._actualizar_boton_mas_compras_cliente()
 
     def _ver_historial_cliente_seleccionado(self):
         self._limpiar_vista_historial_cliente()
@@ -2420,20 +2943,24 @@ class ColmadoApp:
         if cliente_id is None:
             messagebox.showerror("Error", "No se pudo encontrar el ID del cliente seleccionado.", parent=self.display_frame); return
         
-        # Asegurarse que obtener_historial_compras_cliente_gui está importada
-        resultado = obtener_historial_compras_cliente_gui(cliente_id) 
+        # Primera página del historial; el resto se pide con "Cargar más compras"
+        self.cliente_hist_info_nombre_var.set("Cargando historial...")
+        self._ejecutar_en_fondo(
+            'historial_cliente', obtener_historial_compras_cliente_gui, cliente_id,
+            limite=HISTORIAL_CLIENTE_PAGINA, desplazamiento=0,
+            al_terminar=lambda resultado: self._mostrar_historial_cliente(cliente_id, resultado)
+        )
 
+    def _mostrar_historial_cliente(self, cliente_id, resultado):
         if resultado and resultado.get("exito"):
             cliente_info = resultado.get("cliente_info", {})
             self.cliente_hist_info_nombre_var.set(f"Nombre: {cliente_info.get('nombre', 'N/A')}")
             self.cliente_hist_info_telefono_var.set(f"Telefono: {cliente_info.get('telefono', 'N/A')}")
             self.cliente_hist_info_direccion_var.set(f"Direccion: {cliente_info.get('direccion', 'N/A')}")
-            self.historial_compras_cliente_actual = resultado.get("historial_compras", [])
-            if hasattr(self, 'tree_historial_compras_cliente'):
-                for compra in self.historial_compras_cliente_actual:
-                    self.tree_historial_compras_cliente.insert("", tk.END, iid=str(compra.get("id_venta")), values=(
-                        compra.get("id_venta", "N/A"), compra.get("fecha", "N/A"), f"RD$ {compra.get('total_final', 0.0):.2f}" ))
-                self._apply_treeview_striping(self.tree_historial_compras_cliente)
+            self.historial_compras_cliente_actual = []
+            self._historial_cliente_id_actual = cliente_id
+            self._historial_cliente_total_compras = int(resultado.get("total_compras", 0))
+            self._agregar_compras_historial_cliente(resultado.get("historial_compras", []))
             self.cliente_hist_total_gastado_var.set(f"Total Gastado: RD$ {resultado.get('total_gastado', 0.0):.2f}")
         else:
             self.historial_compras_cliente_actual = []
@@ -2441,6 +2968,51 @@ class ColmadoApp:
             self.cliente_hist_info_nombre_var.set("Nombre: N/A"); self.cliente_hist_info_telefono_var.set("Telefono: N/A")
             self.cliente_hist_info_direccion_var.set("Direccion: N/A"); self.cliente_hist_total_gastado_var.set("Total Gastado: RD$0.00")
 
+    def _agregar_compras_historial_cliente(self, compras):
+        """Agrega una página de compras al Treeview y actualiza el botón de paginación."""
+        self.historial_compras_cliente_actual.extend(compras)
+        if hasattr(self, 'lista_historial_compras_cliente'):
+            self.lista_historial_compras_cliente.agregar_filas(compras)
+        self._actualizar_boton_mas_compras_cliente()
+
+    def _actualizar_boton_mas_compras_cliente(self):
+        btn = getattr(self, 'btn_mas_compras_cliente', None)
+        if not btn:
+            return
+        cargadas = len(self.historial_compras_cliente_actual)
+        total = getattr(self, '_historial_cliente_total_compras', 0)
+        try:
+            if cargadas < total:
+                btn.configure(text=f"Cargar más compras ({cargadas} de {total})")
+                btn.state(["!disabled"])
+            else:
+                btn.configure(text=f"Compras mostradas: {cargadas} de {total}")
+                btn.state(["disabled"])
+        except Exception:
+            pass
+
+    def _cargar_mas_compras_cliente(self):
+        cliente_id = getattr(self, '_historial_cliente_id_actual', None)
+        if cliente_id is None:
+            return
+        btn = getattr(self, 'btn_mas_compras_cliente', None)
+        if btn:
+            btn.state(["disabled"])
+        self._ejecutar_en_fondo(
+            'historial_cliente', obtener_historial_compras_cliente_gui, cliente_id,
+            limite=HISTORIAL_CLIENTE_PAGINA, desplazamiento=len(self.historial_compras_cliente_actual),
+            al_terminar=self._agregar_pagina_historial_cliente,
+            al_fallar=lambda exc: (self._actualizar_boton_mas_compras_cliente(), self._mostrar_error_en_fondo(exc))
+        )
+
+    def _agregar_pagina_historial_cliente(self, resultado):
+        if resultado and resultado.get("exito"):
+            self._historial_cliente_total_compras = int(resultado.get("total_compras", 0))
+            self._agregar_compras_historial_cliente(resultado.get("historial_compras", []))
+        else:
+            self._actualizar_boton_mas_compras_cliente()
+            messagebox.showerror("Error", resultado.get("mensaje", "No se pudo obtener el historial del cliente."), parent=self.display_frame)
+
     def historial_cliente_action(self):
         if not self._guard('historial_cliente'):
             return
@@ -2462,15 +3034,26 @@ class ColmadoApp:
         hist_compras_frame = ttk.LabelFrame(self.display_frame, text="Historial de Compras", padding="10")
         hist_compras_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         columnas_compras_cliente = ("id_venta_c", "fecha_c", "total_c")
-        self.tree_historial_compras_cliente = ttk.Treeview(hist_compras_frame, columns=columnas_compras_cliente, show="headings", height=7)
+        self.lista_historial_compras_cliente = ListaVirtual(
+            hist_compras_frame, columnas_compras_cliente,
+            lambda compra: (compra.get("id_venta", "N/A"), compra.get("fecha", "N/A"), f"RD$ {compra.get('total_final', 0.0):.2f}"),
+            colores=self.colors, al_seleccionar=self._mostrar_detalle_venta_seleccionada_cliente
+        )
+        self.tree_historial_compras_cliente = self.lista_historial_compras_cliente.tree
         self.tree_historial_compras_cliente.heading("id_venta_c", text="ID Venta"); self.tree_historial_compras_cliente.column("id_venta_c", width=80, anchor=tk.CENTER, stretch=tk.NO)
         self.tree_historial_compras_cliente.heading("fecha_c", text="Fecha"); self.tree_historial_compras_cliente.column("fecha_c", width=150, stretch=tk.NO)
         self.tree_historial_compras_cliente.heading("total_c", text="Total Venta (RD$)"); self.tree_historial_compras_cliente.column("total_c", width=120, anchor=tk.E, stretch=tk.NO)
-        scrollbar_compras_cliente = ttk.Scrollbar(hist_compras_frame, orient=tk.VERTICAL, command=self.tree_historial_compras_cliente.yview)
-        self.tree_historial_compras_cliente.configure(yscrollcommand=scrollbar_compras_cliente.set)
-        scrollbar_compras_cliente.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree_historial_compras_cliente.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.tree_historial_compras_cliente.bind("<<TreeviewSelect>>", self._mostrar_detalle_venta_seleccionada_cliente)
+        self.lista_historial_compras_cliente.pack(fill=tk.BOTH, expand=True)
+        self.lista_historial_compras_cliente.habilitar_orden(
+            {'id_venta_c': 'ID Venta', 'fecha_c': 'Fecha', 'total_c': 'Total Venta (RD$)'},
+            {
+                'id_venta_c': lambda c: c.get('id_venta') or 0,
+                'fecha_c': lambda c: c.get('fecha') or '',
+                'total_c': lambda c: c.get('total_final') or 0.0,
+            }
+        )
+        self.btn_mas_compras_cliente = ttk.Button(self.display_frame, text="Cargar más compras", command=self._cargar_mas_compras_cliente, style="Secondary.TButton")
+        self.btn_mas_compras_cliente.pack(anchor="e", padx=10)
         self.label_detalle_venta_cliente_frame = ttk.LabelFrame(self.display_frame, text="Detalle de Venta ID: -", padding="10")
         self.label_detalle_venta_cliente_frame.pack(fill=tk.X, pady=10)
         columnas_detalle_c = ("prod_vc", "cant_vc", "pu_vc", "sub_vc")
@@ -2584,31 +3167,20 @@ class ColmadoApp:
                 style="Muted.TLabel"
             ).pack(fill=tk.X, pady=(10, 0))
 
-    def _mostrar_detalle_venta_seleccionada_cliente(self, event=None):
+    def _mostrar_detalle_venta_seleccionada_cliente(self, venta=None):
         """Muestra detalle de la venta seleccionada en el historial del cliente."""
-        if not hasattr(self, 'tree_historial_compras_cliente') or not hasattr(self, 'tree_detalle_venta_cliente'):
+        if not hasattr(self, 'tree_detalle_venta_cliente'):
             return
-        seleccion = self.tree_historial_compras_cliente.selection()
-        if not seleccion:
+        if not venta:
             return
         try:
-            item_id = seleccion[0]
-            valores = self.tree_historial_compras_cliente.item(item_id).get('values', [])
-            venta_id_sel = valores[0] if valores else None
+            venta_id_sel = venta.get('id_venta')
             # Encabezado
             if hasattr(self, 'label_detalle_venta_cliente_frame') and venta_id_sel is not None:
                 self.label_detalle_venta_cliente_frame.config(text=f"Detalle de Venta ID: {venta_id_sel}")
             # Limpiar detalle
             for i in self.tree_detalle_venta_cliente.get_children():
                 self.tree_detalle_venta_cliente.delete(i)
-            # Buscar venta en cache actual
-            venta = None
-            for registro in (self.historial_compras_cliente_actual or []):
-                if str(registro.get('id_venta')) == str(venta_id_sel):
-                    venta = registro
-                    break
-            if not venta:
-                return
             for prod in venta.get('productos_detalle', []):
                 self.tree_detalle_venta_cliente.insert(
                     "", tk.END,
@@ -2626,7 +3198,9 @@ class ColmadoApp:
     def _mostrar_factura_en_ventana(self, texto_factura, venta_id, nombre_archivo_factura_guardada=None):
         factura_window = tk.Toplevel(self.root)
         self._style_toplevel(factura_window)
-        factura_window.title(f"Factura #: {venta_id:05d}")
+        # Las ventas sin conexión llevan un número provisional (texto) en lugar del id
+        etiqueta_venta = venta_id if isinstance(venta_id, str) else f"{venta_id:05d}"
+        factura_window.title(f"Factura #: {etiqueta_venta}")
         factura_window.geometry("480x650") 
         factura_window.transient(self.root)
         factura_window.grab_set(); factura_window.focus_set()
@@ -2645,7 +3219,7 @@ class ColmadoApp:
             saved_label.pack(side=tk.LEFT, padx=10, expand=True, fill=tk.X)
         def guardar_copia_factura_dialogo():
             initial_dir = os.path.join(os.getcwd(), "Facturas"); os.makedirs(initial_dir, exist_ok=True)
-            file_path = filedialog.asksaveasfilename(master=factura_window, initialdir=initial_dir, initialfile=f"copia_factura_{venta_id:05d}.txt", defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+            file_path = filedialog.asksaveasfilename(master=factura_window, initialdir=initial_dir, initialfile=f"copia_factura_{etiqueta_venta}.txt", defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
             if file_path:
                 try:
                     with open(file_path, "w", encoding="utf-8") as f: f.write(texto_factura)
@@ -2654,83 +3228,61 @@ class ColmadoApp:
         ttk.Button(button_frame, text="Guardar Copia Como...", command=guardar_copia_factura_dialogo).pack(side=tk.LEFT, padx=5)
         # Opción de imprimir directamente desde la vista de factura
         def imprimir_factura():
+            # Se encola y retorna al instante; el estado se ve en la tarjeta de sesión
             try:
-                self._print_text_to_system(texto_factura)
+                self.cola_impresion.imprimir(texto_factura)
             except Exception as e:
-                messagebox.showerror("Impresión", f"No fue posible imprimir la factura.\n{e}", parent=factura_window)
+                messagebox.showerror("Impresión", f"No fue posible encolar la factura.\n{e}", parent=factura_window)
         ttk.Button(button_frame, text="Imprimir", command=imprimir_factura).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cerrar Vista", command=factura_window.destroy).pack(side=tk.RIGHT, padx=10)
 
     def _imprimir_factura_desde_historial(self):
         """Genera y muestra la factura de la venta seleccionada en el historial."""
-        if not hasattr(self, 'tree_historial_ventas'):
+        if not hasattr(self, 'lista_historial_ventas'):
             return
-        sel = self.tree_historial_ventas.selection()
-        if not sel:
+        venta_sel = self.lista_historial_ventas.seleccion()
+        if not venta_sel:
             messagebox.showwarning("Sin selección", "Seleccione una venta para imprimir su factura.", parent=self.display_frame)
             return
-        valores = self.tree_historial_ventas.item(sel[0]).get('values', [])
-        if not valores:
-            return
         try:
-            venta_id = int(valores[0])
+            venta_id = int(venta_sel['id_venta'])
         except Exception:
             messagebox.showerror("Error", "No se pudo determinar el ID de la venta seleccionada.", parent=self.display_frame)
             return
 
-        # Cargar venta completa desde la base de datos
-        venta_obj = obtener_venta_para_factura(venta_id)
-        # Determinar nombre del cliente
-        nombre_cliente = "Consumidor Final"
+        # Reimpresión desde el archivo de facturas, sin consultar la base de datos
         try:
-            cid = venta_obj.get('cliente_id')
-            if cid:
-                # Consultar nombre del cliente vía Repo (consulta directa)
-                from Modulos.DBUtil import fetch_one
-                c = fetch_one("SELECT nombre FROM clientes WHERE id=%s", (cid,))
-                if c and c.get('nombre'):
-                    nombre_cliente = c['nombre']
-        except Exception:
-            pass
-
-        texto_factura = generar_texto_factura(venta_obj, nombre_cliente, datos_empresa=self._get_empresa_info())
-        self._mostrar_factura_en_ventana(texto_factura, venta_id)
-
-    def _print_text_to_system(self, texto: str):
-        """Intenta imprimir texto usando comandos del sistema.
-        - En Linux/Mac usa lpr/lp si están disponibles.
-        - En Windows intenta os.startfile(..., 'print').
-        """
-        # Crear un archivo temporal
-        tmp_dir = tempfile.mkdtemp(prefix='pycolmado_')
-        tmp_path = os.path.join(tmp_dir, 'factura.txt')
-        with open(tmp_path, 'w', encoding='utf-8') as f:
-            f.write(texto)
+            texto_archivado = self.archivo_facturas.leer(venta_id)
+        except Exception as e:
+            print(f"Advertencia: no se pudo leer la factura {venta_id} del archivo: {e}")
+            texto_archivado = None
+        if texto_archivado is not None:
+            self._mostrar_factura_en_ventana(texto_archivado, venta_id, self.archivo_facturas.carpeta)
+            return
 
-        system = platform.system().lower()
-        try:
-            if system == 'windows':
-                try:
-                    os.startfile(tmp_path, 'print')  # type: ignore[attr-defined]
-                except Exception as e:
-                    raise RuntimeError(f"No se pudo enviar a impresión en Windows: {e}")
-            else:
-                # Intentar lpr, si no lp
-                cmd = None
-                if shutil.which('lpr'):
-                    cmd = ['lpr', tmp_path]
-                elif shutil.which('lp'):
-                    cmd = ['lp', tmp_path]
-                if not cmd:
-                    raise RuntimeError("No se encontró comando de impresión (lpr/lp)")
-                subprocess.run(cmd, check=True)
-        finally:
-            # Limpiar el temporal
+        def cargar():
+            # Cargar venta completa desde la base de datos
+            venta_obj = obtener_venta_para_factura(venta_id)
+            # Determinar nombre del cliente
+            nombre_cliente = "Consumidor Final"
             try:
-                os.remove(tmp_path)
-                os.rmdir(tmp_dir)
+                cid = venta_obj.get('cliente_id')
+                if cid:
+                    # Consultar nombre del cliente vía Repo (consulta directa)
+                    from Modulos.DBUtil import fetch_one
+                    c = fetch_one("SELECT nombre FROM clientes WHERE id=%s", (cid,))
+                    if c and c.get('nombre'):
+                        nombre_cliente = c['nombre']
             except Exception:
                 pass
+            return venta_obj, nombre_cliente
+
+        def mostrar(resultado):
+            venta_obj, nombre_cliente = resultado
+            texto_factura = self._plantilla_factura().renderizar(venta_obj, nombre_cliente)
+            self._mostrar_factura_en_ventana(texto_factura, venta_id)
+
+        self._ejecutar_en_fondo('factura_historial', cargar, al_terminar=mostrar)
 
     # Nueva función para historial de proveedores
     def historial_proveedor_action(self):
@@ -54,6 +54,7 @@ CREATE TABLE IF NOT EXISTS `configuracion_app` (
 CREATE TABLE IF NOT EXISTS `productos` (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `nombre` varchar(160) NOT NULL,
+  `codigo_barras` varchar(64) DEFAULT NULL,
   `descripcion` varchar(512) DEFAULT NULL,
   `precio_compra` decimal(12,2) NOT NULL DEFAULT 0.00,
   `precio_venta_sin_itbis` decimal(12,2) NOT NULL DEFAULT 0.00,
@@ -64,8 +65,12 @@ CREATE TABLE IF NOT EXISTS `productos` (
   `stock` decimal(12,3) NOT NULL DEFAULT 0.000,
   `categoria` varchar(128) DEFAULT NULL,
   `proveedor_id` int(11) DEFAULT NULL,
+  `updated_at` timestamp(6) NOT NULL DEFAULT current_timestamp(6) ON UPDATE current_timestamp(6),
+  `version` int(11) NOT NULL DEFAULT 0,
   PRIMARY KEY (`id`),
+  UNIQUE KEY `ux_productos_codigo_barras` (`codigo_barras`),
   KEY `ix_productos_nombre` (`nombre`),
+  KEY `ix_productos_updated_at` (`updated_at`),
   KEY `ix_productos_proveedor` (`proveedor_id`),
   KEY `ix_productos_categoria` (`categoria`),
   CONSTRAINT `fk_productos_proveedor` FOREIGN KEY (`proveedor_id`) REFERENCES `proveedores` (`id`) ON DELETE SET NULL
@@ -110,9 +115,11 @@ CREATE TABLE IF NOT EXISTS `ventas` (
   `total_neto` decimal(12,2) NOT NULL DEFAULT 0.00,
   `dinero_recibido` decimal(12,2) DEFAULT NULL,
   `cambio_devuelto` decimal(12,2) DEFAULT NULL,
+  `clave_idempotencia` varchar(64) DEFAULT NULL,
   PRIMARY KEY (`id`),
+  UNIQUE KEY `ux_ventas_clave_idempotencia` (`clave_idempotencia`),
   KEY `ix_ventas_fecha` (`fecha`),
-  KEY `ix_ventas_cliente` (`cliente_id`),
+  KEY `ix_ventas_cliente` (`cliente_id`,`fecha`),
   CONSTRAINT `fk_ventas_cliente` FOREIGN KEY (`cliente_id`) REFERENCES `clientes` (`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB AUTO_INCREMENT=8 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
 
@@ -137,6 +144,36 @@ CREATE TABLE IF NOT EXISTS `ventas_detalle` (
 
 -- La exportación de datos fue deseleccionada.
 
+-- Volcando estructura para tabla sistemapy.movimientos_stock
+CREATE TABLE IF NOT EXISTS `movimientos_stock` (
+  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `producto_id` int(11) NOT NULL,
+  `fecha` datetime(6) NOT NULL DEFAULT current_timestamp(6),
+  `tipo` enum('venta','ajuste','compra','devolucion') NOT NULL,
+  `cantidad` decimal(12,3) NOT NULL,
+  `stock_resultante` decimal(12,3) NOT NULL,
+  `venta_id` int(11) DEFAULT NULL,
+  `nota` varchar(255) DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `ix_mov_producto_fecha` (`producto_id`,`fecha`,`id`,`stock_resultante`),
+  KEY `ix_mov_venta` (`venta_id`),
+  CONSTRAINT `fk_mov_producto` FOREIGN KEY (`producto_id`) REFERENCES `productos` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `fk_mov_venta` FOREIGN KEY (`venta_id`) REFERENCES `ventas` (`id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
+-- La exportación de datos fue deseleccionada.
+
+-- Volcando estructura para tabla sistemapy.ventas_resumen_diario
+CREATE TABLE IF NOT EXISTS `ventas_resumen_diario` (
+  `dia` date NOT NULL,
+  `cantidad_ventas` int(11) NOT NULL DEFAULT 0,
+  `subtotal_bruto_sin_itbis` decimal(14,2) NOT NULL DEFAULT 0.00,
+  `itbis_total` decimal(14,2) NOT NULL DEFAULT 0.00,
+  `descuento_total` decimal(14,2) NOT NULL DEFAULT 0.00,
+  `total_neto` decimal(14,2) NOT NULL DEFAULT 0.00,
+  PRIMARY KEY (`dia`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_uca1400_ai_ci;
+
 /*!40103 SET TIME_ZONE=IFNULL(@OLD_TIME_ZONE, 'system') */;
 /*!40101 SET SQL_MODE=IFNULL(@OLD_SQL_MODE, '') */;
 /*!40014 SET FOREIGN_KEY_CHECKS=IFNULL(@OLD_FOREIGN_KEY_CHECKS, 1) */;